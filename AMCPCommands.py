@@ -0,0 +1,430 @@
+import collections
+import json
+import re
+import TemplateData
+
+# json's own string escaper - written in C where the _json extension is available. It gives exactly what json.dumps
+# does for a string, without the overhead of setting up a JSONEncoder on every call.
+from json.encoder import encode_basestring_ascii as _quote_string
+
+# The AMCP commands that the amcp module sends, as (name, template, description). Each {parameter} is filled in by the
+# encoder that is compiled for the command - see Command. A parameter can name an encoder after a colon (see
+# ENCODERS), e.g. {clip:string}. Anything in [square brackets] is optional: it is only sent if its parameters are
+# given, or, if it has no parameters, if the flag named after it (e.g. [ LOOP] -> loop) is True. Optional parts can be
+# nested.
+#
+# The amcp module generates a function for every command with a description, named after the command (e.g.
+# amcp.mixer_fill). The CG commands have hand-written functions, which keep the CGDataCache up to date.
+SPEC = (
+    ("CG ADD", "CG {channel}-{layer} ADD {cg_layer} {template} {play_on_load} {data}", None),
+    ("CG PLAY", "CG {channel}-{layer} PLAY {cg_layer}", None),
+    ("CG STOP", "CG {channel}-{layer} STOP {cg_layer}", None),
+    ("CG NEXT", "CG {channel}-{layer} NEXT {cg_layer}", None),
+    ("CG REMOVE", "CG {channel}-{layer} REMOVE {cg_layer}", None),
+    ("CG CLEAR", "CG {channel}-{layer} CLEAR", None),
+    ("CG UPDATE", "CG {channel}-{layer} UPDATE {cg_layer} {data}", None),
+    ("CG INVOKE", "CG {channel}-{layer} INVOKE {cg_layer} {method}", None),
+    ("CG INFO", "CG {channel}-{layer} INFO {cg_layer}", None),
+
+    # Playback
+    ("LOADBG", "LOADBG {channel}-{layer} {clip:string}[ LOOP][ {transition} {duration}[ {tween}][ {direction}]]"
+               "[ SEEK {seek}][ LENGTH {length}][ FILTER {filter:string}][ AUTO]",
+     "Loads a clip into the background of a layer, ready to be played with :py:func:`play`."),
+    ("LOAD", "LOAD {channel}-{layer} {clip:string}[ LOOP][ {transition} {duration}[ {tween}][ {direction}]]"
+             "[ SEEK {seek}][ LENGTH {length}][ FILTER {filter:string}]",
+     "Loads a clip into the foreground of a layer, showing its first frame without playing it."),
+    ("PLAY", "PLAY {channel}-{layer}[ {clip:string}][ LOOP][ {transition} {duration}[ {tween}][ {direction}]]"
+             "[ SEEK {seek}][ LENGTH {length}][ FILTER {filter:string}]",
+     "Plays a clip on a layer. If *clip* isn't given, whatever was loaded with :py:func:`loadbg` is played."),
+    ("PAUSE", "PAUSE {channel}-{layer}",
+     "Pauses the clip playing on a layer."),
+    ("RESUME", "RESUME {channel}-{layer}",
+     "Resumes the clip paused on a layer."),
+    ("STOP", "STOP {channel}-{layer}",
+     "Stops and removes the clip playing on a layer."),
+    ("CLEAR", "CLEAR {channel}[-{layer}]",
+     "Removes everything from a layer, or from every layer of a channel if *layer* isn't given."),
+    ("CALL", "CALL {channel}-{layer} {function}[ {value}]",
+     "Calls a function of the producer on a layer, e.g. ``LOOP`` or ``SEEK``."),
+    ("SWAP", "SWAP {channel}[-{layer}] {other_channel}[-{other_layer}][ TRANSFORMS]",
+     "Swaps two layers, or two whole channels if no layers are given."),
+    ("ADD", "ADD {channel}[-{consumer_index}] {consumer}[ {parameters}]",
+     "Adds a consumer (e.g. ``SCREEN`` or ``FILE``) to a channel."),
+    ("REMOVE", "REMOVE {channel}[-{consumer_index}][ {consumer}[ {parameters}]]",
+     "Removes a consumer from a channel."),
+    ("SET MODE", "SET {channel} MODE {mode}",
+     "Changes the video mode of a channel."),
+
+    # Mixer - layer transforms. These can be deferred, and applied together on the next frame with MIXER COMMIT (see
+    # MixerBatch).
+    ("MIXER KEYER", "MIXER {channel}-{layer} KEYER {keyer:bool}[ DEFER]",
+     "Makes a layer the key (alpha) of the layer above it."),
+    ("MIXER BLEND", "MIXER {channel}-{layer} BLEND {blend}[ DEFER]",
+     "Sets the blend mode of a layer, e.g. ``normal``, ``add`` or ``multiply``."),
+    ("MIXER OPACITY", "MIXER {channel}-{layer} OPACITY {opacity}[ {duration}[ {tween}]][ DEFER]",
+     "Sets the opacity of a layer."),
+    ("MIXER BRIGHTNESS", "MIXER {channel}-{layer} BRIGHTNESS {brightness}[ {duration}[ {tween}]][ DEFER]",
+     "Sets the brightness of a layer."),
+    ("MIXER SATURATION", "MIXER {channel}-{layer} SATURATION {saturation}[ {duration}[ {tween}]][ DEFER]",
+     "Sets the saturation of a layer."),
+    ("MIXER CONTRAST", "MIXER {channel}-{layer} CONTRAST {contrast}[ {duration}[ {tween}]][ DEFER]",
+     "Sets the contrast of a layer."),
+    ("MIXER LEVELS", "MIXER {channel}-{layer} LEVELS {min_input} {max_input} {gamma} {min_output} {max_output}"
+                     "[ {duration}[ {tween}]][ DEFER]",
+     "Adjusts the input and output levels of a layer."),
+    ("MIXER FILL", "MIXER {channel}-{layer} FILL {x} {y} {x_scale} {y_scale}[ {duration}[ {tween}]][ DEFER]",
+     "Scales and moves a layer."),
+    ("MIXER CLIP", "MIXER {channel}-{layer} CLIP {x} {y} {width} {height}[ {duration}[ {tween}]][ DEFER]",
+     "Masks a layer to a rectangle."),
+    ("MIXER ANCHOR", "MIXER {channel}-{layer} ANCHOR {x} {y}[ {duration}[ {tween}]][ DEFER]",
+     "Moves the point of a layer that it is scaled and rotated around."),
+    ("MIXER CROP", "MIXER {channel}-{layer} CROP {left} {top} {right} {bottom}[ {duration}[ {tween}]][ DEFER]",
+     "Crops a layer."),
+    ("MIXER ROTATION", "MIXER {channel}-{layer} ROTATION {angle}[ {duration}[ {tween}]][ DEFER]",
+     "Rotates a layer."),
+    ("MIXER VOLUME", "MIXER {channel}-{layer} VOLUME {volume}[ {duration}[ {tween}]][ DEFER]",
+     "Sets the audio volume of a layer."),
+    ("MIXER MIPMAP", "MIXER {channel}-{layer} MIPMAP {mipmap:bool}[ DEFER]",
+     "Turns mipmapping on or off for a layer, which improves the quality of layers that are scaled down."),
+    ("MIXER MASTERVOLUME", "MIXER {channel} MASTERVOLUME {volume}",
+     "Sets the audio volume of a whole channel."),
+    ("MIXER CLEAR", "MIXER {channel}[-{layer}] CLEAR",
+     "Resets every mixer transform of a layer, or of every layer of a channel if *layer* isn't given."),
+    ("MIXER COMMIT", "MIXER {channel} COMMIT",
+     "Applies every deferred mixer transform on a channel at once."),
+)
+
+# What each parameter is, for the docstrings of the functions made from SPEC
+PARAMETERS = {
+    "channel": "The number of the channel.",
+    "layer": "The number of the layer on *channel*.",
+    "clip": "The name of the media file (relative to the media folder), or e.g. a colour or a route.",
+    "loop": "If True, loop the clip.",
+    "transition": "The transition to use, e.g. ``MIX``, ``PUSH``, ``WIPE`` or ``SLIDE``. Requires *duration*.",
+    "duration": "The number of frames that the transition or transform takes.",
+    "tween": "The easing curve of the transition or transform, e.g. ``linear`` or ``easeinsine``.",
+    "direction": "The direction of the transition - ``LEFT`` or ``RIGHT``.",
+    "seek": "The frame to start playing from.",
+    "length": "The number of frames to play.",
+    "filter": "An FFmpeg filter to apply to the clip.",
+    "auto": "If True, play the clip automatically when the clip in the foreground ends.",
+    "function": "The name of the function to call.",
+    "value": "The value to pass to the function.",
+    "other_channel": "The number of the channel to swap with.",
+    "other_layer": "The number of the layer on *other_channel* to swap with.",
+    "transforms": "If True, swap the layers' mixer transforms too.",
+    "consumer_index": "The index of the consumer on the channel.",
+    "consumer": "The type of consumer, e.g. ``SCREEN``, ``FILE`` or ``DECKLINK``.",
+    "parameters": "Any parameters for the consumer, e.g. a filename.",
+    "mode": "The video mode, e.g. ``PAL`` or ``1080i5000``.",
+    "keyer": "If True, use the layer as the key of the layer above it.",
+    "blend": "The blend mode.",
+    "opacity": "The opacity, from 0 to 1.",
+    "brightness": "The brightness, where 1 is unchanged.",
+    "saturation": "The saturation, where 1 is unchanged.",
+    "contrast": "The contrast, where 1 is unchanged.",
+    "min_input": "The input black level, from 0 to 1.",
+    "max_input": "The input white level, from 0 to 1.",
+    "gamma": "The gamma, where 1 is unchanged.",
+    "min_output": "The output black level, from 0 to 1.",
+    "max_output": "The output white level, from 0 to 1.",
+    "x": "The horizontal position, as a fraction of the width of the channel.",
+    "y": "The vertical position, as a fraction of the height of the channel.",
+    "x_scale": "The horizontal scale, where 1 is the width of the channel.",
+    "y_scale": "The vertical scale, where 1 is the height of the channel.",
+    "width": "The width, as a fraction of the width of the channel.",
+    "height": "The height, as a fraction of the height of the channel.",
+    "left": "How much to crop from the left, as a fraction of the width of the channel.",
+    "top": "How much to crop from the top, as a fraction of the height of the channel.",
+    "right": "Where to crop the right to, as a fraction of the width of the channel.",
+    "bottom": "Where to crop the bottom to, as a fraction of the height of the channel.",
+    "angle": "The angle in degrees, clockwise.",
+    "volume": "The volume, where 1 is unchanged.",
+    "mipmap": "If True, turn mipmapping on.",
+    "defer": "If True, don't apply the transform until the channel is sent MIXER COMMIT.",
+}
+
+_token = re.compile(r"\{([^{}]*)\}|\[|\]|[^{}\[\]]+")
+_identifier = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def encode_data(data):
+    """
+    Encodes a value so that it can be sent as a single AMCP parameter. Strings are double-quoted, with quotes,
+    backslashes and control characters escaped, and anything else is sent as JSON.
+
+    :param data: The value to encode.
+    :rtype: str
+    :return: The encoded value, or an empty string if *data* is None.
+    """
+    if data is None:
+        return ""
+    if isinstance(data, basestring):
+        return _quote_string(data)
+    return json.dumps(data)
+
+
+def encode_string(value):
+    """
+    Double-quotes a string so that it can be sent as a single AMCP parameter, escaping any quotes, backslashes and line
+    breaks in it. Unlike :py:func:`encode_data`, anything else is left alone, so file names with accents in them
+    reach the server as they are.
+
+    :param value: The string to encode. Anything that isn't a string will be converted to one.
+    :rtype: str
+    """
+    if isinstance(value, unicode):
+        value = value.encode("utf-8")
+    elif not isinstance(value, str):
+        value = str(value)
+    return '"' + TemplateData.escape_amcp(value) + '"'
+
+
+def encode_bool(value):
+    """
+    :param bool value: The value to encode.
+    :rtype: str
+    :return: "1" if *value* is True, otherwise "0".
+    """
+    return "1" if value else "0"
+
+
+# The encoders that a parameter can name in SPEC, e.g. {clip:string}
+ENCODERS = {"data": encode_data,
+            "string": encode_string,
+            "bool": encode_bool}
+
+
+class _Field(object):
+
+    __slots__ = ("name", "encoder")
+
+    def __init__(self, name, encoder):
+        self.name = name
+        self.encoder = encoder
+
+
+class _Optional(object):
+    # An optional part of a command. *flag* is the name of the bool parameter that turns it on, if it has no
+    # parameters of its own.
+
+    __slots__ = ("items", "fields", "flag")
+
+    def __init__(self, items):
+        self.items = items
+        self.fields = [item.name for item in items if isinstance(item, _Field)]
+        self.flag = None
+        if not self.fields:
+            words = "".join(item for item in items if isinstance(item, basestring)).split()
+            if words:
+                self.flag = "_".join(words).lower()
+
+
+class Command(object):
+    """
+    An AMCP command, compiled from a template such as ``"CG {channel}-{layer} PLAY {cg_layer}"`` (see
+    :py:data:`SPEC`).
+
+    The template is compiled once, when the Command is created, into :py:attr:`encode` - a function that takes the
+    template's parameters and returns the finished command, ``\\r\\n`` included, ready to be passed to
+    :py:meth:`~caspartalk.CasparServer.send_amcp_command`. The parameters that are always sent come first, in the order
+    that they appear, followed by the optional ones, which default to None (or False, for flags)::
+
+        >>> get_command("CG PLAY").encode(1, 10, 0)
+        'CG 1-10 PLAY 0\\r\\n'
+        >>> get_command("MIXER OPACITY").encode(1, 10, 0.5, duration=25, defer=True)
+        'MIXER 1-10 OPACITY 0.5 25 DEFER\\r\\n'
+
+    A command without any optional parts is encoded with a single %-formatting operation.
+
+    :param str name: The name of the command, e.g. "CG PLAY".
+    :param str template: The command, with each parameter given as ``{name}`` or ``{name:encoder}``, and optional \
+    parts in square brackets.
+    :param str description: What the command does.
+    """
+
+    def __init__(self, name, template, description=None):
+        self.name = name
+        self.template = template
+        self.description = description
+        self.function_name = name.lower().replace(" ", "_")
+
+        self._encoders = {}
+        self._items = self._parse(template)
+
+        # The parameters that are always sent, followed by the optional ones (with their defaults)
+        self.required = []
+        self.optional = []
+        for item in self._items:
+            self._collect(item, False)
+        self.fields = tuple(self.required + [name for name, default in self.optional])
+
+        self.encode = self._compile()
+
+    def _error(self, message):
+        return ValueError("{message} in AMCP command {name}: {template}".format(message=message, name=self.name,
+                                                                               template=self.template))
+
+    def _parse(self, template):
+        # Returns a list of literal strings, _Fields and _Optionals
+        stack = [[]]
+        for match in _token.finditer(template):
+            token = match.group(0)
+            if token == "[":
+                stack.append([])
+            elif token == "]":
+                if len(stack) == 1:
+                    raise self._error("Unmatched ]")
+                items = stack.pop()
+                stack[-1].append(_Optional(items))
+            elif match.group(1) is not None:
+                name, _, encoder = match.group(1).partition(":")
+                if not _identifier.match(name):
+                    raise self._error("Bad parameter {{{name}}}".format(name=name))
+                if encoder and encoder not in ENCODERS:
+                    raise self._error("Unknown encoder {encoder}".format(encoder=encoder))
+                if encoder:
+                    self._encoders[name] = ENCODERS[encoder]
+                stack[-1].append(_Field(name, encoder))
+            else:
+                stack[-1].append(token)
+        if len(stack) != 1:
+            raise self._error("Unmatched [")
+        return stack[0]
+
+    def _collect(self, item, optional):
+        if isinstance(item, _Field):
+            names = self.required + [name for name, default in self.optional]
+            if item.name in names:
+                raise self._error("Repeated parameter {{{name}}}".format(name=item.name))
+            if optional:
+                self.optional.append((item.name, None))
+            else:
+                self.required.append(item.name)
+        elif isinstance(item, _Optional):
+            if item.flag is not None:
+                if not _identifier.match(item.flag):
+                    raise self._error("Bad flag [{flag}]".format(flag=item.flag))
+                self.optional.append((item.flag, False))
+            for child in item.items:
+                self._collect(child, True)
+
+    def _value(self, field):
+        # The source code for a parameter's value
+        if field.encoder:
+            return "_{encoder}({name})".format(encoder=field.encoder, name=field.name)
+        return field.name
+
+    def _chunks(self, items):
+        # Splits items into runs of (format, values) and _Optionals
+        fmt = []
+        values = []
+        for item in items:
+            if isinstance(item, _Optional):
+                if fmt:
+                    yield "".join(fmt), values
+                    fmt, values = [], []
+                yield item
+            elif isinstance(item, _Field):
+                fmt.append("%s")
+                values.append(self._value(item))
+            else:
+                fmt.append(item.replace("%", "%%"))
+        if fmt:
+            yield "".join(fmt), values
+
+    def _emit(self, items, lines, indent):
+        for chunk in self._chunks(items):
+            if isinstance(chunk, _Optional):
+                if chunk.flag is not None:
+                    lines.append("{indent}if {flag}:".format(indent=indent, flag=chunk.flag))
+                else:
+                    given = " or ".join("{name} is not None".format(name=name) for name in chunk.fields)
+                    lines.append("{indent}if {given}:".format(indent=indent, given=given))
+                    if len(chunk.fields) > 1:
+                        missing = " or ".join("{name} is None".format(name=name) for name in chunk.fields)
+                        lines.append("{indent}    if {missing}:".format(indent=indent, missing=missing))
+                        lines.append("{indent}        raise ValueError({message!r})".format(
+                            indent=indent, message="{name}: {fields} must be given together".format(
+                                name=self.name, fields=", ".join(chunk.fields))))
+                self._emit(chunk.items, lines, indent + "    ")
+            else:
+                fmt, values = chunk
+                if values:
+                    lines.append("{indent}append({fmt!r} % ({values},))".format(indent=indent, fmt=fmt,
+                                                                                 values=", ".join(values)))
+                else:
+                    lines.append("{indent}append({fmt!r})".format(indent=indent, fmt=fmt.replace("%%", "%")))
+
+    def _compile(self):
+        namespace = dict(("_" + name, encoder) for name, encoder in ENCODERS.iteritems())
+        signature = ", ".join(self.required + ["{name}={default!r}".format(name=name, default=default)
+                                               for name, default in self.optional])
+
+        if not self.optional:
+            # Everything is always sent, so the whole command is one format string
+            chunks = list(self._chunks(self._items))
+            fmt, values = chunks[0] if chunks else ("", [])
+            if not values:
+                command = fmt.replace("%%", "%") + "\r\n"
+                return lambda: command
+            namespace["_format"] = fmt + "\r\n"
+            lines = ["def encode({signature}):".format(signature=signature),
+                     "    return _format % ({values},)".format(values=", ".join(values))]
+        else:
+            lines = ["def encode({signature}):".format(signature=signature),
+                     "    parts = []",
+                     "    append = parts.append"]
+            self._emit(self._items, lines, "    ")
+            lines.append("    append('\\r\\n')")
+            lines.append("    return ''.join(parts)")
+
+        exec "\n".join(lines) + "\n" in namespace
+        encode = namespace["encode"]
+        encode.__name__ = "encode_" + self.function_name
+        return encode
+
+    def make_function(self, call, doc=None):
+        """
+        Makes a function that takes a server followed by this command's parameters, like the ones in
+        :py:mod:`~caspartalk.AMCP`.
+
+        :param call: A function that is called with the server, the encoded command and a dict of the parameters, \
+        and whose result is returned.
+        :param str doc: The docstring of the function.
+        :return: The function, named after the command (e.g. ``mixer_fill``).
+        """
+        signature = ", ".join(["server"] + self.required + ["{name}={default!r}".format(name=name, default=default)
+                                                            for name, default in self.optional])
+        arguments = ", ".join(self.fields)
+        parameters = ", ".join("{name!r}: {name}".format(name=name) for name in self.fields)
+        source = ("def {function}({signature}):\n"
+                  "    return _call(server, _encode({arguments}), {{{parameters}}})\n").format(
+            function=self.function_name, signature=signature, arguments=arguments, parameters=parameters)
+
+        namespace = {"_call": call, "_encode": self.encode}
+        exec source in namespace
+        function = namespace[self.function_name]
+        function.__doc__ = doc
+        return function
+
+    def __repr__(self):
+        return "Command({name!r}, {template!r})".format(name=self.name, template=self.template)
+
+
+# { name : Command }
+COMMANDS = collections.OrderedDict((name, Command(name, template, description))
+                                   for name, template, description in SPEC)
+
+
+def get_command(name):
+    """
+    Gets one of the precompiled commands in :py:data:`SPEC`.
+
+    :param str name: The name of the command, e.g. "CG UPDATE".
+    :rtype: Command
+    """
+    try:
+        return COMMANDS[name]
+    except KeyError:
+        raise KeyError("Unknown AMCP command: {name}".format(name=name))
@@ -0,0 +1,143 @@
+import json
+
+
+class CGDataCache(object):
+    """
+    Remembers the last data that was sent to each CG layer on a CasparCG server, so that
+    :py:func:`~caspartalk.AMCP.cg_update` only needs to send the fields that have actually changed.
+
+    Data is stored per ``(channel, layer, cg_layer)``. Templates only update the fields that they are sent, so the data
+    held here is the merged result of every :py:func:`~caspartalk.AMCP.cg_add` and
+    :py:func:`~caspartalk.AMCP.cg_update` sent to that CG layer.
+
+    The following counters are kept:
+
+    * *bytes_saved* - the number of bytes of data that didn't need to be sent.
+    * *suppressed_commands* - the number of updates that weren't sent at all, because nothing had changed.
+    * *sent_commands* - the number of updates that were sent.
+
+    """
+
+    def __init__(self):
+        self._layers = {}
+
+        self.bytes_saved = 0
+        self.suppressed_commands = 0
+        self.sent_commands = 0
+
+    def get_data(self, channel, layer, cg_layer):
+        """
+        Gets the data that CasparCG should currently be holding for a CG layer.
+
+        :param int channel: The number of the channel.
+        :param int layer: The number of the layer on *channel*.
+        :param int cg_layer: The number of the CG layer on *layer*.
+        :return: The last data sent to the CG layer, or None if nothing is known about it.
+        """
+        return self._layers.get((channel, layer, cg_layer))
+
+    def set_data(self, channel, layer, cg_layer, data):
+        """
+        Replaces the data held for a CG layer - used when a template is (re)loaded with
+        :py:func:`~caspartalk.AMCP.cg_add`, as the template will start with only that data.
+
+        :param int channel: The number of the channel.
+        :param int layer: The number of the layer on *channel*.
+        :param int cg_layer: The number of the CG layer on *layer*.
+        :param data: The data that was sent to the CG layer.
+        """
+        if isinstance(data, dict):
+            data = dict(data)
+        self._layers[(channel, layer, cg_layer)] = data
+
+    def diff(self, channel, layer, cg_layer, data):
+        """
+        Works out which parts of *data* need to be sent to a CG layer.
+
+        If both *data* and the data already held for the CG layer are dicts, only the fields whose values have changed
+        (or that are new) are returned. Any other data (e.g. the name of a stored dataset) can't be split up, so it is
+        returned as-is if it differs at all.
+
+        :param int channel: The number of the channel.
+        :param int layer: The number of the layer on *channel*.
+        :param int cg_layer: The number of the CG layer on *layer*.
+        :param data: The data that is about to be sent.
+        :return: The data that needs to be sent, or None if the CG layer already has all of *data*.
+        """
+        previous = self._layers.get((channel, layer, cg_layer))
+
+        if previous is None:
+            return data
+
+        if isinstance(data, dict) and isinstance(previous, dict):
+            changes = {}
+            for k, v in data.iteritems():
+                if k not in previous or previous[k] != v:
+                    changes[k] = v
+            if changes:
+                return changes
+            return None
+
+        if data == previous:
+            return None
+        return data
+
+    def record_update(self, channel, layer, cg_layer, data, sent_data):
+        """
+        Records that *sent_data* (the result of :py:meth:`diff`) has been sent to a CG layer in place of *data*,
+        updating the held data and the counters.
+
+        :param int channel: The number of the channel.
+        :param int layer: The number of the layer on *channel*.
+        :param int cg_layer: The number of the CG layer on *layer*.
+        :param data: The full data that the caller asked to be sent.
+        :param sent_data: The data that was actually sent, or None if the update was suppressed.
+        """
+        full_size = len(json.dumps(data))
+
+        if sent_data is None:
+            self.suppressed_commands += 1
+            self.bytes_saved += full_size
+            return
+
+        self.sent_commands += 1
+        if sent_data is not data:
+            self.bytes_saved += full_size - len(json.dumps(sent_data))
+
+        previous = self._layers.get((channel, layer, cg_layer))
+        if isinstance(data, dict) and isinstance(previous, dict):
+            previous.update(data)
+        else:
+            self.set_data(channel, layer, cg_layer, data)
+
+    def forget(self, channel, layer=None, cg_layer=None):
+        """
+        Forgets the data held for a CG layer, for every CG layer on a layer if *cg_layer* is None, or for every CG
+        layer on a channel if *layer* is None too. This is used when templates are removed from the server.
+
+        :param int channel: The number of the channel.
+        :param int layer: The number of the layer on *channel*.
+        :param int cg_layer: The number of the CG layer on *layer*.
+        """
+        if cg_layer is not None and layer is not None:
+            self._layers.pop((channel, layer, cg_layer), None)
+            return
+
+        for key in self._layers.keys():
+            if key[0] == channel and (layer is None or key[1] == layer):
+                del self._layers[key]
+
+    def clear(self):
+        """
+        Forgets everything - for example, after reconnecting to a server that may have been restarted.
+        """
+        self._layers.clear()
+
+    def get_stats(self):
+        """
+        :rtype: Dict
+        :return: A dict containing the *bytes_saved*, *suppressed_commands* and *sent_commands* counters.
+        """
+        return {"bytes_saved": self.bytes_saved,
+                "suppressed_commands": self.suppressed_commands,
+                "sent_commands": self.sent_commands}
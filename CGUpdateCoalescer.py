@@ -0,0 +1,220 @@
+import collections
+import threading
+import time
+import amcp
+import CasparServer
+
+
+class CGUpdateCoalescer(object):
+    """
+    Sits in front of :py:func:`~caspartalk.AMCP.cg_update` for templates that are updated far more often than the
+    channel can show (clocks, scoreboards, tickers...).
+
+    Updates are submitted with :py:meth:`submit`. Only the newest pending update for each
+    ``(channel, layer, cg_layer)`` is kept, and pending updates are sent at most once per frame of the channel they're
+    on - any updates that are replaced before they're sent are dropped. Call :py:meth:`flush` regularly from your own
+    loop, or call :py:meth:`start` to flush from a background thread.
+
+    The frame rate of each channel is taken from its *video_mode*. Pass in the
+    :py:class:`~caspartalk.CasparServer.ServerConfig` (from :py:func:`~caspartalk.AMCP.info_config`) so that the
+    channels can be looked up; any channel that isn't in the config is assumed to be running at *default_frame_rate*.
+
+    :param CasparServer server: The :py:class:`~caspartalk.CasparServer` to send updates to.
+    :param ServerConfig server_config: The configuration of *server*, used to find the frame rate of each channel.
+    :param float default_frame_rate: The frame rate to use for channels that aren't in *server_config*.
+    :param float rate_window: The number of seconds over which the effective update rate is measured.
+    """
+
+    def __init__(self, server, server_config=None, default_frame_rate=25.0, rate_window=1.0):
+        self.server = server
+        self.default_frame_rate = default_frame_rate
+        self.rate_window = rate_window
+
+        # { channel : seconds per frame }
+        self._frame_intervals = {}
+        if server_config:
+            for i, ch in enumerate(server_config.channels):
+                # Channels are numbered from 1 in AMCP
+                self._frame_intervals[i + 1] = 1.0 / CasparServer.get_frame_rate(ch.video_mode)
+
+        # { (channel, layer, cg_layer) : (data, template) }
+        self._pending = {}
+        # { channel : time of the last flush }
+        self._last_flush = {}
+        # { (channel, layer, cg_layer) : deque of times that updates were sent }
+        self._sent_times = {}
+
+        self._lock = threading.Lock()
+        self._thread = None
+        self._running = False
+
+        self.submitted = 0
+        self.sent = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def get_frame_interval(self, channel):
+        """
+        :param int channel: The number of the channel.
+        :rtype: float
+        :return: The number of seconds between frames on *channel*.
+        """
+        return self._frame_intervals.get(channel, 1.0 / self.default_frame_rate)
+
+    def submit(self, channel=1, layer=10, cg_layer=0, data=None, template=None):
+        """
+        Queues *data* to be sent to a CG layer. If an update for the same CG layer is already waiting, it is replaced
+        (and counted as dropped).
+
+        :param int channel: The number of the channel containing the template to send *data* to.
+        :param int layer: The number of the layer containing the template to send *data* to.
+        :param int cg_layer: The number of the cg_layer containing the template to send *data* to.
+        :param data: The data to send - see :py:func:`~caspartalk.AMCP.cg_update`.
+        :param Template template: The Template on the CG layer - see :py:func:`~caspartalk.AMCP.cg_update`.
+        """
+        key = (channel, layer, cg_layer)
+        with self._lock:
+            if key in self._pending:
+                self.dropped += 1
+            self._pending[key] = (data, template)
+            self.submitted += 1
+
+    def flush(self, now=None, force=False):
+        """
+        Sends the pending updates for every channel that hasn't been flushed within the last frame. If the
+        connection fails partway through, the updates that weren't sent are left pending, and the exception is raised.
+
+        :param float now: The current time, as given by ``time.time()``. Mostly useful for testing.
+        :param bool force: If True, send every pending update regardless of when its channel was last flushed.
+        :rtype: int
+        :return: The number of updates sent.
+        """
+        if now is None:
+            now = time.time()
+
+        to_send = []
+        with self._lock:
+            if not self._pending:
+                return 0
+
+            due_channels = set()
+            for key in self._pending:
+                channel = key[0]
+                if channel in due_channels:
+                    continue
+                last = self._last_flush.get(channel)
+                if force or last is None or now - last >= self.get_frame_interval(channel):
+                    due_channels.add(channel)
+
+            for key in self._pending.keys():
+                if key[0] in due_channels:
+                    to_send.append((key, self._pending.pop(key)))
+
+            for channel in due_channels:
+                self._last_flush[channel] = now
+
+        # The updates are sent without holding the lock, so that submit() isn't held up by the round trips
+        sent_keys = []
+        done = 0
+        try:
+            for done, (key, (data, template)) in enumerate(to_send):
+                if amcp.cg_update(self.server, key[0], key[1], key[2], data, template=template):
+                    sent_keys.append(key)
+            done = len(to_send)
+        finally:
+            with self._lock:
+                # If the connection went partway through, the updates that weren't sent are still the latest for
+                # their layers - unless something newer has been submitted since
+                for key, update in to_send[done:]:
+                    self._pending.setdefault(key, update)
+
+                self.sent += len(sent_keys)
+                self.failed += done - len(sent_keys)
+                for key in sent_keys:
+                    times = self._sent_times.get(key)
+                    if times is None:
+                        times = self._sent_times[key] = collections.deque()
+                    times.append(now)
+                self._prune_sent_times(now)
+
+        return len(sent_keys)
+
+    def _prune_sent_times(self, now):
+        # Forgets the updates sent more than rate_window ago. Must be called with _lock held.
+        for key, times in self._sent_times.items():
+            while times and now - times[0] > self.rate_window:
+                times.popleft()
+            if not times:
+                del self._sent_times[key]
+
+    def get_update_rate(self, channel=None, layer=None, cg_layer=None, now=None):
+        """
+        Gets the effective number of updates per second that have been sent over the last *rate_window* seconds,
+        either to a single CG layer or (if no CG layer is given) to every CG layer.
+
+        :param int channel: The number of the channel.
+        :param int layer: The number of the layer on *channel*.
+        :param int cg_layer: The number of the CG layer on *layer*.
+        :param float now: The current time, as given by ``time.time()``.
+        :rtype: float
+        :return: The number of updates sent per second.
+        """
+        if now is None:
+            now = time.time()
+
+        with self._lock:
+            self._prune_sent_times(now)
+            if channel is None:
+                count = sum(len(times) for times in self._sent_times.itervalues())
+            else:
+                count = len(self._sent_times.get((channel, layer, cg_layer), ()))
+
+        return count / self.rate_window
+
+    def get_stats(self):
+        """
+        :rtype: Dict
+        :return: A dict containing the number of updates *submitted*, *sent*, *dropped* (replaced before they were \
+        sent) and *failed*, the number still *pending* and the overall effective *update_rate*.
+        """
+        update_rate = self.get_update_rate()
+        with self._lock:
+            return {"submitted": self.submitted,
+                    "sent": self.sent,
+                    "dropped": self.dropped,
+                    "failed": self.failed,
+                    "pending": len(self._pending),
+                    "update_rate": update_rate}
+
+    def start(self):
+        """
+        Starts a background thread that flushes pending updates once per frame of the fastest channel.
+        """
+        if self._running:
+            return
+
+        self._running = True
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the background thread started by :py:meth:`start`, sending any updates that are still pending.
+        """
+        self._running = False
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.flush(force=True)
+
+    def _run(self):
+        while self._running:
+            try:
+                self.flush()
+            except Exception:
+                # Probably disconnected (which can raise anything from an IOError to an AttributeError, once the
+                # server has been disconnected). The updates are still pending, so try again next frame.
+                pass
+
+            time.sleep(min(self._frame_intervals.values() + [1.0 / self.default_frame_rate]))
@@ -1,12 +1,67 @@
 import types
 import collections
 import amcp
+import TemplateData
+import TemplateValidation
 
 CasparTypes = {"string": types.StringType,
                "int": types.IntType,
                "number": types.FloatType,
                "boolean": types.BooleanType}
 
+# A catalog of thousands of templates repeats the same few names, types and info strings over and over (every text
+# field is a "CasparTextField" with a "text" property...), so these are interned and shared rather than held once per
+# template.
+_interned_unicode = {}
+
+
+def intern_string(s):
+    """
+    Returns a single shared copy of the string *s*, so that equal strings from different templates don't each take up
+    memory. Works for both ``str`` and ``unicode``.
+
+    :param s: The string to intern. None is returned as-is.
+    """
+    if s is None:
+        return None
+    if type(s) is str:
+        return intern(s)
+    return _interned_unicode.setdefault(s, s)
+
+
+class PropertyDescriptor(collections.namedtuple("PropertyDescriptor", ["id", "type", "info"])):
+    """
+    The immutable part of a :py:class:`TemplateParameter` or :py:class:`ComponentProperty` - its ID, type and info
+    string. Descriptors are shared between every parameter or property that has the same ID, type and info.
+    """
+
+    __slots__ = ()
+
+_descriptors = {}
+
+
+def get_property_descriptor(prop_id, prop_type, prop_info):
+    """
+    Gets the shared :py:class:`PropertyDescriptor` for the given ID, type and info, creating it if necessary.
+
+    :param str prop_id: The ID of the parameter or property.
+    :param prop_type: The name of a Caspar type (e.g. "string"), or the Python type itself.
+    :param str prop_info: The string describing the parameter or property.
+    :rtype: :py:class:`PropertyDescriptor`
+    """
+    if prop_type in CasparTypes:
+        prop_type = CasparTypes[prop_type]
+    elif prop_type not in CasparTypes.values():
+        raise ValueError("'{wrong}' is not a valid Caspar Type {types})".format(wrong=prop_type,
+                                                                              types=CasparTypes.keys()))
+
+    key = (prop_id, prop_type, prop_info)
+    descriptor = _descriptors.get(key)
+    if descriptor is None:
+        descriptor = _descriptors[key] = PropertyDescriptor(intern_string(prop_id), prop_type,
+                                                            intern_string(prop_info))
+    return descriptor
+
 
 class CasparObject(object):
     """
@@ -16,6 +71,8 @@ class CasparObject(object):
     Likely to either be a template or a media file.
     """
 
+    __slots__ = ()
+
     def __init__(self):
         pass
 
@@ -50,8 +107,15 @@ class Template(CasparObject):
     folder).
     :param casparServer owner_server: The server that the template exists on.
 
+    Templates use ``__slots__`` to keep large catalogs small, so attributes other than those above can't be added to
+    them.
+
     """
 
+    __slots__ = ("file_name", "owner_server", "version", "author_name", "author_email", "template_info",
+                 "original_height", "original_width", "original_frame_rate", "components", "keyframes", "instances",
+                 "parameters", "_data_serializer", "_validators")
+
     def __init__(self, owner_server, file_name):
         CasparObject.__init__(self)
 
@@ -72,6 +136,47 @@ class Template(CasparObject):
         self.instances = {}
         self.parameters = TypedDict(TemplateParameter)
 
+        self._data_serializer = None
+        self._validators = None
+
+    def get_data_serializer(self):
+        """
+        Gets the :py:class:`~caspartalk.TemplateData.TemplateDataSerializer` for this Template, which renders data
+        as the ``<templateData>`` XML that the Template expects. The serializer is compiled the first time this is
+        called; if *instances* or *parameters* are changed afterwards, call :py:meth:`reset_compiled`.
+
+        :rtype: :py:class:`~caspartalk.TemplateData.TemplateDataSerializer`
+        """
+        if self._data_serializer is None:
+            self._data_serializer = TemplateData.TemplateDataSerializer(self)
+        return self._data_serializer
+
+    def get_validator(self, coerce=True, allow_unknown=False):
+        """
+        Gets a :py:class:`~caspartalk.TemplateValidation.TemplateValidator` that checks batches of data against this
+        Template's *parameters* and component properties. Validators are compiled the first time they're asked for;
+        if *components*, *instances* or *parameters* are changed afterwards, call :py:meth:`reset_compiled`.
+
+        :param bool coerce: If True, the validator converts values to the right type where it's safe to do so.
+        :param bool allow_unknown: If True, the validator passes through fields that this Template doesn't have.
+        :rtype: :py:class:`~caspartalk.TemplateValidation.TemplateValidator`
+        """
+        if self._validators is None:
+            self._validators = {}
+        key = (coerce, allow_unknown)
+        validator = self._validators.get(key)
+        if validator is None:
+            validator = self._validators[key] = TemplateValidation.TemplateValidator(self, coerce, allow_unknown)
+        return validator
+
+    def reset_compiled(self):
+        """
+        Discards the compiled data serializer and validators, so that they are rebuilt from the current *components*,
+        *instances* and *parameters* the next time they're needed.
+        """
+        self._data_serializer = None
+        self._validators = None
+
     def __repr__(self):
         return str(type(self).__name__ + " " + self.file_name)
 
@@ -82,6 +187,8 @@ class TemplateParameter(object):
     the Template that can be set from a CCG client. Different Templates will accept different Parameters, or none at
     all.
 
+    The *id*, *type* and *info* of the parameter are held in a shared :py:class:`PropertyDescriptor`.
+
     :param param_id: The ID of the parameter within the Template.
     :param param_type: The data type that *param_value* must be.
     :param param_info: A string containing information describing the Parameter.
@@ -89,22 +196,39 @@ class TemplateParameter(object):
 
     """
 
-    def __init__(self, param_id, param_type, param_info, param_value=None):
-        self.id = param_id
+    __slots__ = ("descriptor", "_value")
 
-        if param_type in CasparTypes.keys():
-            self.type = CasparTypes[param_type]
-        elif param_type in CasparTypes.values():
-            self.type = param_type
-        else:
-            raise ValueError("'{wrong}' is not a valid Caspar Type {types})".format(wrong=param_type),
-                             types=CasparTypes.keys())
+    def __init__(self, param_id, param_type, param_info, param_value=None):
+        self.descriptor = get_property_descriptor(param_id, param_type, param_info)
 
-        self.info = param_info
         self._value = None
         if param_value:
             self.set_value(param_value)
 
+    def get_id(self):
+        return self.descriptor.id
+
+    def set_id(self, param_id):
+        self.descriptor = get_property_descriptor(param_id, self.descriptor.type, self.descriptor.info)
+
+    id = property(get_id, set_id)
+
+    def get_type(self):
+        return self.descriptor.type
+
+    def set_type(self, param_type):
+        self.descriptor = get_property_descriptor(self.descriptor.id, param_type, self.descriptor.info)
+
+    type = property(get_type, set_type)
+
+    def get_info(self):
+        return self.descriptor.info
+
+    def set_info(self, param_info):
+        self.descriptor = get_property_descriptor(self.descriptor.id, self.descriptor.type, param_info)
+
+    info = property(get_info, set_info)
+
     def set_value(self, param_value):
         expected_type = self.type
         if isinstance(param_value, expected_type):
@@ -130,28 +254,47 @@ class ComponentProperty(object):
     A ComponentProperty is simply a Property of a Component in a CCG Template.
     Components are simply collections of Properties.
 
+    The *id*, *type* and *info* of the property are held in a shared :py:class:`PropertyDescriptor`.
+
     :param data_id: The name of the property.
     :param data_type: The type of the value of the property.
     :param data_info: The string containing information about the property.
     :param data_value: The value of the property, of type *data_type*.
     """
 
-    def __init__(self, data_id, data_type, data_info, data_value=None):
-        self.id = data_id
+    __slots__ = ("descriptor", "_value")
 
-        if data_type in CasparTypes.keys():
-            self.type = CasparTypes[data_type]
-        elif data_type in CasparTypes.values():
-            self.type = data_type
-        else:
-            raise ValueError("'{wrong}' is not a valid Caspar Type {types})".format(wrong=data_type),
-                             types=CasparTypes.keys())
+    def __init__(self, data_id, data_type, data_info, data_value=None):
+        self.descriptor = get_property_descriptor(data_id, data_type, data_info)
 
-        self.info = data_info
         self._value = None
         if data_value:
             self.set_value(data_value)
 
+    def get_id(self):
+        return self.descriptor.id
+
+    def set_id(self, data_id):
+        self.descriptor = get_property_descriptor(data_id, self.descriptor.type, self.descriptor.info)
+
+    id = property(get_id, set_id)
+
+    def get_type(self):
+        return self.descriptor.type
+
+    def set_type(self, data_type):
+        self.descriptor = get_property_descriptor(self.descriptor.id, data_type, self.descriptor.info)
+
+    type = property(get_type, set_type)
+
+    def get_info(self):
+        return self.descriptor.info
+
+    def set_info(self, data_info):
+        self.descriptor = get_property_descriptor(self.descriptor.id, self.descriptor.type, data_info)
+
+    info = property(get_info, set_info)
+
     def set_value(self, data_value):
         expected_type = self.type
         if isinstance(data_value, expected_type):
@@ -172,19 +315,21 @@ class ComponentProperty(object):
         return str(type(self).__name__)
 
 
-class TypedDict(collections.MutableMapping):
+class TypedDict(dict):
     """
     A TypedDict is what it sounds like - a normal Dict, but with the setter overridden so that the key is as normal,
     just a string, but the value is checked to make sure that it is a certain type before it is added to the Dict,
     so as to ensure that the values stored can safely be expected to be of a certain type.
 
+    TypedDict is a ``dict`` subclass with ``__slots__``, so it costs no more memory than a plain dict.
+
     :param value_type: The permissible type of values to be stored in the TypedDict.
     """
 
+    __slots__ = ("_value_type",)
+
     def __init__(self, value_type, *args, **kwargs):
-        self.store = dict()
-        # dict.__init__(dict(), *args, **kwargs)
-        self.store.update(*args, **kwargs)
+        dict.__init__(self)
 
         if isinstance(value_type, TypedDict):
             value_type = TypedDict
@@ -193,26 +338,35 @@ class TypedDict(collections.MutableMapping):
                 "value_type is not a type, got {arg} instead".format(arg=type(value_type)))
 
         self._value_type = value_type
-
-    def __getitem__(self, key):
-        return self.store[key]
+        self.update(*args, **kwargs)
 
     def __setitem__(self, key, value):
         if not isinstance(value, self.value_type):
             raise TypeError("{value} is not a {type}.".format(
                 value=value, type=self.value_type))
-        self.store[key] = value
+        dict.__setitem__(self, key, value)
 
-    def __delitem__(self, key):
-        del self.store[key]
+    def update(self, *args, **kwargs):
+        # dict.update doesn't go through __setitem__, so the values wouldn't be checked
+        for k, v in dict(*args, **kwargs).iteritems():
+            self[k] = v
 
-    def __iter__(self):
-        return iter(self.store)
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return dict.__getitem__(self, key)
 
-    def __len__(self):
-        return len(self.store)
+    def get_store(self):
+        # TypedDict used to wrap a separate dict called 'store' - it's now the dict itself
+        return self
+
+    store = property(get_store)
 
     def get_value_type(self):
         return self._value_type
 
     value_type = property(get_value_type)
+
+    def __repr__(self):
+        return "{name}({type}, {items})".format(name=type(self).__name__, type=self._value_type.__name__,
+                                                items=dict.__repr__(self))
@@ -1,8 +1,56 @@
+import collections
+import itertools
+import re
 import socket
+import threading
+import time
 import amcp
 import ResponseInterpreter
+import CasparExceptions
+import CGDataCache
+import CommandScheduler
+import QueryCache
+import Transport
 from enum import Enum
 
+try:
+    import numpy
+except ImportError:
+    # numpy is only needed to compile the audio mix matrices - see AudioConfig.compile_mix_matrices
+    numpy = None
+
+# The first version of CasparCG that accepts REQ [id] [command], and answers it with RES [id] [reply]
+REQUEST_ID_MIN_VERSION = (2, 2)
+
+
+def _parse_version(version):
+    # "2.2.0 66a9e3e2 Stable" -> (2, 2)
+    match = re.match(r"\s*(\d+)\.(\d+)", version or "")
+    if match is None:
+        return None
+    return int(match.group(1)), int(match.group(2))
+
+
+class _PendingRequest(object):
+    # A command sent with a request ID, waiting for its reply
+
+    __slots__ = ("command", "event", "done", "response", "error", "received_at")
+
+    def __init__(self, command):
+        self.command = command
+        self.event = threading.Event()
+        self.done = False
+        self.response = None
+        self.error = None
+        self.received_at = None
+
+    def complete(self, response=None, error=None):
+        self.response = response
+        self.error = error
+        self.received_at = time.time()
+        self.done = True
+        self.event.set()
+
 
 class CasparServer:
     """
@@ -36,6 +84,47 @@ class CasparServer:
         self.buffer_size = 4096
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 
+        # The options set on the socket when connecting (TCP_NODELAY, keepalives, buffer sizes), and the Transport
+        # that sends and receives over it once connected
+        self.socket_options = Transport.SocketOptions()
+        self.transport = None
+
+        # Commands may be sent from more than one thread (e.g. by a CGUpdateCoalescer), and each command has to be
+        # sent and have its response read before the next one can go. The most urgent command goes next - see
+        # CommandScheduler.
+        self.command_lock = CommandScheduler.CommandScheduler()
+
+        # Remembers the data sent to each CG layer, so that CG UPDATE only sends what has changed
+        self.cg_data_cache = CGDataCache.CGDataCache()
+
+        # Functions to call, with this CasparServer, every time a connection is made - see add_connect_callback
+        self.connect_callbacks = []
+
+        # If set, a DatasetCache that DATA commands are served from and kept coherent with
+        self.dataset_cache = None
+
+        # If set, a ConfigCache that INFO CONFIG replies are checked against before being parsed
+        self.config_cache = None
+
+        # If set, a FlowController that limits how many commands are in flight at once
+        self.flow_control = None
+
+        # Whether to tag commands with request IDs on servers that support it (see send_amcp_command), and whether
+        # the server we're connected to does
+        self.use_request_ids = True
+        self.request_ids = False
+
+        # The commands that have been sent with request IDs and are waiting for their replies, oldest first.
+        # { request ID : _PendingRequest }
+        self._pending = collections.OrderedDict()
+        self._pending_lock = threading.Lock()
+        # Only one thread reads replies from the socket at once - see _await_reply
+        self._read_lock = threading.Lock()
+        self._request_counter = itertools.count(1)
+
+        # Short-lived responses to queries like VERSION, INFO and TLS - see send_amcp_command. None turns it off.
+        self.query_cache = QueryCache.QueryCache()
+
         if server_ip:
             self.connect(server_ip, port)
 
@@ -67,13 +156,63 @@ class CasparServer:
         """
         self.server_ip = server_ip
         self.server_port = port
+
+        # A socket can't be reused once it's been closed, so make a new one if we've disconnected
+        if self.socket is None:
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket_options.apply(self.socket)
         self.socket.connect((self.server_ip, self.server_port))
+        self.transport = Transport.Transport(self.socket, self.buffer_size)
+
+        # The server may have been restarted since we last saw it, so we can't trust what we think is on it
+        self.cg_data_cache.clear()
+        if self.query_cache is not None:
+            self.query_cache.clear()
+
+        # ...and it may have been upgraded or downgraded
+        self.request_ids = False
+        if self.use_request_ids:
+            self.request_ids = self._supports_request_ids()
+
+        for callback in self.connect_callbacks:
+            callback(self)
 
     def disconnect(self):
         """
-        Disconnects from the CasparCG server that we are connected to.
+        Disconnects from the CasparCG server that we are connected to. Any commands still waiting for their replies
+        raise an IOError.
         """
         self.socket.close()
+        self.socket = None
+        self.transport = None
+        self._fail_pending(IOError("Disconnected from the CasparCG server"))
+
+    def reconnect(self):
+        """
+        Disconnects from the CasparCG server (if connected), and connects to it again.
+        """
+        if self.socket is not None:
+            self.disconnect()
+        self.connect(self.server_ip, self.server_port)
+
+    def add_connect_callback(self, callback):
+        """
+        Registers a function to be called every time a connection is made to the CasparCG server, including when
+        reconnecting. This can be used to restore any state that was held on the server.
+
+        :param callback: A function that takes this :py:class:`~caspartalk.CasparServer` as its only argument.
+        """
+        if callback not in self.connect_callbacks:
+            self.connect_callbacks.append(callback)
+
+    def remove_connect_callback(self, callback):
+        """
+        Removes a function registered with :py:meth:`add_connect_callback`.
+
+        :param callback: The function to remove.
+        """
+        if callback in self.connect_callbacks:
+            self.connect_callbacks.remove(callback)
 
     def send_string(self, command_string):
         """
@@ -82,7 +221,7 @@ class CasparServer:
         :param str command_string: The AMCP command string to send to CasparCG.
 
         """
-        self.socket.sendall(command_string)
+        self.transport.send(command_string)
 
     def read_until(self, delimiter):
         """
@@ -96,11 +235,7 @@ class CasparServer:
 
         """
 
-        s = ""
-        while not s.endswith(delimiter):
-            s += self.socket.recv(1)
-
-        lines = s.splitlines()
+        lines = self.transport.read_until(delimiter).splitlines()
         ret = []
 
         # Sometimes Caspar spits out some extraneous empty lines, which can throw us.
@@ -112,22 +247,110 @@ class CasparServer:
 
         return ret
 
-    def send_amcp_command(self, amcp_command):
+    def _supports_request_ids(self):
+        # Servers that don't know about REQ answer it with 400 ERROR and an echo of the command, which would be hard
+        # to tell apart from the replies that follow - so go by the server's version instead
+        try:
+            response = self.send_amcp_command("VERSION", use_cache=False)
+        except CasparExceptions.CasparError:
+            return False
+
+        version = _parse_version(response[0]) if response else None
+        return version is not None and version >= REQUEST_ID_MIN_VERSION
+
+    def send_amcp_command(self, amcp_command, use_cache=True, priority=None):
         """
         Sends a string containing an AMCP command to a specified CasparCG server.
 
+        If the command is a query that the :py:attr:`query_cache` holds a recent response to, and *use_cache* is True,
+        that response is returned without anything being sent. Otherwise, the response is cached for next time, and
+        any cached responses that the command could change are dropped - see
+        :py:class:`~caspartalk.QueryCache.QueryCache`.
+
+        Commands are sent one at a time. If other threads are waiting to send commands, the most urgent goes first -
+        see :py:class:`~caspartalk.CommandScheduler.CommandScheduler`.
+
+        On servers that support it (CasparCG 2.2 and later), each command is tagged with a request ID, which the
+        server puts on its reply. Replies can then be matched to their commands in whatever order they arrive, so
+        other threads can send their commands while this one waits - a slow command doesn't hold up everything sent
+        after it. Older servers answer commands in order, so each command has to wait for the reply to the one
+        before. Which is used is worked out on :py:meth:`connect`; set :py:attr:`use_request_ids` to False before
+        connecting to always wait.
+
         :param str amcp_command: The AMCP command string that will be sent to the CasparCG server.
+        :param bool use_cache: If False, always send the command to the server (although its response is still cached).
+        :param int priority: How urgent the command is. If None, it is worked out with \
+        :py:func:`~caspartalk.CommandScheduler.priority_of`.
         :return: Any response from the CasparCG server will be returned. If there is no response other than the \
         command status string, ``None`` will be returned. This might change in the future...
 
         """
 
-        print "Sending command:", amcp_command
-        if not amcp_command.endswith("\r\n"):
+        query_cache = self.query_cache
+        if use_cache and query_cache is not None:
+            found, response = query_cache.get(amcp_command)
+            if found:
+                return response
+
+        if priority is None:
+            priority = CommandScheduler.priority_of(amcp_command)
+
+        # Commands built by AMCPCommands already end with \r\n
+        if amcp_command.endswith("\r\n"):
+            print "Sending command:", amcp_command[:-2]
+        else:
+            print "Sending command:", amcp_command
             amcp_command += "\r\n"
-        self.send_string(amcp_command)
 
-        response = self.read_until("\r\n")
+        flow_control = self.flow_control
+        if flow_control is None:
+            return self._send_and_receive(amcp_command, priority)
+
+        flow_control.acquire(priority)
+        sent_at = []
+        try:
+            response = self._send_and_receive(amcp_command, priority, sent_at)
+        except Exception, e:
+            flow_control.release(time.time() - sent_at[0] if sent_at else None, e)
+            raise
+        flow_control.release(time.time() - sent_at[0])
+        return response
+
+    def _send_and_receive(self, amcp_command, priority, sent_at=None):
+        # Sends a command (which must end with \r\n) and waits for its reply. The time that it was sent is appended
+        # to sent_at, for measuring the round trip.
+        query_cache = self.query_cache
+        with self.command_lock.turn(priority):
+            generation = None
+            if query_cache is not None:
+                query_cache.command_sent(amcp_command)
+                generation = query_cache.generation
+
+            if sent_at is not None:
+                sent_at.append(time.time())
+
+            if self.request_ids:
+                request = self._queue_tagged([amcp_command])[0]
+            else:
+                self.send_string(amcp_command)
+                response = self._read_response()
+                if query_cache is not None:
+                    query_cache.put(amcp_command, response)
+                return response
+
+        # Wait for the reply without holding up anyone else's commands
+        self._flush_tagged()
+        response = self._await_reply(request)
+        if query_cache is not None:
+            query_cache.put(amcp_command, response, generation)
+        return response
+
+    def _read_response(self):
+        # Reads the response to a single command, raising a CasparError if the command failed
+        return self._read_response_data(self.read_until("\r\n"))
+
+    def _read_response_data(self, response):
+        # Reads whatever data follows the first line of a response
 
         # ResponseInterpreter lets us know how to proceed - Caspar's way of sending information
         # is a bit vague.
@@ -137,16 +360,220 @@ class CasparServer:
         else:
             return None
 
+    def _queue_tagged(self, amcp_commands):
+        # Queues commands (which must end with \r\n) tagged with new request IDs to be sent by _flush_tagged,
+        # returning a _PendingRequest for each. They're registered before being sent, so that whoever reads the
+        # replies knows who to give them to. This is called during the sending thread's turn, so commands are queued
+        # in the order that the CommandScheduler chose.
+        requests = []
+        to_send = []
+        with self._pending_lock:
+            for amcp_command in amcp_commands:
+                request_id = str(next(self._request_counter))
+                request = _PendingRequest(amcp_command.rstrip())
+                self._pending[request_id] = request
+                requests.append(request)
+                to_send.append("REQ {request_id} {command}".format(request_id=request_id, command=amcp_command))
+
+        self.transport.queue("".join(to_send))
+        return requests
+
+    def _flush_tagged(self):
+        # Sends the commands queued by _queue_tagged. This is called after the sending thread's turn is over, so
+        # that commands queued by other threads while a write is going on are sent together in the next one.
+        try:
+            self.transport.flush()
+        except (IOError, socket.error), e:
+            # Whatever was queued may or may not have been sent, so nobody can count on getting a reply
+            self._fail_pending(e)
+            raise
+
+    def _read_tagged_reply(self):
+        # Reads one reply to a tagged command, and gives it to the request that it's for
+        response = self.read_until("\r\n")
+        request_id, response = ResponseInterpreter.split_request_id(response)
+
+        data = error = None
+        try:
+            data = self._read_response_data(response)
+        except (IOError, socket.error):
+            raise
+        except Exception, e:
+            # Anything else - a CasparError, 600 Not Implemented, a status code we don't know - belongs to the command
+            # that this reply is for, not to whichever thread happens to be reading
+            error = e
+
+        with self._pending_lock:
+            if request_id is None and self._pending:
+                # An untagged reply - the server must not have understood REQ after all. Replies still come back in
+                # the order that the commands were sent, so it's for the oldest one.
+                request_id = next(iter(self._pending))
+            request = self._pending.pop(request_id, None)
+        if request is None:
+            # Nobody is waiting for it - nothing we can do
+            return
+        if isinstance(error, CasparExceptions.CasparError):
+            error.cmd = request.command
+        request.complete(data, error)
+
+    def _fail_pending(self, error):
+        with self._pending_lock:
+            requests = self._pending.values()
+            self._pending.clear()
+        for request in requests:
+            request.complete(error=error)
+
+    def _wake_next_reader(self):
+        # Whenever a thread stops reading replies, one of the threads still waiting for a reply has to take over
+        with self._pending_lock:
+            for request in self._pending.itervalues():
+                if not request.done:
+                    request.event.set()
+                    return
+
+    def _await_reply(self, request):
+        # There's no separate thread reading replies: one of the threads that is waiting for a reply reads them all,
+        # handing out each one to the thread that it's for, until its own arrives.
+        while not request.done:
+            if self._read_lock.acquire(False):
+                try:
+                    while not request.done:
+                        self._read_tagged_reply()
+                except Exception, e:
+                    # Usually the connection has gone, but whatever it was, there's no telling where the next reply
+                    # starts - so nobody can count on getting one
+                    self._fail_pending(e)
+                    raise
+                finally:
+                    self._read_lock.release()
+                    self._wake_next_reader()
+            else:
+                # Woken when our reply has arrived, or when it's our turn to read
+                request.event.wait()
+                request.event.clear()
+
+        if request.error is not None:
+            raise request.error
+        return request.response
+
+    def send_amcp_commands(self, amcp_commands, pipeline_depth=32, priority=None, ack_times=None):
+        """
+        Sends several AMCP commands to the CasparCG server without waiting for each one to be answered before sending
+        the next (i.e. pipelined), which saves a network round trip per command. Commands are sent in batches of up
+        to *pipeline_depth*, and the responses are returned in the order that the commands were sent.
+
+        Unlike :py:meth:`send_amcp_command`, a failed command doesn't raise an exception - the exception (usually a
+        :py:class:`~caspartalk.CasparExceptions.CasparError`) is returned in its place, so that the responses to the
+        other commands aren't lost. Only losing the connection stops the whole batch. Every command is sent, without looking in the :py:attr:`query_cache`, but any
+        cached responses that the commands could change are still dropped.
+
+        Each batch waits for its own turn (see :py:class:`~caspartalk.CommandScheduler.CommandScheduler`), so more
+        urgent commands from other threads can be sent in between batches. If the server has a
+        :py:class:`~caspartalk.FlowControl.FlowController`, batches are also kept within its window.
+
+        :param amcp_commands: A list of AMCP command strings.
+        :param int pipeline_depth: The maximum number of commands to have waiting for a response at once.
+        :param int priority: How urgent the commands are. If None, each batch is as urgent as its most urgent command \
+        (see :py:func:`~caspartalk.CommandScheduler.priority_of`). Bulk operations should pass \
+        :py:data:`~caspartalk.CommandScheduler.BULK`.
+        :param list ack_times: If given, the time (as returned by ``time.time()``) that the reply to each command \
+        arrived is appended to this list, in the same order as *amcp_commands*.
+        :rtype: List
+        :return: A list containing the response to each command, in the same order as *amcp_commands* - see \
+        :py:meth:`send_amcp_command`.
+        """
+        amcp_commands = list(amcp_commands)
+        responses = []
+
+        i = 0
+        while i < len(amcp_commands):
+            flow_control = self.flow_control
+            batch_size = pipeline_depth
+            if flow_control is not None:
+                batch_size = min(batch_size, flow_control.get_window())
+            batch = amcp_commands[i:i + batch_size]
+            i += len(batch)
+
+            batch_priority = priority
+            if batch_priority is None:
+                batch_priority = min(CommandScheduler.priority_of(amcp_command) for amcp_command in batch)
+
+            if flow_control is not None:
+                flow_control.acquire(batch_priority, len(batch))
+
+            try:
+                replies = self._send_and_receive_batch(batch, batch_priority)
+            except Exception, e:
+                if flow_control is not None:
+                    for _ in batch:
+                        flow_control.release(None, e)
+                raise
+
+            for reply, sent_at, received_at in replies:
+                responses.append(reply)
+                if ack_times is not None:
+                    ack_times.append(received_at)
+                rtt = received_at - sent_at
+                if flow_control is not None:
+                    flow_control.release(rtt, reply if isinstance(reply, Exception) else None)
+
+        return responses
+
+    def _send_and_receive_batch(self, batch, priority):
+        # Pipelines a batch of commands, returning (reply or exception, time sent, time received) for each
+        replies = []
+        with self.command_lock.turn(priority):
+            to_send = []
+            for amcp_command in batch:
+                if not amcp_command.endswith("\r\n"):
+                    amcp_command += "\r\n"
+                if self.query_cache is not None:
+                    self.query_cache.command_sent(amcp_command)
+                to_send.append(amcp_command)
+
+            sent_at = time.time()
+            if self.request_ids:
+                requests = self._queue_tagged(to_send)
+            else:
+                requests = None
+                self.send_string("".join(to_send))
+
+                for amcp_command in batch:
+                    # Every reply has to be read, whatever goes wrong with one of them, or the rest would be left in
+                    # the socket to be taken as the replies to later commands
+                    try:
+                        reply = self._read_response()
+                    except (IOError, socket.error):
+                        raise
+                    except Exception, e:
+                        if isinstance(e, CasparExceptions.CasparError):
+                            e.cmd = amcp_command
+                        reply = e
+                    replies.append((reply, sent_at, time.time()))
+
+        if requests is not None:
+            self._flush_tagged()
+            for request in requests:
+                try:
+                    reply = self._await_reply(request)
+                except (IOError, socket.error):
+                    raise
+                except Exception, e:
+                    reply = e
+                replies.append((reply, sent_at, request.received_at))
+
+        return replies
+
     def get_media_on_server(self):
         # TODO #15: Implement CasparServer.get_media_on_server
         # Use CasparObjects.Media
         raise NotImplementedError
 
     def get_templates_on_server(self):
-        template_fn_list = AMCP.tls(self)
+        template_fn_list = amcp.tls(self)
         template_list = []
         for t in template_fn_list:
-            tmpl = AMCP.info_template(self, t)
+            tmpl = amcp.info_template(self, t)
             if tmpl:
                 template_list.append(tmpl)
 
@@ -172,6 +599,36 @@ video_mode = Enum('vm_PAL', 'vm_NTSC', 'vm_576p2500', 'vm_720p2398', 'vm_720p240
                   'vm_2160p2400', 'vm_2160p2500',
                   'vm_2160p2997', 'vm_2160p3000', 'vm_dci2160p2398', 'vm_dci2160p2400', 'vm_dci2160p2500')
 
+
+def get_frame_rate(mode):
+    """
+    Works out the number of frames per second that a channel in the given video mode outputs.
+    Interlaced modes are given in fields per second (e.g. 1080i5000), so their frame rate is half that.
+
+    :param mode: A value from the *video_mode* enum, e.g. ``video_mode.vm_1080i5000``.
+    :rtype: float
+    :return: The frame rate, e.g. 25.0
+    """
+    name = str(mode)[len("vm_"):]
+
+    if name == "PAL":
+        return 25.0
+    if name == "NTSC":
+        return 30000.0 / 1001
+
+    # e.g. 1080i5000 -> 'i', 5000
+    for scan in ("p", "i"):
+        if scan in name:
+            rate = name.rsplit(scan, 1)[1]
+            if rate.isdigit():
+                rate = int(rate) / 100.0
+                if scan == "i":
+                    rate /= 2
+                return rate
+
+    raise ValueError("Can't work out the frame rate of video mode {mode}".format(mode=mode))
+
+
 # <channel-layout>stereo [mono|stereo|dts|dolbye|dolbydigital|smpte|passthru]</channel-layout>
 # A list of all the AudioChannelLayouts
 channel_layout = Enum('mono', 'stereo', 'dts', 'dolbye',
@@ -246,8 +703,8 @@ class ServerConfig:
                            'video_grid': 2,  # <video-grid>2</video-grid>
                            'scan_interval_millis': 5000,  # <scan-interval-millis>5000</scan-interval-millis>
                            # <generate-delay-millis>2000</generate-delay-millis>
-                           'generate-delay-millis': 2000,
-                           'video-mode': video_mode.vm_720p2500,  # <video-mode>720p2500</video-mode>
+                           'generate_delay_millis': 2000,
+                           'video_mode': video_mode.vm_720p2500,  # <video-mode>720p2500</video-mode>
                            'mipmap': False}  # <mipmap>false</mipmap>
         # </thumbnails>
 
@@ -361,7 +818,7 @@ class ConsumerScreen(Consumer):
 class ConsumerNewtekIVGA(Consumer):
 
     def __init__(self):
-        Consumer.__init__()
+        Consumer.__init__(self)
 
         # <newtek-ivga>
         # <channel-layout>stereo [mono|stereo|... ]</channel-layout>
@@ -374,7 +831,7 @@ class ConsumerNewtekIVGA(Consumer):
 class ConsumerFile(Consumer):
 
     def __init__(self):
-        Consumer.__init__()
+        Consumer.__init__(self)
 
         # <file>
         self.path = ""  # <path></path>
@@ -407,10 +864,10 @@ class TemplateHost:
         #        <height/>
         #    </template-host>
         # </template-hosts>
-        self.video_mode = th_video_mode | video_mode.vm_PAL
-        self.filename = th_filename | ""
-        self.width = th_width | 0
-        self.height = th_height | 0
+        self.video_mode = th_video_mode or video_mode.vm_PAL
+        self.filename = th_filename or ""
+        self.width = th_width or 0
+        self.height = th_height or 0
 
 
 class OSC:
@@ -524,6 +981,77 @@ class AudioConfig:
                                                                                "LFE LFE 1.0"))
                                 ]
 
+        self._mix_matrices = None
+
+    def compile_mix_matrices(self):
+        """
+        Compiles every :py:class:`AudioMixConfig` in *mix_configs* into an :py:class:`AudioMixMatrix` for each pair of
+        channel layouts whose types it converts between. Layouts of the same type (e.g. 'dts' and 'smpte', both 5.1)
+        are given a matrix that simply re-orders the channels by name.
+
+        The result is cached; call this again if *channel_layouts* or *mix_configs* are changed. Requires numpy.
+
+        :rtype: Dict
+        :return: A dict of the form ``{(from_layout_name, to_layout_name): AudioMixMatrix, ...}``
+        """
+        if numpy is None:
+            raise ImportError("numpy is required to compile audio mix matrices")
+
+        layouts_by_type = {}
+        for layout in self.channel_layouts.values():
+            # Layouts that don't name their channels (i.e. passthru) can't be mixed
+            if layout.get_channel_names():
+                layouts_by_type.setdefault(layout.type, []).append(layout)
+
+        matrices = {}
+
+        for layouts in layouts_by_type.values():
+            for from_layout in layouts:
+                for to_layout in layouts:
+                    identity = [(ch, ch, 1.0) for ch in from_layout.get_channel_names()]
+                    matrices[(from_layout.name, to_layout.name)] = AudioMixMatrix(
+                        from_layout, to_layout, _build_mix_matrix(from_layout, to_layout, identity, "add"))
+
+        for mc in self.mix_configs:
+            mappings = mc.parse_mappings()
+            for from_layout in layouts_by_type.get(mc.from_, []):
+                for to_layout in layouts_by_type.get(mc.to, []):
+                    matrices[(from_layout.name, to_layout.name)] = AudioMixMatrix(
+                        from_layout, to_layout, _build_mix_matrix(from_layout, to_layout, mappings, mc.mix))
+
+        self._mix_matrices = matrices
+        return matrices
+
+    def get_mix_matrix(self, from_layout, to_layout):
+        """
+        Gets the compiled :py:class:`AudioMixMatrix` that converts audio from one channel layout to another,
+        compiling the matrices first if necessary.
+
+        :param str from_layout: The name of the source channel layout, e.g. "dts".
+        :param str to_layout: The name of the destination channel layout, e.g. "stereo".
+        :rtype: :py:class:`AudioMixMatrix`
+        :return: The mix matrix, or None if there is no mix config that converts between the two layouts.
+        """
+        if self._mix_matrices is None:
+            self.compile_mix_matrices()
+        return self._mix_matrices.get((from_layout, to_layout))
+
+    def mix(self, samples, from_layout, to_layout):
+        """
+        Mixes a block of samples or meter levels from one channel layout to another, e.g. to preview what a 5.1
+        source will sound like on a stereo channel without asking the server.
+
+        :param samples: The samples to mix - see :py:meth:`AudioMixMatrix.apply`.
+        :param str from_layout: The name of the source channel layout.
+        :param str to_layout: The name of the destination channel layout.
+        :rtype: numpy.ndarray
+        :return: The mixed samples.
+        """
+        mix_matrix = self.get_mix_matrix(from_layout, to_layout)
+        if mix_matrix is None:
+            raise ValueError("No mix config converts {from_} to {to}".format(from_=from_layout, to=to_layout))
+        return mix_matrix.apply(samples)
+
 
 class AudioChannelLayout:
 
@@ -535,6 +1063,19 @@ class AudioChannelLayout:
         self.channels = channels  # <channels>C</channels> Can be None - see 'passthru'
         # </channel-layout>
 
+    def get_channel_names(self):
+        """
+        Splits the *channels* string of this layout into the names of the individual channels, in the order that they
+        appear in the audio stream.
+
+        :rtype: List
+        :return: A list of channel names, e.g. ``["L", "R"]``. If the layout does not name its channels (see \
+        'passthru'), an empty list is returned.
+        """
+        if not self.channels:
+            return []
+        return self.channels.split()
+
 
 class AudioMixConfig:
 
@@ -548,3 +1089,92 @@ class AudioMixConfig:
         else:
             raise TypeError("Expected int for default_port, got {wrong_t}".format(
                 wrong_t=type(mappings)))
+
+    def parse_mappings(self):
+        """
+        Splits each of the *mappings* strings (of the form ``"C L 0.707"``) into a tuple of source channel,
+        destination channel and gain.
+
+        :rtype: List
+        :return: A list of tuples of the form ``(from_channel, to_channel, gain)``.
+        """
+        parsed = []
+        for m in self.mappings:
+            parts = m.split()
+            if len(parts) != 3:
+                raise ValueError("'{mapping}' is not a valid mapping - expected '[from] [to] [gain]'".format(
+                    mapping=m))
+            try:
+                gain = float(parts[2])
+            except ValueError:
+                raise ValueError("'{gain}' is not a valid gain in mapping '{mapping}'".format(gain=parts[2],
+                                                                                             mapping=m))
+            parsed.append((parts[0], parts[1], gain))
+
+        return parsed
+
+
+class AudioMixMatrix:
+    """
+    A dense mixing matrix that takes audio in the channel layout *from_layout* and mixes it down (or up) to the channel
+    layout *to_layout*.
+
+    The *matrix* has one row per channel of *to_layout* and one column per channel of *from_layout*, so that
+    ``matrix[to, from]`` is the gain applied to the *from* channel when it is mixed into the *to* channel.
+
+    :param AudioChannelLayout from_layout: The layout of the audio that the matrix is applied to.
+    :param AudioChannelLayout to_layout: The layout of the audio that the matrix produces.
+    :param numpy.ndarray matrix: The mixing matrix.
+    """
+
+    def __init__(self, from_layout, to_layout, matrix):
+        self.from_layout = from_layout
+        self.to_layout = to_layout
+        self.matrix = matrix
+        # Samples are usually laid out as (frames, channels), so keep a contiguous transpose around for apply()
+        self._matrix_t = numpy.ascontiguousarray(matrix.T)
+
+    def apply(self, samples):
+        """
+        Mixes a block of audio samples or meter levels from *from_layout* to *to_layout*.
+
+        :param samples: Either a 1-D sequence with one value per channel of *from_layout* (e.g. a set of meter \
+        levels), or a 2-D block of shape ``(frames, channels)``.
+        :rtype: numpy.ndarray
+        :return: The mixed samples, with one value (or column) per channel of *to_layout*.
+        """
+        samples = numpy.asarray(samples, dtype=self.matrix.dtype)
+        if samples.shape[-1] != self.matrix.shape[1]:
+            raise ValueError("Expected {expected} channels of {layout} audio, got {got}".format(
+                expected=self.matrix.shape[1], layout=self.from_layout.name, got=samples.shape[-1]))
+
+        if samples.ndim == 1:
+            return self.matrix.dot(samples)
+        return samples.dot(self._matrix_t)
+
+    def __repr__(self):
+        return str(type(self).__name__ + " " + self.from_layout.name + " -> " + self.to_layout.name)
+
+
+def _build_mix_matrix(from_layout, to_layout, mappings, mix):
+    # Builds the dense (to, from) matrix for a single pair of layouts.
+    # Mappings that refer to channels that don't exist in either layout are ignored, as CasparCG does.
+    from_names = from_layout.get_channel_names()
+    to_names = to_layout.get_channel_names()
+    from_index = dict((name, i) for i, name in enumerate(from_names))
+    to_index = dict((name, i) for i, name in enumerate(to_names))
+
+    matrix = numpy.zeros((len(to_names), len(from_names)), dtype=numpy.float32)
+    contributors = numpy.zeros(len(to_names), dtype=numpy.float32)
+
+    for from_ch, to_ch, gain in mappings:
+        if from_ch not in from_index or to_ch not in to_index:
+            continue
+        matrix[to_index[to_ch], from_index[from_ch]] += gain
+        contributors[to_index[to_ch]] += 1
+
+    if mix == "average":
+        # Each output channel is the mean of the channels mapped into it
+        matrix /= numpy.maximum(contributors, 1)[:, numpy.newaxis]
+
+    return matrix
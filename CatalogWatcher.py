@@ -0,0 +1,267 @@
+import collections
+import threading
+import time
+import CasparExceptions
+import amcp
+
+ADDED = "added"
+REMOVED = "removed"
+MODIFIED = "modified"
+
+# A change to the templates or media on a CasparCG server, as seen by a CatalogWatcher.
+# *kind* is "template" or "media", *change* is ADDED, REMOVED or MODIFIED, and *name* is the path of the file.
+# *entry* is the file's ListingEntry from TLS or CLS (None if it was removed), and *template* is the freshly fetched
+# Template for added and modified templates (None otherwise, or if INFO TEMPLATE failed).
+CatalogEvent = collections.namedtuple("CatalogEvent", ["kind", "change", "name", "entry", "template"])
+
+
+def diff_listings(old, new):
+    """
+    Compares two TLS or CLS listings (as returned by :py:func:`~caspartalk.AMCP.tls_listing` and
+    :py:func:`~caspartalk.AMCP.cls_listing`). A file is taken to have been modified if its size or timestamp has
+    changed.
+
+    :param dict old: The previous listing.
+    :param dict new: The current listing.
+    :rtype: tuple
+    :return: The names that were ``(added, removed, modified)``, each in alphabetical order.
+    """
+    added = sorted(name for name in new if name not in old)
+    removed = sorted(name for name in old if name not in new)
+    modified = sorted(name for name, entry in new.iteritems() if name in old and
+                      (old[name].size, old[name].timestamp) != (entry.size, entry.timestamp))
+    return added, removed, modified
+
+
+class CatalogWatcher(object):
+    """
+    Watches a CasparCG server for templates and media being added, removed or modified, without rebuilding the whole
+    catalog.
+
+    Each :py:meth:`poll` lists the templates with TLS (and the media with CLS, if *watch_media* is True), and compares
+    the listings with the ones from the previous poll by size and timestamp. INFO TEMPLATE is only sent for templates
+    that have been added or modified; a template that can't be fetched is reported without its Template, and is
+    fetched (and reported) again on the next poll. A :py:data:`CatalogEvent` is then passed to every listener (see
+    :py:meth:`add_listener`) for each change. If *update_server* is True, :py:attr:`CasparServer.templates` is kept
+    up-to-date as well.
+
+    The first poll only records what is on the server, unless *emit_initial* is True, in which case every file is
+    reported as added.
+
+    Call :py:meth:`start` to poll from a background thread. The polling interval adapts to how often things change:
+    after a poll that finds a change it drops to *min_interval*, and after each poll that doesn't it grows by
+    *backoff* times, up to *max_interval*. It also drops back to *min_interval* when the server reconnects.
+
+    :param CasparServer server: The :py:class:`~caspartalk.CasparServer` to watch.
+    :param bool watch_media: If True, media is watched as well as templates.
+    :param bool update_server: If True, keep :py:attr:`CasparServer.templates` up-to-date.
+    :param bool emit_initial: If True, the first poll reports everything on the server as added.
+    :param float min_interval: The shortest time, in seconds, between polls.
+    :param float max_interval: The longest time, in seconds, between polls.
+    :param float backoff: How much longer to wait after each poll that finds nothing.
+
+    :ivar listener_failures: The most recent exceptions raised by listeners, oldest first, as \
+    ``(time, listener, event, exception)`` tuples.
+    """
+
+    def __init__(self, server, watch_media=True, update_server=True, emit_initial=False, min_interval=1.0,
+                 max_interval=30.0, backoff=1.5):
+        self.server = server
+        self.watch_media = watch_media
+        self.update_server = update_server
+        self.emit_initial = emit_initial
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.interval = min_interval
+
+        # The listings from the last poll, or None before the first poll
+        self._templates = None
+        self._media = None
+
+        self._listeners = []
+        self.listener_failures = collections.deque(maxlen=100)
+
+        self._wake = threading.Event()
+        self._thread = None
+        self._running = False
+
+        self.polls = 0
+        self.events = 0
+        self.fetches = 0
+        self.listener_errors = 0
+        self.last_change = None
+
+        self.server.add_connect_callback(self._on_connect)
+
+    def _on_connect(self, server):
+        # Whatever happened while we were disconnected, we'll want to know about it soon
+        self.interval = self.min_interval
+        self._wake.set()
+
+    def add_listener(self, listener):
+        """
+        Registers a function to be called with each :py:data:`CatalogEvent`.
+
+        For example, to keep a :py:class:`~caspartalk.PathSearch.PathIndex` up-to-date::
+
+            def on_change(event):
+                if event.change == CatalogWatcher.REMOVED:
+                    index.remove(event.name)
+                else:
+                    index.add(event.name)
+
+        :param listener: A function that takes a :py:data:`CatalogEvent`.
+        """
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        """
+        Removes a function registered with :py:meth:`add_listener`.
+
+        :param listener: The function to remove.
+        """
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _update_server_templates(self, removed, fetched):
+        templates = [t for t in self.server.templates if t.file_name not in removed and t.file_name not in fetched]
+        templates.extend(fetched[name] for name in sorted(fetched))
+        self.server.templates = templates
+
+    def _diff_templates(self, listing):
+        # Returns the events, and the listing to compare the next poll with
+        if self._templates is None and not self.emit_initial:
+            return [], listing
+
+        old = self._templates or {}
+        added, removed, modified = diff_listings(old, listing)
+
+        fetched = {}
+        kept = dict(listing)
+        for name in added + modified:
+            self.fetches += 1
+            template = amcp.info_template(self.server, name)
+            if template is not None:
+                fetched[name] = template
+            elif name in old:
+                # Remember it as it was, so that the next poll sees that it has changed and tries again
+                kept[name] = old[name]
+            else:
+                del kept[name]
+
+        if self.update_server:
+            self._update_server_templates(set(removed), fetched)
+
+        events = [CatalogEvent("template", REMOVED, name, None, None) for name in removed]
+        events.extend(CatalogEvent("template", ADDED, name, listing[name], fetched.get(name)) for name in added)
+        events.extend(CatalogEvent("template", MODIFIED, name, listing[name], fetched.get(name))
+                      for name in modified)
+        return events, kept
+
+    def _diff_media(self, listing):
+        if self._media is None and not self.emit_initial:
+            return []
+
+        added, removed, modified = diff_listings(self._media or {}, listing)
+        events = [CatalogEvent("media", REMOVED, name, None, None) for name in removed]
+        events.extend(CatalogEvent("media", ADDED, name, listing[name], None) for name in added)
+        events.extend(CatalogEvent("media", MODIFIED, name, listing[name], None) for name in modified)
+        return events
+
+    def poll(self):
+        """
+        Lists the templates (and media) on the server, and reports anything that has changed since the last poll.
+
+        :rtype: List
+        :return: The :py:data:`CatalogEvent` s for the changes found.
+        """
+        events, self._templates = self._diff_templates(amcp.tls_listing(self.server))
+
+        if self.watch_media:
+            try:
+                media_listing = amcp.cls_listing(self.server)
+            except CasparExceptions.CasparError:
+                # Keep the last listing, so that a failed CLS doesn't look like all the media has gone
+                media_listing = self._media
+            if media_listing is not None:
+                events.extend(self._diff_media(media_listing))
+                self._media = media_listing
+
+        self.polls += 1
+        if events:
+            self.events += len(events)
+            self.last_change = time.time()
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * self.backoff, self.max_interval)
+
+        for event in events:
+            for listener in list(self._listeners):
+                self._notify(listener, event)
+
+        return events
+
+    def _notify(self, listener, event):
+        # One broken listener mustn't stop the others hearing about the change, or stop the polling thread
+        try:
+            listener(event)
+        except Exception, e:
+            self.listener_errors += 1
+            self.listener_failures.append((time.time(), listener, event, e))
+
+    def start(self):
+        """
+        Starts a background thread that polls the server, waiting :py:attr:`interval` seconds between polls.
+        """
+        if self._running:
+            return
+
+        self._running = True
+        self._wake.clear()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the background thread started by :py:meth:`start`.
+        """
+        self._running = False
+        self._wake.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def close(self):
+        """
+        Stops polling, and stops listening for the server reconnecting.
+        """
+        self.stop()
+        self.server.remove_connect_callback(self._on_connect)
+
+    def _run(self):
+        while self._running:
+            try:
+                self.poll()
+            except Exception:
+                # Probably disconnected (which can raise anything from a CasparError to an AttributeError, once the
+                # server has been disconnected) - try again later. A reconnect will wake us up.
+                self.interval = min(self.interval * self.backoff, self.max_interval)
+
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def get_stats(self):
+        """
+        :rtype: Dict
+        :return: A dict containing the number of *polls* made, *events* emitted, templates *fetched* with \
+        INFO TEMPLATE and *listener_errors* raised, the current polling *interval* and the time of the *last_change*.
+        """
+        return {"polls": self.polls,
+                "events": self.events,
+                "fetched": self.fetches,
+                "listener_errors": self.listener_errors,
+                "interval": self.interval,
+                "last_change": self.last_change}
@@ -0,0 +1,234 @@
+import bisect
+import collections
+import threading
+import time
+
+# Command priorities - the lower the number, the sooner the command is sent
+ON_AIR = 0
+NORMAL = 1
+INTROSPECTION = 2
+BULK = 3
+
+PRIORITY_NAMES = {ON_AIR: "on_air", NORMAL: "normal", INTROSPECTION: "introspection", BULK: "bulk"}
+
+# The upper bounds, in seconds, of the buckets that waits are counted in. The last bucket counts everything longer.
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+# Commands that change what is on air, and so shouldn't wait behind anything else
+_on_air_commands = frozenset(["PLAY", "STOP", "CLEAR", "PAUSE", "RESUME", "LOAD"])
+_on_air_cg_commands = frozenset(["PLAY", "STOP", "NEXT", "CLEAR", "REMOVE"])
+
+# Commands that only ask the server about itself
+_introspection_commands = frozenset(["INFO", "VERSION", "TLS", "CLS", "THUMBNAIL", "HELP"])
+_introspection_data_commands = frozenset(["LIST", "RETRIEVE"])
+
+
+def priority_of(amcp_command):
+    """
+    Works out how urgent an AMCP command is.
+
+    CG PLAY, STOP, NEXT, CLEAR and REMOVE, and PLAY, STOP, CLEAR, PAUSE, RESUME and LOAD, are :py:data:`ON_AIR`.
+    Queries (INFO, VERSION, TLS, CLS, CG INFO, DATA LIST and DATA RETRIEVE...) are :py:data:`INTROSPECTION`.
+    Everything else is :py:data:`NORMAL`. :py:data:`BULK` is never worked out from the command - it's up to whoever
+    sends a lot of commands at once to ask for it.
+
+    :param str amcp_command: The AMCP command.
+    :rtype: int
+    """
+    words = amcp_command.split(None, 3)
+    if not words:
+        return NORMAL
+
+    verb = words[0].upper()
+    if verb == "CG" and len(words) > 2:
+        subcommand = words[2].upper()
+        if subcommand in _on_air_cg_commands:
+            return ON_AIR
+        if subcommand == "INFO":
+            return INTROSPECTION
+        return NORMAL
+    if verb in _on_air_commands:
+        return ON_AIR
+    if verb in _introspection_commands:
+        return INTROSPECTION
+    if verb == "DATA" and len(words) > 1 and words[1].upper() in _introspection_data_commands:
+        return INTROSPECTION
+    return NORMAL
+
+
+class _Ticket(object):
+    # A thread waiting for its turn. *wake* is held until the thread is handed its turn.
+
+    __slots__ = ("priority", "sequence", "queued_at", "thread", "wake")
+
+    def __init__(self, priority, sequence, queued_at, thread):
+        self.priority = priority
+        self.sequence = sequence
+        self.queued_at = queued_at
+        self.thread = thread
+        self.wake = threading.Lock()
+        self.wake.acquire()
+
+
+class _PriorityStats(object):
+
+    __slots__ = ("queued", "max_queued", "granted", "total_wait", "max_wait", "buckets")
+
+    def __init__(self):
+        self.queued = 0
+        self.max_queued = 0
+        self.granted = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.buckets = [0] * (len(WAIT_BUCKETS) + 1)
+
+    def record_wait(self, wait):
+        self.granted += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.buckets[bisect.bisect_left(WAIT_BUCKETS, wait)] += 1
+
+
+class CommandScheduler(object):
+    """
+    Decides which thread gets to send the next AMCP command to a CasparCG server.
+
+    A CasparServer can only have one command (or pipelined batch of commands) in flight at once, so each
+    :py:class:`~caspartalk.CasparServer` has a CommandScheduler as its :py:attr:`command_lock`. Rather than going
+    first-come, first-served, the thread whose command is most urgent (see :py:func:`priority_of`) goes next - so a
+    CG PLAY doesn't have to wait for a catalog refresh or a bulk dataset load to finish. Threads of the same priority go
+    in the order that they asked.
+
+    To stop less urgent commands from waiting forever on a busy server, a waiting thread's priority is raised by one
+    level for every *aging* seconds that it has waited.
+
+    The scheduler is re-entrant, like an RLock. Using it in a ``with`` statement waits for a turn at :py:data:`NORMAL`
+    priority; use :py:meth:`turn` to ask for a different priority::
+
+        with server.command_lock.turn(CommandScheduler.ON_AIR):
+            ...
+
+    :param float aging: How long, in seconds, a thread waits before its priority is raised by one level.
+    """
+
+    def __init__(self, aging=0.25):
+        self.aging = aging
+
+        self._mutex = threading.Lock()
+        self._owner = None
+        self._depth = 0
+        self._waiting = []
+        self._sequence = 0
+
+        self._stats = collections.defaultdict(_PriorityStats)
+
+    def _effective_priority(self, ticket, now):
+        if self.aging:
+            return ticket.priority - int((now - ticket.queued_at) / self.aging), ticket.sequence
+        return ticket.priority, ticket.sequence
+
+    def acquire(self, priority=NORMAL):
+        """
+        Waits until it is this thread's turn to send commands.
+
+        :param int priority: How urgent the commands are - :py:data:`ON_AIR`, :py:data:`NORMAL`, \
+        :py:data:`INTROSPECTION` or :py:data:`BULK`.
+        """
+        me = threading.current_thread()
+        with self._mutex:
+            if self._owner is me:
+                self._depth += 1
+                return
+
+            stats = self._stats[priority]
+            if self._owner is None:
+                self._owner = me
+                self._depth = 1
+                stats.record_wait(0.0)
+                return
+
+            ticket = _Ticket(priority, self._sequence, time.time(), me)
+            self._sequence += 1
+            self._waiting.append(ticket)
+            stats.queued += 1
+            stats.max_queued = max(stats.max_queued, stats.queued)
+
+        # release() hands the turn straight to the next thread, then lets it go
+        ticket.wake.acquire()
+
+    def release(self):
+        """
+        Ends this thread's turn, handing it to the most urgent waiting thread.
+        """
+        with self._mutex:
+            if self._owner is not threading.current_thread():
+                raise RuntimeError("cannot release un-acquired lock")
+            self._depth -= 1
+            if self._depth:
+                return
+
+            if not self._waiting:
+                self._owner = None
+                return
+
+            now = time.time()
+            ticket = min(self._waiting, key=lambda t: self._effective_priority(t, now))
+            self._waiting.remove(ticket)
+
+            stats = self._stats[ticket.priority]
+            stats.queued -= 1
+            stats.record_wait(now - ticket.queued_at)
+
+            self._owner = ticket.thread
+            self._depth = 1
+            ticket.wake.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+    def turn(self, priority):
+        """
+        :param int priority: How urgent the commands are.
+        :return: A context manager that waits for a turn at *priority*, and ends it afterwards.
+        """
+        return _Turn(self, priority)
+
+    def get_stats(self):
+        """
+        :rtype: Dict
+        :return: A dict of ``{ priority name : stats }``, where *stats* is a dict containing the number of threads \
+        *queued* now, the most that have been queued at once (*max_queued*), the number of turns *granted*, the \
+        *mean_wait* and *max_wait* in seconds, and a *wait_histogram* - a list of ``(upper bound, count)``, with \
+        an upper bound of None for the last bucket (see :py:data:`WAIT_BUCKETS`).
+        """
+        with self._mutex:
+            stats = {}
+            for priority, s in self._stats.iteritems():
+                stats[PRIORITY_NAMES.get(priority, priority)] = {
+                    "queued": s.queued,
+                    "max_queued": s.max_queued,
+                    "granted": s.granted,
+                    "mean_wait": s.total_wait / s.granted if s.granted else 0.0,
+                    "max_wait": s.max_wait,
+                    "wait_histogram": zip(WAIT_BUCKETS + (None,), s.buckets)}
+            return stats
+
+
+class _Turn(object):
+
+    __slots__ = ("scheduler", "priority")
+
+    def __init__(self, scheduler, priority):
+        self.scheduler = scheduler
+        self.priority = priority
+
+    def __enter__(self):
+        self.scheduler.acquire(self.priority)
+        return self.scheduler
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.scheduler.release()
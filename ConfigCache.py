@@ -0,0 +1,233 @@
+import collections
+import hashlib
+import time
+import CasparServer
+import XMLBinding
+import amcp
+
+# A single difference between two ServerConfigs, as found by diff_configs.
+# *path* is a tuple of the attribute names, dict keys and list indices leading to the value that changed - for
+# example ``("channels", 0, "consumers", 1, "device")`` or ``("mixer", "blend_modes")``. *old* and *new* are the
+# values before and after; *old* is None for something that was added, and *new* is None for something that was
+# removed.
+ConfigChange = collections.namedtuple("ConfigChange", ["path", "old", "new"])
+
+
+def fingerprint(response):
+    """
+    Hashes the raw reply to INFO CONFIG, so that two replies can be compared without parsing them.
+
+    :param response: The reply, as a list of lines or a string.
+    :rtype: str
+    :return: The SHA-1 hex digest of the reply.
+    """
+    if isinstance(response, (list, tuple)):
+        response = "\n".join(response)
+    if isinstance(response, unicode):
+        response = response.encode("utf-8")
+    return hashlib.sha1(response).hexdigest()
+
+
+def _is_config_object(value):
+    # The objects that make up a ServerConfig (Channel, Consumer, OSC, AudioConfig, ...) are compared attribute by
+    # attribute. Anything else (strings, numbers, Enum values) is compared as a whole - an EnumValue has a __dict__
+    # too, but only private attributes, so comparing it attribute by attribute would never find a difference.
+    return getattr(value.__class__, "__module__", None) == CasparServer.__name__
+
+
+def _public_attributes(obj):
+    # Private attributes (like AudioConfig._mix_matrices) are derived from the public ones, so aren't worth comparing
+    return dict((name, value) for name, value in vars(obj).iteritems() if not name.startswith("_"))
+
+
+def _match_items(old, new):
+    # Pairs up the items of two lists as (old index, new index), with None for an item only in one of them.
+    # Items of the same type are matched in order, so that removing one consumer from the middle of a channel doesn't
+    # look like every consumer after it has been replaced with a different type.
+    unmatched = collections.defaultdict(collections.deque)
+    for index, item in enumerate(old):
+        unmatched[item.__class__].append(index)
+
+    pairs = []
+    for index, item in enumerate(new):
+        old_indices = unmatched[item.__class__]
+        pairs.append((old_indices.popleft() if old_indices else None, index))
+
+    removed = sorted(index for old_indices in unmatched.itervalues() for index in old_indices)
+    pairs.extend((index, None) for index in removed)
+    return pairs
+
+
+def _diff(old, new, path, changes):
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in sorted(set(old) | set(new)):
+            _diff(old.get(key), new.get(key), path + (key,), changes)
+
+    elif isinstance(old, (list, tuple)) and isinstance(new, (list, tuple)):
+        for old_index, new_index in _match_items(old, new):
+            _diff(old[old_index] if old_index is not None else None,
+                  new[new_index] if new_index is not None else None,
+                  path + (new_index if new_index is not None else old_index,), changes)
+
+    elif _is_config_object(old) and _is_config_object(new) and old.__class__ is new.__class__:
+        _diff(_public_attributes(old), _public_attributes(new), path, changes)
+
+    elif old != new:
+        # Includes one side being missing
+        changes.append(ConfigChange(path, old, new))
+
+
+def diff_configs(old, new):
+    """
+    Compares two :py:class:`~caspartalk.CasparServer.ServerConfig` s, and lists every setting that differs between
+    them.
+
+    Channels, consumers, template hosts and so on are matched up by their type and their order in the config, and
+    list indices in the paths are those in *new* (or in *old*, for something that has been removed). A channel or
+    consumer that has been added or removed is reported as a single :py:data:`ConfigChange`.
+
+    :param ServerConfig old: The earlier config.
+    :param ServerConfig new: The later config.
+    :rtype: List
+    :return: A :py:data:`ConfigChange` for each difference, in the order that they appear in the config.
+    """
+    changes = []
+    _diff(old, new, (), changes)
+    return changes
+
+
+def filter_changes(changes, *prefix):
+    """
+    Picks out the changes to one part of the config.
+
+    For example, ``filter_changes(changes, "channels", 0)`` returns the changes to the first channel (including its
+    consumers), and ``filter_changes(changes, "mixer")`` returns the changes to the mixer settings.
+
+    :param List changes: The :py:data:`ConfigChange` s returned by :py:func:`diff_configs`.
+    :param prefix: The start of the paths to look for.
+    :rtype: List
+    :return: The changes whose *path* starts with *prefix*.
+    """
+    return [change for change in changes if change.path[:len(prefix)] == prefix]
+
+
+def format_path(path):
+    """
+    Formats the *path* of a :py:data:`ConfigChange` for display, e.g. ``channels[0].consumers[1].device``.
+
+    :param tuple path: The path to format.
+    :rtype: str
+    """
+    formatted = ""
+    for part in path:
+        if isinstance(part, (int, long)):
+            formatted += "[{index}]".format(index=part)
+        elif formatted:
+            formatted += ".{name}".format(name=part)
+        else:
+            formatted = str(part)
+    return formatted
+
+
+class ConfigCache(object):
+    """
+    Holds the last :py:class:`~caspartalk.CasparServer.ServerConfig` fetched from a CasparCG server, together with a
+    fingerprint (see :py:func:`fingerprint`) of the raw INFO CONFIG reply that it was parsed from.
+
+    Creating a ConfigCache attaches it to *server*: from then on, :py:func:`~caspartalk.AMCP.info_config` still asks
+    the server for its config, but only parses the reply if its fingerprint differs from the last one. Otherwise, the
+    cached ServerConfig is returned as-is - so it shouldn't be modified by the caller.
+
+    When the config does change, the differences from the previous one are worked out with :py:func:`diff_configs`,
+    and are available from :py:attr:`changes` until the next change. :py:meth:`refresh` is a convenient way to check
+    for configuration drift::
+
+        cache = ConfigCache(server)
+        for change in cache.refresh():
+            print format_path(change.path), change.old, "->", change.new
+
+    :param CasparServer server: The :py:class:`~caspartalk.CasparServer` whose config is cached.
+    """
+
+    def __init__(self, server):
+        self.server = server
+
+        self.config = None
+        self.fingerprint = None
+        self.fetched_at = None
+        self.changed_at = None
+        self.changes = []
+
+        self.fetches = 0
+        self.parses = 0
+
+        server.config_cache = self
+
+    def update(self, response):
+        """
+        Updates the cache from a reply to INFO CONFIG. This is called by :py:func:`~caspartalk.AMCP.info_config`.
+
+        :param response: The reply to INFO CONFIG.
+        :rtype: :py:class:`caspartalk.CasparServer.ServerConfig`
+        :return: The parsed config, which is the cached one if the reply hasn't changed.
+        """
+        self.fetches += 1
+        self.fetched_at = time.time()
+
+        response_fingerprint = fingerprint(response)
+        if response_fingerprint == self.fingerprint:
+            return self.config
+
+        config = XMLBinding.bind(response, XMLBinding.get_schema("config"))
+        self.parses += 1
+
+        if self.config is not None and config is not None:
+            self.changes = diff_configs(self.config, config)
+        else:
+            self.changes = []
+
+        self.config = config
+        self.fingerprint = response_fingerprint
+        self.changed_at = self.fetched_at
+        return config
+
+    def refresh(self):
+        """
+        Fetches the config from the server, and reports how it differs from the one fetched last time.
+
+        :rtype: List
+        :return: The :py:data:`ConfigChange` s since the last fetch - empty if nothing has changed, or if this is \
+        the first fetch.
+        """
+        last_fingerprint = self.fingerprint
+        amcp.info_config(self.server)
+        if self.fingerprint == last_fingerprint:
+            return []
+        return self.changes
+
+    def clear(self):
+        """
+        Forgets the cached config, so that the next reply is parsed regardless.
+        """
+        self.config = None
+        self.fingerprint = None
+        self.changes = []
+
+    def close(self):
+        """
+        Detaches the cache from the server, so that :py:func:`~caspartalk.AMCP.info_config` parses every reply again.
+        """
+        if self.server.config_cache is self:
+            self.server.config_cache = None
+
+    def get_stats(self):
+        """
+        :rtype: Dict
+        :return: A dict containing the number of times the config has been *fetched* and *parsed*, the current \
+        *fingerprint*, and the times it was last fetched (*fetched_at*) and last changed (*changed_at*).
+        """
+        return {"fetched": self.fetches,
+                "parsed": self.parses,
+                "fingerprint": self.fingerprint,
+                "fetched_at": self.fetched_at,
+                "changed_at": self.changed_at}
@@ -0,0 +1,188 @@
+import collections
+import CommandScheduler
+import amcp
+
+
+def _dataset_size(name, data):
+    # Roughly how much memory a dataset takes up - good enough for keeping the cache within its budget
+    return len(name) + sum(len(line) for line in data)
+
+
+class DatasetCache(object):
+    """
+    A local copy of the datasets stored on a CasparCG server, so that saved graphics can be recalled without a round
+    trip to the server.
+
+    Creating a DatasetCache attaches it to *server*: from then on, :py:func:`~caspartalk.AMCP.data_retrieve` is served
+    from the cache where possible, and :py:func:`~caspartalk.AMCP.data_store` and
+    :py:func:`~caspartalk.AMCP.data_remove` keep the cache up-to-date.
+
+    Datasets are held in the same form that :py:func:`~caspartalk.AMCP.data_retrieve` returns them - a list of lines.
+    When the cache holds more than *max_bytes* of data, the least-recently used datasets are evicted.
+
+    If *populate_on_connect* is True, every dataset on the server is fetched (with pipelined DATA RETRIEVE commands)
+    straight away, and again each time the server reconnects.
+
+    :param CasparServer server: The :py:class:`~caspartalk.CasparServer` whose datasets are cached.
+    :param int max_bytes: The maximum amount of data to hold.
+    :param bool populate_on_connect: If True, fetch every dataset up-front and after every reconnect.
+    :param int pipeline_depth: The number of DATA RETRIEVE commands to have in flight at once when populating.
+    """
+
+    def __init__(self, server, max_bytes=64 * 1024 * 1024, populate_on_connect=True, pipeline_depth=32):
+        self.server = server
+        self.max_bytes = max_bytes
+        self.pipeline_depth = pipeline_depth
+
+        # Least-recently used first. { name : list of lines }
+        self._datasets = collections.OrderedDict()
+        self._size = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        server.dataset_cache = self
+        if populate_on_connect:
+            server.add_connect_callback(self._on_connect)
+            self.populate()
+
+    def _on_connect(self, server):
+        self.clear()
+        self.populate()
+
+    def _put(self, name, data):
+        self._discard(name)
+        size = _dataset_size(name, data)
+        if size > self.max_bytes:
+            # Too big to cache at all
+            return
+
+        while self._datasets and self._size + size > self.max_bytes:
+            oldest = next(iter(self._datasets))
+            self._discard(oldest)
+            self.evictions += 1
+
+        self._datasets[name] = data
+        self._size += size
+
+    def _discard(self, name):
+        data = self._datasets.pop(name, None)
+        if data is not None:
+            self._size -= _dataset_size(name, data)
+
+    def populate(self, names=None):
+        """
+        Fetches datasets from the server in bulk, using pipelined DATA RETRIEVE commands.
+
+        :param names: The names of the datasets to fetch. If None, every dataset listed by DATA LIST is fetched.
+        :rtype: int
+        :return: The number of datasets fetched.
+        """
+        if names is None:
+            names = amcp.data_list(self.server) or []
+            names = [n.strip() for n in names if n.strip()]
+
+        commands = ["DATA RETRIEVE {name}".format(name=name) for name in names]
+        responses = self.server.send_amcp_commands(commands, self.pipeline_depth, CommandScheduler.BULK)
+
+        fetched = 0
+        for name, response in zip(names, responses):
+            if isinstance(response, Exception):
+                continue
+            self._put(name, response or [])
+            fetched += 1
+
+        return fetched
+
+    def get(self, name):
+        """
+        Gets a dataset from the cache, without going to the server.
+
+        :param str name: The name of the dataset.
+        :rtype: List
+        :return: The dataset, or None if it isn't cached.
+        """
+        data = self._datasets.get(name)
+        if data is None:
+            return None
+        # Mark it as recently used
+        del self._datasets[name]
+        self._datasets[name] = data
+        return data
+
+    def retrieve(self, name):
+        """
+        Gets a dataset, from the cache if it's there, otherwise from the server (in which case it's then cached).
+
+        :param str name: The name of the dataset.
+        :rtype: List
+        :return: The dataset, or False if it couldn't be retrieved - see :py:func:`~caspartalk.AMCP.data_retrieve`.
+        """
+        data = self.get(name)
+        if data is not None:
+            self.hits += 1
+            return data
+
+        self.misses += 1
+        data = amcp.data_retrieve(self.server, name, use_cache=False)
+        if data is not False:
+            self._put(name, data or [])
+        return data
+
+    def stored(self, name, data):
+        """
+        Called by :py:func:`~caspartalk.AMCP.data_store` once *data* has been stored on the server.
+
+        :param str name: The name of the dataset.
+        :param data: The data that was stored.
+        """
+        if isinstance(data, basestring):
+            self._put(name, [line for line in data.splitlines() if len(line)])
+        else:
+            # We can't be sure how the server will give this back to us, so fetch it next time it's needed
+            self._discard(name)
+
+    def removed(self, name):
+        """
+        Called by :py:func:`~caspartalk.AMCP.data_remove` once the dataset has been removed from the server.
+
+        :param str name: The name of the dataset.
+        """
+        self._discard(name)
+
+    def clear(self):
+        """
+        Empties the cache.
+        """
+        self._datasets.clear()
+        self._size = 0
+
+    def close(self):
+        """
+        Empties the cache and detaches it from the server.
+        """
+        self.server.remove_connect_callback(self._on_connect)
+        if self.server.dataset_cache is self:
+            self.server.dataset_cache = None
+        self.clear()
+
+    def __contains__(self, name):
+        return name in self._datasets
+
+    def __len__(self):
+        return len(self._datasets)
+
+    def get_stats(self):
+        """
+        :rtype: Dict
+        :return: A dict containing the number of *datasets* and *bytes* held, the number of *hits*, *misses* and \
+        *evictions*, and the *hit_rate*.
+        """
+        lookups = self.hits + self.misses
+        return {"datasets": len(self._datasets),
+                "bytes": self._size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": float(self.hits) / lookups if lookups else None}
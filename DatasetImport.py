@@ -0,0 +1,306 @@
+import csv
+import json
+import os
+import time
+import AMCPCommands
+import CommandScheduler
+
+# How much of a JSON file to read at once when streaming it
+JSON_CHUNK_SIZE = 64 * 1024
+
+
+def iter_csv_rows(path):
+    """
+    Streams the rows of a CSV file, one at a time. The first row of the file must contain the column names.
+
+    :param str path: The path to the CSV file.
+    :return: A generator of dicts of the form ``{ column : value, ... }``.
+    """
+    with open(path, "rb") as f:
+        for row in csv.DictReader(f):
+            yield row
+
+
+def iter_json_rows(path):
+    """
+    Streams the rows of a JSON file, one at a time, without loading the whole file. The file can either be a single
+    array of objects, or contain one object per line (JSON Lines).
+
+    :param str path: The path to the JSON file.
+    :return: A generator of dicts of the form ``{ column : value, ... }``.
+    """
+    decoder = json.JSONDecoder()
+
+    with open(path, "rb") as f:
+        buf = ""
+        eof = False
+        in_array = None
+
+        while True:
+            # Skip anything between objects - whitespace, and the array's brackets and commas
+            buf = buf.lstrip()
+            if in_array is None and buf:
+                in_array = buf[0] == "["
+                if in_array:
+                    buf = buf[1:]
+                continue
+            if in_array:
+                buf = buf.lstrip(", \t\r\n")
+                if buf.startswith("]"):
+                    return
+
+            if buf:
+                try:
+                    row, end = decoder.raw_decode(buf)
+                except ValueError:
+                    # Probably only part of an object - read some more, unless there's nothing left
+                    if eof:
+                        raise
+                    row = None
+
+                if row is not None:
+                    buf = buf[end:]
+                    yield row
+                    continue
+
+            if eof:
+                return
+            chunk = f.read(JSON_CHUNK_SIZE)
+            if not chunk:
+                eof = True
+            buf += chunk
+
+
+def iter_rows(path):
+    """
+    Streams the rows of a CSV or JSON file, depending on its extension - see :py:func:`iter_csv_rows` and
+    :py:func:`iter_json_rows`.
+
+    :param str path: The path to the file.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        return iter_csv_rows(path)
+    if ext in (".json", ".jsonl"):
+        return iter_json_rows(path)
+    raise ValueError("Don't know how to read {path} - expected a .csv, .json or .jsonl file".format(path=path))
+
+
+class ImportStats(object):
+    """
+    The progress of a :py:class:`DatasetImporter`.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.stored = 0
+        self.failed = 0
+        self.skipped = 0
+        self.started = time.time()
+        self.finished = None
+
+    def get_elapsed(self):
+        """
+        :rtype: float
+        :return: The number of seconds that the import has been running for (or ran for, if it has finished).
+        """
+        return (self.finished or time.time()) - self.started
+
+    def get_rows_per_second(self):
+        """
+        :rtype: float
+        :return: The number of rows stored or failed per second.
+        """
+        elapsed = self.get_elapsed()
+        if elapsed <= 0:
+            return 0.0
+        return (self.stored + self.failed) / elapsed
+
+    def __repr__(self):
+        return "{name} {stored} stored, {failed} failed, {skipped} skipped, {rate:.1f} rows/s".format(
+            name=type(self).__name__, stored=self.stored, failed=self.failed, skipped=self.skipped,
+            rate=self.get_rows_per_second())
+
+
+class DatasetImporter(object):
+    """
+    Imports rows from a CSV or JSON file as CasparCG datasets, one dataset per row - for example, to pre-build
+    thousands of results graphics.
+
+    Each row's columns are mapped onto the fields of *template*. By default, a column is used if its name is the ID of
+    one of the Template's *parameters* (or *instances*); *mapping* can be given to map other column names, in the form
+    ``{ column : field, ... }``. The mapped fields are checked (and converted to the right types) with the Template's
+    :py:class:`~caspartalk.TemplateValidation.TemplateValidator`, then rendered as ``<templateData>`` XML with its
+    :py:class:`~caspartalk.TemplateData.TemplateDataSerializer`. Rows that fail validation aren't stored.
+
+    The name of each dataset is made by formatting *name_format* with the row, e.g. ``"results/{constituency}"``.
+
+    DATA STORE commands are pipelined, with at most *pipeline_depth* waiting for a response at once. If
+    *checkpoint_path* is given, progress is saved there after every batch, so that an import that fails part-way
+    through can be resumed by running it again with the same *checkpoint_path*. The checkpoint records the first row
+    that hasn't been stored yet - which is the first row whose DATA STORE failed, if any did, so that it is retried -
+    together with the size and modification time of the file being imported, and is ignored if the file has changed
+    since. Once every row has been stored, the checkpoint is deleted.
+
+    :param CasparServer server: The :py:class:`~caspartalk.CasparServer` to store the datasets on.
+    :param Template template: The :py:class:`~caspartalk.CasparObjects.Template` that the datasets are for.
+    :param str name_format: The format of the dataset names.
+    :param dict mapping: Extra column to field mappings.
+    :param int pipeline_depth: The number of DATA STORE commands to have in flight at once.
+    :param str checkpoint_path: The file to save progress to.
+    """
+
+    def __init__(self, server, template, name_format, mapping=None, pipeline_depth=32, checkpoint_path=None):
+        self.server = server
+        self.template = template
+        self.name_format = name_format
+        self.pipeline_depth = pipeline_depth
+        self.checkpoint_path = checkpoint_path
+
+        self.fields = set(template.parameters.keys()) | set(template.instances.keys())
+        self.mapping = dict((f, f) for f in self.fields)
+        if mapping:
+            self.mapping.update(mapping)
+
+        self.serializer = template.get_data_serializer()
+        self.validator = template.get_validator()
+
+        # The rows that couldn't be stored, as (row_number, dataset_name, error). Validation errors are FieldErrors.
+        self.errors = []
+
+    def map_row(self, row):
+        """
+        Picks out the template fields from a row.
+
+        :param dict row: The row, of the form ``{ column : value, ... }``.
+        :rtype: dict
+        :return: The template data, of the form ``{ field : value, ... }``.
+        """
+        data = {}
+        for column, value in row.iteritems():
+            field = self.mapping.get(column)
+            if field is not None and value is not None:
+                data[field] = value
+        return data
+
+    def _load_checkpoint(self, source):
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return 0
+        with open(self.checkpoint_path, "rb") as f:
+            checkpoint = json.load(f)
+        if checkpoint.get("source") != source:
+            # Saved while importing something else (or an earlier version of the same file)
+            return 0
+        return checkpoint.get("rows_done", 0)
+
+    def _save_checkpoint(self, rows_done, source):
+        if not self.checkpoint_path:
+            return
+        # Write to a temporary file first, so that a crash can't leave a half-written checkpoint
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            json.dump({"source": source, "rows_done": rows_done}, f)
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+        os.rename(tmp_path, self.checkpoint_path)
+
+    def _remove_checkpoint(self):
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+    def _send_batch(self, batch, stats):
+        # Returns the number of the first row in the batch that couldn't be stored, or None if they all were
+        # The names are made from the rows, so may well have spaces or quotes in them
+        commands = ["DATA STORE {name} {data}".format(name=AMCPCommands.encode_string(name),
+                                                      data=self.serializer.serialize_amcp(data))
+                    for row_number, name, data in batch]
+        responses = self.server.send_amcp_commands(commands, self.pipeline_depth, CommandScheduler.BULK)
+
+        first_failed = None
+        for (row_number, name, data), response in zip(batch, responses):
+            if isinstance(response, Exception):
+                stats.failed += 1
+                self.errors.append((row_number, name, response))
+                if first_failed is None:
+                    first_failed = row_number
+            else:
+                stats.stored += 1
+                if self.server.dataset_cache is not None:
+                    self.server.dataset_cache.stored(name, self.serializer.serialize(data))
+        return first_failed
+
+    def import_rows(self, rows, resume=True, progress=None, source=None):
+        """
+        Imports rows from any iterable of dicts.
+
+        :param rows: The rows to import.
+        :param bool resume: If True and there is a checkpoint for *source*, skip the rows that were stored last time.
+        :param progress: A function to call with the :py:class:`ImportStats` after every batch.
+        :param source: Something that identifies where the rows come from, which is saved in the checkpoint so that \
+        it is only resumed from when importing the same rows. It must be JSON serializable.
+        :rtype: :py:class:`ImportStats`
+        """
+        stats = ImportStats()
+        skip = self._load_checkpoint(source) if resume else 0
+        # Rows that failed validation would only fail again, but those whose DATA STORE failed are worth retrying, so
+        # the checkpoint never moves past the first of them
+        first_failed = None
+
+        batch = []
+        for row_number, row in enumerate(rows):
+            stats.rows += 1
+            if row_number < skip:
+                stats.skipped += 1
+                continue
+
+            try:
+                name = self.name_format.format(**row)
+            except KeyError, e:
+                stats.failed += 1
+                self.errors.append((row_number, None, e))
+                continue
+
+            field_errors = []
+            data = self.validator.validate_row(self.map_row(row), row_number, field_errors)
+            if data is None:
+                stats.failed += 1
+                self.errors.extend((row_number, name, e) for e in field_errors)
+                continue
+            batch.append((row_number, name, data))
+
+            if len(batch) >= self.pipeline_depth:
+                failed = self._send_batch(batch, stats)
+                if first_failed is None:
+                    first_failed = failed
+                self._save_checkpoint(row_number + 1 if first_failed is None else first_failed, source)
+                batch = []
+                if progress:
+                    progress(stats)
+
+        if batch:
+            failed = self._send_batch(batch, stats)
+            if first_failed is None:
+                first_failed = failed
+
+        if first_failed is None:
+            self._remove_checkpoint()
+        else:
+            self._save_checkpoint(first_failed, source)
+
+        stats.finished = time.time()
+        if progress:
+            progress(stats)
+        return stats
+
+    def import_file(self, path, resume=True, progress=None):
+        """
+        Imports every row of a CSV or JSON file - see :py:func:`iter_rows` and :py:meth:`import_rows`.
+
+        :param str path: The path to the file.
+        :param bool resume: If True and there is a checkpoint for this file, skip the rows that were stored last time.
+        :param progress: A function to call with the :py:class:`ImportStats` after every batch.
+        :rtype: :py:class:`ImportStats`
+        """
+        st = os.stat(path)
+        source = {"path": os.path.abspath(path), "size": st.st_size, "mtime": st.st_mtime}
+        return self.import_rows(iter_rows(path), resume, progress, source)
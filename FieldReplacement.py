@@ -0,0 +1,417 @@
+import re
+import threading
+import time
+import amcp
+
+# Dynamic fields are written into template data as {{name}}, where *name* is the name of a plugin that returns the
+# string to put in its place - e.g. {{clock}} is replaced by the current time, every time the engine ticks.
+
+_placeholder = re.compile(r"{{\s*([A-Za-z_][A-Za-z0-9_.]*)\s*}}")
+
+
+class RenderPlan(object):
+    """
+    A field value that contains one or more ``{{name}}`` placeholders, parsed once into the literal pieces of text and
+    the names of the plugins that go between them.
+
+    :param str text: The field value to parse.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.parts = []
+
+        pos = 0
+        for match in _placeholder.finditer(text):
+            if match.start() > pos:
+                self.parts.append((False, text[pos:match.start()]))
+            self.parts.append((True, match.group(1)))
+            pos = match.end()
+        if pos < len(text):
+            self.parts.append((False, text[pos:]))
+
+        # The set of plugins that this field depends on
+        self.plugins = frozenset(part for is_plugin, part in self.parts if is_plugin)
+
+    def render(self, values):
+        """
+        Fills in the placeholders.
+
+        :param dict values: The current value of each plugin, of the form ``{ plugin_name : string, ... }``. \
+        Placeholders for plugins that have no value are left as they are.
+        :rtype: str
+        :return: The rendered field value.
+        """
+        out = []
+        for is_plugin, part in self.parts:
+            if not is_plugin:
+                out.append(part)
+            elif part in values:
+                out.append(values[part])
+            else:
+                out.append("{{" + part + "}}")
+        return "".join(out)
+
+
+def compile_field(value):
+    """
+    Parses a field value into a :py:class:`RenderPlan`.
+
+    :param value: The value of a field in a template's data.
+    :rtype: :py:class:`RenderPlan`
+    :return: The render plan, or None if *value* isn't a string or has no placeholders in it.
+    """
+    if not isinstance(value, basestring) or "{{" not in value:
+        return None
+    plan = RenderPlan(value)
+    if not plan.plugins:
+        return None
+    return plan
+
+
+def make_clock():
+    """
+    The ``{{clock}}`` plugin.
+
+    :rtype: str
+    :return: The current local time, as HH:MM:SS.
+    """
+    return time.strftime("%H:%M:%S")
+
+
+class PluginRegistry(object):
+    """
+    Holds the plugins that can be used in dynamic fields. A plugin is simply a function that takes no arguments and
+    returns a string.
+
+    Example:
+
+        >>> registry = PluginRegistry()
+        >>> registry.register("score", lambda: "{0} - {1}".format(home, away))
+
+    Each plugin can be given an *interval*: the minimum number of seconds between calls to it. A plugin without an
+    interval is called on every tick.
+
+    The ``clock`` plugin is registered by default.
+    """
+
+    def __init__(self, include_defaults=True):
+        # { name : (function, interval) }
+        self._plugins = {}
+
+        if include_defaults:
+            self.register("clock", make_clock, 1.0)
+
+    def register(self, name, function, interval=None):
+        """
+        Registers a plugin under the name *name*, replacing any plugin already registered under that name.
+
+        :param str name: The name used in placeholders, e.g. "clock" for ``{{clock}}``.
+        :param function: The function that returns the plugin's value.
+        :param float interval: The minimum number of seconds between calls to *function*.
+        """
+        if not callable(function):
+            raise TypeError("Expected a function for plugin {name}, got {wrong_t}".format(name=name,
+                                                                                        wrong_t=type(function)))
+        self._plugins[name] = (function, interval)
+
+    def unregister(self, name):
+        """
+        Removes the plugin registered under *name*.
+
+        :param str name: The name of the plugin.
+        """
+        self._plugins.pop(name, None)
+
+    def plugin(self, name, interval=None):
+        """
+        A decorator that registers the decorated function as a plugin.
+
+        Example:
+
+            >>> @registry.plugin("date", interval=60)
+            ... def make_date():
+            ...     return time.strftime("%d/%m/%Y")
+        """
+        def decorator(function):
+            self.register(name, function, interval)
+            return function
+        return decorator
+
+    def get(self, name):
+        """
+        :param str name: The name of the plugin.
+        :return: A tuple of ``(function, interval)``, or None if there is no plugin called *name*.
+        """
+        return self._plugins.get(name)
+
+    def __contains__(self, name):
+        return name in self._plugins
+
+
+class _Layer(object):
+    # A CG layer with dynamic fields on it
+
+    def __init__(self, channel, layer, cg_layer, data, template):
+        self.key = (channel, layer, cg_layer)
+        self.template = template
+        # { field : RenderPlan } for the dynamic fields only
+        self.plans = {}
+        # { field : the value last sent to the template }
+        self.rendered = {}
+
+        for field, value in data.iteritems():
+            plan = compile_field(value)
+            if plan:
+                self.plans[field] = plan
+
+        self.plugins = frozenset().union(*[plan.plugins for plan in self.plans.values()])
+
+
+class FieldEngine(object):
+    """
+    Keeps the dynamic fields of every on-air template up-to-date.
+
+    Templates are registered with :py:meth:`add_layer`, along with their data; any field containing a ``{{name}}``
+    placeholder is parsed once into a :py:class:`RenderPlan`. Each call to :py:meth:`tick` then:
+
+    #. Calls each plugin that an on-air layer depends on (and that is due), at most once - the result is shared by \
+    every layer that uses it.
+    #. Re-renders only the fields that depend on plugins whose values have changed.
+    #. Sends :py:func:`~caspartalk.AMCP.cg_update` only to layers where a rendered value has actually changed, \
+    containing only the changed fields.
+
+    Call :py:meth:`tick` from your own loop, or use :py:meth:`start` to tick from a background thread.
+
+    A plugin that raises an exception keeps its last value, and the exception is recorded in
+    :py:attr:`plugin_failures` until the plugin next succeeds.
+
+    :param CasparServer server: The :py:class:`~caspartalk.CasparServer` that the updates are sent to.
+    :param PluginRegistry registry: The plugins available to the templates. If None, a registry containing only \
+    the default plugins is used.
+    :param CGUpdateCoalescer coalescer: If given, updates are submitted to this \
+    :py:class:`~caspartalk.CGUpdateCoalescer.CGUpdateCoalescer` rather than sent straight away.
+
+    :ivar plugin_failures: A dict of ``{ plugin_name : (time, exception) }`` for each plugin that raised an \
+    exception the last time it was called.
+    """
+
+    def __init__(self, server, registry=None, coalescer=None):
+        self.server = server
+        self.registry = registry if registry is not None else PluginRegistry()
+        self.coalescer = coalescer
+
+        # { (channel, layer, cg_layer) : _Layer }
+        self._layers = {}
+        # { plugin_name : set of (channel, layer, cg_layer) }
+        self._dependents = {}
+        # { plugin_name : last value }
+        self._values = {}
+        # { plugin_name : time last called }
+        self._last_called = {}
+        # { plugin_name : (time, exception) } for the plugins that failed the last time they were called
+        self.plugin_failures = {}
+
+        self._lock = threading.RLock()
+        self._thread = None
+        self._running = False
+
+        self.ticks = 0
+        self.plugin_calls = 0
+        self.plugin_errors = 0
+        self.updates_sent = 0
+
+    def add_layer(self, channel, layer, cg_layer, data, template=None):
+        """
+        Starts keeping the dynamic fields in *data* up-to-date on a CG layer. The template should already have been
+        added to the layer (with :py:func:`~caspartalk.AMCP.cg_add`); call :py:meth:`render` to get the data to add
+        it with.
+
+        :param int channel: The number of the channel containing the template.
+        :param int layer: The number of the layer containing the template.
+        :param int cg_layer: The number of the CG layer containing the template.
+        :param dict data: The template's data, which may contain ``{{name}}`` placeholders.
+        :param Template template: The Template on the CG layer - see :py:func:`~caspartalk.AMCP.cg_update`.
+        :rtype: Bool
+        :return: True if *data* contains dynamic fields (and so the layer will be kept up-to-date), otherwise False.
+        """
+        with self._lock:
+            self.remove_layer(channel, layer, cg_layer)
+
+            l = _Layer(channel, layer, cg_layer, data, template)
+            if not l.plans:
+                return False
+
+            self._layers[l.key] = l
+            for name in l.plugins:
+                self._dependents.setdefault(name, set()).add(l.key)
+
+            # Whatever was rendered when the template was added counts as already sent
+            for field, plan in l.plans.iteritems():
+                l.rendered[field] = plan.render(self._values)
+
+            return True
+
+    def remove_layer(self, channel, layer, cg_layer):
+        """
+        Stops updating the dynamic fields on a CG layer, e.g. because the template has been taken off air.
+
+        :param int channel: The number of the channel containing the template.
+        :param int layer: The number of the layer containing the template.
+        :param int cg_layer: The number of the CG layer containing the template.
+        """
+        with self._lock:
+            l = self._layers.pop((channel, layer, cg_layer), None)
+            if l is None:
+                return
+
+            for name in l.plugins:
+                dependents = self._dependents.get(name)
+                if dependents:
+                    dependents.discard(l.key)
+                    if not dependents:
+                        del self._dependents[name]
+
+    def render(self, data, now=None):
+        """
+        Renders every dynamic field in *data* with up-to-date plugin values, e.g. to send with
+        :py:func:`~caspartalk.AMCP.cg_add`.
+
+        :param dict data: The template's data, which may contain ``{{name}}`` placeholders.
+        :param float now: The current time, as given by ``time.time()``.
+        :rtype: dict
+        :return: A copy of *data* with the placeholders filled in.
+        """
+        plans = {}
+        needed = set()
+        for field, value in data.iteritems():
+            plan = compile_field(value)
+            if plan:
+                plans[field] = plan
+                needed.update(plan.plugins)
+
+        with self._lock:
+            self._evaluate(needed, now if now is not None else time.time())
+            rendered = dict(data)
+            for field, plan in plans.iteritems():
+                rendered[field] = plan.render(self._values)
+
+        return rendered
+
+    def _evaluate(self, names, now):
+        # Calls each plugin in *names* that is due, at most once. Returns the set of plugins whose values changed.
+        changed = set()
+        for name in names:
+            plugin = self.registry.get(name)
+            if plugin is None:
+                continue
+            function, interval = plugin
+
+            last = self._last_called.get(name)
+            if interval and last is not None and now - last < interval:
+                continue
+
+            self._last_called[name] = now
+            self.plugin_calls += 1
+            try:
+                value = function()
+            except Exception, e:
+                self.plugin_errors += 1
+                self.plugin_failures[name] = (now, e)
+                continue
+            self.plugin_failures.pop(name, None)
+
+            if not isinstance(value, basestring):
+                value = str(value)
+            if self._values.get(name) != value:
+                self._values[name] = value
+                changed.add(name)
+
+        return changed
+
+    def tick(self, now=None):
+        """
+        Brings every registered layer up-to-date - see :py:class:`FieldEngine`.
+
+        :param float now: The current time, as given by ``time.time()``.
+        :rtype: int
+        :return: The number of layers that were sent updates.
+        """
+        if now is None:
+            now = time.time()
+
+        updates = []
+        with self._lock:
+            self.ticks += 1
+            changed = self._evaluate(self._dependents.keys(), now)
+            if not changed:
+                return 0
+
+            affected = set()
+            for name in changed:
+                affected.update(self._dependents.get(name, ()))
+
+            for key in affected:
+                l = self._layers[key]
+                changes = {}
+                for field, plan in l.plans.iteritems():
+                    if plan.plugins.isdisjoint(changed):
+                        continue
+                    value = plan.render(self._values)
+                    if l.rendered.get(field) != value:
+                        l.rendered[field] = value
+                        changes[field] = value
+                if changes:
+                    updates.append((key, changes, l.template))
+
+        for (channel, layer, cg_layer), changes, template in updates:
+            if self.coalescer is not None:
+                self.coalescer.submit(channel, layer, cg_layer, changes, template)
+            else:
+                amcp.cg_update(self.server, channel, layer, cg_layer, changes, template=template)
+            self.updates_sent += 1
+
+        return len(updates)
+
+    def get_stats(self):
+        """
+        :rtype: Dict
+        :return: A dict containing the number of *layers* being kept up-to-date, the number of *ticks*, \
+        *plugin_calls*, *plugin_errors* and *updates_sent* so far, and the names of the *failing_plugins* - see \
+        :py:attr:`plugin_failures`.
+        """
+        with self._lock:
+            return {"layers": len(self._layers),
+                    "ticks": self.ticks,
+                    "plugin_calls": self.plugin_calls,
+                    "plugin_errors": self.plugin_errors,
+                    "failing_plugins": sorted(self.plugin_failures),
+                    "updates_sent": self.updates_sent}
+
+    def start(self, interval=0.1):
+        """
+        Starts a background thread that calls :py:meth:`tick` every *interval* seconds.
+
+        :param float interval: The number of seconds between ticks.
+        """
+        if self._running:
+            return
+
+        self._running = True
+        self._thread = threading.Thread(target=self._run, args=(interval,))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the background thread started by :py:meth:`start`.
+        """
+        self._running = False
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self, interval):
+        while self._running:
+            self.tick()
+            time.sleep(interval)
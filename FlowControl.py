@@ -0,0 +1,241 @@
+import collections
+import threading
+import time
+import CasparExceptions
+import CommandScheduler
+
+
+class TokenBucket(object):
+    """
+    Limits the rate that commands are sent at, while allowing short bursts.
+
+    The bucket holds up to *burst* tokens, and is refilled at *rate* tokens per second. Each command takes one token,
+    waiting for the bucket to refill if it is empty.
+
+    :param float rate: The long-term number of commands per second.
+    :param float burst: The most commands that can be sent at once after a quiet spell. Defaults to *rate* (i.e. one \
+    second's worth).
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(rate, 1))
+        self._tokens = self.burst
+        self._updated = time.time()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens=1):
+        """
+        Takes tokens from the bucket, going into debt if there aren't enough.
+
+        :param int tokens: The number of tokens to take.
+        :rtype: float
+        :return: How long, in seconds, to wait before the tokens can be used.
+        """
+        with self._lock:
+            now = time.time()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def take(self, tokens=1):
+        """
+        Takes tokens from the bucket, waiting until they're available.
+
+        :param int tokens: The number of tokens to take.
+        """
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+
+class FlowController(object):
+    """
+    Stops a CasparCG server from being sent more commands than it can keep up with.
+
+    Creating a FlowController attaches it to *server*. From then on, no more than :py:attr:`window` commands are left
+    waiting for their replies at once - this matters for pipelined commands (see
+    :py:meth:`~caspartalk.CasparServer.send_amcp_commands`), and for commands sent from several threads to a server
+    that supports request IDs.
+
+    The window is adjusted AIMD-style, in the same way as TCP's congestion window. It starts at *initial_window* and
+    grows quickly (by one for every reply) until the server first shows signs of falling behind, then slowly (by one
+    for every window's worth of replies). The server is taken to be falling behind when a reply takes more than
+    *rtt_tolerance* times as long as the quickest recent reply (and more than *rtt_slack* longer), or when it answers with an internal server error
+    (500, 501); the window is then cut by *decrease*, no more than once per round trip.
+
+    Each class of command (see :py:mod:`~caspartalk.CommandScheduler`) can also be given a rate limit with
+    :py:meth:`set_rate`. None are set by default.
+
+    :param CasparServer server: The :py:class:`~caspartalk.CasparServer` whose commands are controlled.
+    :param int initial_window: The number of commands allowed in flight to start with.
+    :param int min_window: The smallest the window can get.
+    :param int max_window: The largest the window can get.
+    :param float rtt_tolerance: How many times the quickest recent round trip a reply can take before the server is \
+    taken to be falling behind.
+    :param float rtt_slack: How much longer, in seconds, than the quickest recent round trip a reply can always take. \
+    On a fast network, round trips are so short that ordinary jitter would otherwise look like the server falling \
+    behind.
+    :param float decrease: What the window is multiplied by when the server falls behind.
+    :param float throughput_period: The period, in seconds, that throughput is measured over.
+    """
+
+    # The round trips that the quickest recent one is taken from
+    RTT_SAMPLES = 64
+
+    def __init__(self, server, initial_window=4, min_window=1, max_window=64, rtt_tolerance=3.0, rtt_slack=0.01,
+                 decrease=0.5, throughput_period=5.0):
+        self.server = server
+        self.min_window = min_window
+        self.max_window = max_window
+        self.rtt_tolerance = rtt_tolerance
+        self.rtt_slack = rtt_slack
+        self.decrease = decrease
+        self.throughput_period = throughput_period
+
+        self.window = float(initial_window)
+        # Below this, the window grows by one for every reply ("slow start")
+        self.slow_start_threshold = float(max_window)
+        self.in_flight = 0
+
+        self._condition = threading.Condition(threading.Lock())
+        self._buckets = {}
+
+        self._rtts = collections.deque(maxlen=self.RTT_SAMPLES)
+        self.smoothed_rtt = None
+        self._last_decrease = 0.0
+        self._completions = collections.deque()
+
+        self.completed = 0
+        self.errors = 0
+        self.decreases = 0
+
+        server.flow_control = self
+
+    def set_rate(self, command_class, rate, burst=None):
+        """
+        Limits the rate that one class of command is sent at.
+
+        :param int command_class: A priority from :py:mod:`~caspartalk.CommandScheduler`, e.g. \
+        :py:data:`~caspartalk.CommandScheduler.BULK`.
+        :param float rate: The number of commands per second, or None to remove the limit.
+        :param float burst: The number of commands that can be sent at once - see :py:class:`TokenBucket`.
+        """
+        if rate is None:
+            self._buckets.pop(command_class, None)
+        else:
+            self._buckets[command_class] = TokenBucket(rate, burst)
+
+    def get_window(self):
+        """
+        :rtype: int
+        :return: The number of commands that may be in flight at once right now.
+        """
+        return max(self.min_window, int(self.window))
+
+    def acquire(self, command_class=CommandScheduler.NORMAL, count=1):
+        """
+        Waits until *count* more commands can be sent. This is called by
+        :py:meth:`~caspartalk.CasparServer.send_amcp_command` and
+        :py:meth:`~caspartalk.CasparServer.send_amcp_commands`.
+
+        :param int command_class: The class of the commands, for rate limiting.
+        :param int count: The number of commands to be sent.
+        """
+        bucket = self._buckets.get(command_class)
+        if bucket is not None:
+            bucket.take(count)
+
+        with self._condition:
+            # A batch bigger than the window is let through on its own, rather than waiting forever
+            while self.in_flight and self.in_flight + count > self.get_window():
+                self._condition.wait()
+            self.in_flight += count
+
+    def release(self, rtt, error=None):
+        """
+        Records the reply to a command, and adjusts the window.
+
+        :param float rtt: How long, in seconds, the reply took, or None if the command wasn't sent.
+        :param error: The exception raised by the command, if it failed.
+        """
+        now = time.time()
+        with self._condition:
+            self.in_flight -= 1
+            if rtt is None:
+                self._condition.notify_all()
+                return
+
+            self.completed += 1
+            self._completions.append(now)
+            self._prune_completions(now)
+
+            self._rtts.append(rtt)
+            if self.smoothed_rtt is None:
+                self.smoothed_rtt = rtt
+            else:
+                self.smoothed_rtt += (rtt - self.smoothed_rtt) / 8.0
+
+            if error is not None:
+                self.errors += 1
+
+            min_rtt = min(self._rtts)
+            congested = isinstance(error, (CasparExceptions.InternalServerError, IOError)) or \
+                rtt > max(min_rtt * self.rtt_tolerance, min_rtt + self.rtt_slack)
+            if congested:
+                # Only back off once per round trip - the other replies in flight were sent before we backed off
+                if now - self._last_decrease > self.smoothed_rtt:
+                    self._last_decrease = now
+                    self.decreases += 1
+                    self.window = max(self.min_window, self.window * self.decrease)
+                    self.slow_start_threshold = self.window
+            elif self.window < self.slow_start_threshold:
+                self.window = min(self.max_window, self.window + 1)
+            else:
+                self.window = min(self.max_window, self.window + 1.0 / self.window)
+
+            self._condition.notify_all()
+
+    def get_throughput(self):
+        """
+        :rtype: float
+        :return: The number of replies per second, over the last *throughput_period* seconds.
+        """
+        with self._condition:
+            self._prune_completions(time.time())
+            return len(self._completions) / self.throughput_period
+
+    def _prune_completions(self, now):
+        # Only the replies within the last throughput_period are needed. Must be called with _condition held.
+        cutoff = now - self.throughput_period
+        completions = self._completions
+        while completions and completions[0] < cutoff:
+            completions.popleft()
+
+    def close(self):
+        """
+        Detaches the flow controller from the server, so that commands are sent without any flow control.
+        """
+        if self.server.flow_control is self:
+            self.server.flow_control = None
+
+    def get_stats(self):
+        """
+        :rtype: Dict
+        :return: A dict containing the current *window* and the number of commands *in_flight*, the *throughput* in \
+        replies per second, the *smoothed_rtt* and *min_rtt* in seconds, and the number of commands *completed*, \
+        *errors* and window *decreases*.
+        """
+        throughput = self.get_throughput()
+        with self._condition:
+            return {"window": self.get_window(),
+                    "in_flight": self.in_flight,
+                    "throughput": throughput,
+                    "smoothed_rtt": self.smoothed_rtt,
+                    "min_rtt": min(self._rtts) if self._rtts else None,
+                    "completed": self.completed,
+                    "errors": self.errors,
+                    "decreases": self.decreases}
@@ -0,0 +1,243 @@
+import collections
+import socket
+import threading
+import time
+import AMCPCommands
+import amcp
+import CasparObjects
+import CommandScheduler
+
+# The ways that a group of commands can be sent
+PIPELINED = "pipelined"
+CONCURRENT = "concurrent"
+
+
+class GroupResult(object):
+    """
+    The outcome of sending the same operation to a group of channels and layers.
+
+    :ivar results: An ordered dict of ``{ target : response }``, where *target* is a ``(channel, layer)`` tuple \
+    (with a layer of None for operations on whole channels), and *response* is the server's response, or the \
+    exception (usually a :py:class:`~caspartalk.CasparExceptions.CasparError`) raised if the command failed.
+    :ivar ack_times: An ordered dict of ``{ target : seconds }`` - how long after the operation started the server \
+    answered each command.
+    :ivar succeeded: A list of the targets whose commands succeeded.
+    :ivar failed: An ordered dict of ``{ target : exception }`` for the targets whose commands failed.
+    :ivar first_ack: The soonest that a command was answered, in seconds after the operation started.
+    :ivar last_ack: The latest that a command was answered, in seconds after the operation started.
+    :ivar spread: The time between the first and last answers - i.e. how far apart the targets were changed.
+    :ivar elapsed: How long the whole operation took, in seconds.
+    """
+
+    def __init__(self, targets, responses, ack_times, started, finished):
+        self.results = collections.OrderedDict(zip(targets, responses))
+        self.ack_times = collections.OrderedDict((target, ack - started) for target, ack in zip(targets, ack_times))
+
+        self.succeeded = []
+        self.failed = collections.OrderedDict()
+        for target, response in self.results.iteritems():
+            if isinstance(response, Exception):
+                self.failed[target] = response
+            else:
+                self.succeeded.append(target)
+
+        acks = self.ack_times.values()
+        self.first_ack = min(acks) if acks else None
+        self.last_ack = max(acks) if acks else None
+        self.spread = self.last_ack - self.first_ack if acks else 0.0
+        self.elapsed = finished - started
+
+    @property
+    def ok(self):
+        """
+        True if every command succeeded.
+        """
+        return not self.failed
+
+    def __len__(self):
+        return len(self.results)
+
+    def __repr__(self):
+        return "<GroupResult {succeeded}/{total} succeeded, spread {spread:.1f} ms>".format(
+            succeeded=len(self.succeeded), total=len(self.results), spread=self.spread * 1000)
+
+
+def targets(channels, layers=None):
+    """
+    Lists every combination of *channels* and *layers*.
+
+    :param channels: A channel number, or a list of them.
+    :param layers: A layer number, a list of them, or None for the channels themselves.
+    :rtype: List
+    :return: A list of ``(channel, layer)`` tuples.
+    """
+    if isinstance(channels, (int, long)):
+        channels = [channels]
+    if layers is None or isinstance(layers, (int, long)):
+        layers = [layers]
+    return [(channel, layer) for channel in channels for layer in layers]
+
+
+def send(server, commands, mode=PIPELINED, priority=CommandScheduler.ON_AIR):
+    """
+    Sends a command to each of a group of targets at once, rather than waiting for each one to be answered before
+    sending the next.
+
+    With :py:data:`PIPELINED` (the default), every command is written in one go with
+    :py:meth:`~caspartalk.CasparServer.send_amcp_commands`, so the server receives them all together and answers them
+    back-to-back. With :py:data:`CONCURRENT`, each command is sent from its own thread with
+    :py:meth:`~caspartalk.CasparServer.send_amcp_command` - on servers that support request IDs, the commands are still
+    written together, and each is answered as soon as the server has dealt with it.
+
+    :param CasparServer server: The :py:class:`~caspartalk.CasparServer` to send the commands to.
+    :param commands: A list of ``(target, amcp_command)`` tuples.
+    :param str mode: :py:data:`PIPELINED` or :py:data:`CONCURRENT`.
+    :param int priority: How urgent the commands are - see :py:class:`~caspartalk.CommandScheduler.CommandScheduler`.
+    :rtype: GroupResult
+    """
+    commands = list(commands)
+    keys = [target for target, amcp_command in commands]
+    amcp_commands = [amcp_command for target, amcp_command in commands]
+
+    started = time.time()
+    if not commands:
+        return GroupResult([], [], [], started, started)
+
+    if mode == PIPELINED:
+        ack_times = []
+        responses = server.send_amcp_commands(amcp_commands, pipeline_depth=len(amcp_commands), priority=priority,
+                                              ack_times=ack_times)
+    elif mode == CONCURRENT:
+        responses, ack_times = _send_concurrently(server, amcp_commands, priority)
+    else:
+        raise ValueError("Unknown mode: {mode}".format(mode=mode))
+
+    return GroupResult(keys, responses, ack_times, started, time.time())
+
+
+def _send_concurrently(server, amcp_commands, priority):
+    responses = [None] * len(amcp_commands)
+    ack_times = [None] * len(amcp_commands)
+    errors = []
+
+    def worker(i):
+        try:
+            responses[i] = server.send_amcp_command(amcp_commands[i], use_cache=False, priority=priority)
+        except (IOError, socket.error), e:
+            errors.append(e)
+            responses[i] = e
+        except Exception, e:
+            responses[i] = e
+        ack_times[i] = time.time()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in xrange(len(amcp_commands))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        # Something went wrong with the connection, rather than with any one command
+        raise errors[0]
+    return responses, ack_times
+
+
+def _forget(server, result, cg_layer=None):
+    for channel, layer in result.succeeded:
+        server.cg_data_cache.forget(channel, layer, cg_layer)
+
+
+def cg_add(server, channels, template, layers=10, cg_layer=0, play_on_load=0, data=None, mode=PIPELINED):
+    """
+    Adds a template to a CG layer on each of a group of channels and layers - see :py:func:`~caspartalk.AMCP.cg_add`.
+
+    :param CasparServer server: The :py:class:`~caspartalk.CasparServer` to send the commands to.
+    :param channels: A channel number, or a list of them.
+    :param template: The name of the template, or the :py:class:`~caspartalk.CasparObjects.Template` itself.
+    :param layers: A layer number, or a list of them.
+    :param int cg_layer: The CG layer of each layer.
+    :param int play_on_load: If 1, the template will play as soon as it has been loaded.
+    :param data: The data to pass to the template.
+    :param str mode: :py:data:`PIPELINED` or :py:data:`CONCURRENT` - see :py:func:`send`.
+    :rtype: GroupResult
+    """
+    encoded = amcp._encode_template_data(data, template)
+    template_name = template.file_name if isinstance(template, CasparObjects.Template) else template
+    encode = AMCPCommands.get_command("CG ADD").encode
+
+    result = send(server, [(target, encode(target[0], target[1], cg_layer, template_name, play_on_load, encoded))
+                           for target in targets(channels, layers)], mode)
+    for channel, layer in result.succeeded:
+        server.cg_data_cache.set_data(channel, layer, cg_layer, data)
+    return result
+
+
+def _cg_command(name, server, channels, layers, cg_layer, mode):
+    encode = AMCPCommands.get_command(name).encode
+    return send(server, [(target, encode(target[0], target[1], cg_layer)) for target in targets(channels, layers)],
+                mode)
+
+
+def cg_play(server, channels, layers=10, cg_layer=0, mode=PIPELINED):
+    """
+    Plays the template on a CG layer of each of a group of channels and layers - see
+    :py:func:`~caspartalk.AMCP.cg_play`.
+
+    :param CasparServer server: The :py:class:`~caspartalk.CasparServer` to send the commands to.
+    :param channels: A channel number, or a list of them.
+    :param layers: A layer number, or a list of them.
+    :param int cg_layer: The CG layer of each layer.
+    :param str mode: :py:data:`PIPELINED` or :py:data:`CONCURRENT` - see :py:func:`send`.
+    :rtype: GroupResult
+    """
+    return _cg_command("CG PLAY", server, channels, layers, cg_layer, mode)
+
+
+def cg_stop(server, channels, layers=10, cg_layer=0, mode=PIPELINED):
+    """
+    Stops the template on a CG layer of each of a group of channels and layers - see
+    :py:func:`~caspartalk.AMCP.cg_stop`.
+
+    :param CasparServer server: The :py:class:`~caspartalk.CasparServer` to send the commands to.
+    :param channels: A channel number, or a list of them.
+    :param layers: A layer number, or a list of them.
+    :param int cg_layer: The CG layer of each layer.
+    :param str mode: :py:data:`PIPELINED` or :py:data:`CONCURRENT` - see :py:func:`send`.
+    :rtype: GroupResult
+    """
+    result = _cg_command("CG STOP", server, channels, layers, cg_layer, mode)
+    _forget(server, result, cg_layer)
+    return result
+
+
+def cg_clear(server, channels, layers=10, mode=PIPELINED):
+    """
+    Removes every template from each of a group of channels and layers - see :py:func:`~caspartalk.AMCP.cg_clear`.
+
+    :param CasparServer server: The :py:class:`~caspartalk.CasparServer` to send the commands to.
+    :param channels: A channel number, or a list of them.
+    :param layers: A layer number, or a list of them.
+    :param str mode: :py:data:`PIPELINED` or :py:data:`CONCURRENT` - see :py:func:`send`.
+    :rtype: GroupResult
+    """
+    encode = AMCPCommands.get_command("CG CLEAR").encode
+    result = send(server, [(target, encode(*target)) for target in targets(channels, layers)], mode)
+    _forget(server, result)
+    return result
+
+
+def clear(server, channels, layers=None, mode=PIPELINED):
+    """
+    Removes everything from each of a group of channels, or from the given layers of them - the panic button. See
+    :py:func:`~caspartalk.AMCP.clear`.
+
+    :param CasparServer server: The :py:class:`~caspartalk.CasparServer` to send the commands to.
+    :param channels: A channel number, or a list of them.
+    :param layers: A layer number, a list of them, or None to clear the channels completely.
+    :param str mode: :py:data:`PIPELINED` or :py:data:`CONCURRENT` - see :py:func:`send`.
+    :rtype: GroupResult
+    """
+    encode = AMCPCommands.get_command("CLEAR").encode
+    result = send(server, [(target, encode(target[0], target[1])) for target in targets(channels, layers)], mode)
+    _forget(server, result)
+    return result
@@ -0,0 +1,94 @@
+import AMCPCommands
+
+
+class MixerBatch(object):
+    """
+    Groups mixer transforms so that they are sent together and take effect on the same frame.
+
+    Each transform is sent with DEFER, so the server holds on to it, and when the batch is committed, every deferred
+    transform is sent in one pipelined write (see :py:meth:`~caspartalk.CasparServer.send_amcp_commands`), followed by
+    a MIXER COMMIT for each channel that was touched. Rather than one round trip per layer, with each layer moving on
+    whichever frame its command happened to arrive, the whole group costs a single round trip and moves at once.
+
+    Transforms are added with methods named after the MIXER commands in
+    :py:data:`~caspartalk.AMCPCommands.SPEC`, which take the same parameters as the functions in
+    :py:mod:`~caspartalk.AMCP` (without the server)::
+
+        with MixerBatch(server) as batch:
+            batch.fill(1, 10, 0, 0, 0.5, 0.5, duration=25, tween="easeinsine")
+            batch.fill(1, 20, 0.5, 0, 0.5, 0.5, duration=25, tween="easeinsine")
+            batch.opacity(1, 30, 0, duration=25)
+
+    Leaving the ``with`` block commits the batch, unless an exception was raised, in which case nothing is sent.
+
+    :param CasparServer server: The :py:class:`~caspartalk.CasparServer` to send the transforms to.
+    :param int priority: How urgent the commands are - see \
+    :py:class:`~caspartalk.CommandScheduler.CommandScheduler`. If None, it is worked out from the commands.
+    """
+
+    def __init__(self, server, priority=None):
+        self.server = server
+        self.priority = priority
+        self._commands = []
+        # The channels that have deferred transforms, in the order that they were first touched
+        self._channels = []
+
+    def add(self, name, *args, **kwargs):
+        """
+        Adds a deferred transform to the batch.
+
+        :param str name: The name of the command, e.g. "MIXER FILL".
+        :param args: The command's parameters - see the matching function in :py:mod:`~caspartalk.AMCP`.
+        """
+        command = AMCPCommands.get_command(name)
+        if "defer" not in command.fields:
+            raise ValueError("{name} can't be deferred".format(name=name))
+
+        kwargs["defer"] = True
+        self._commands.append(command.encode(*args, **kwargs))
+
+        channel = args[0] if args else kwargs["channel"]
+        if channel not in self._channels:
+            self._channels.append(channel)
+
+    def __getattr__(self, attr):
+        # batch.fill(...) -> batch.add("MIXER FILL", ...)
+        name = "MIXER " + attr.upper()
+        if attr.startswith("_") or name not in AMCPCommands.COMMANDS:
+            raise AttributeError(attr)
+        return lambda *args, **kwargs: self.add(name, *args, **kwargs)
+
+    def __len__(self):
+        return len(self._commands)
+
+    def commit(self):
+        """
+        Sends every transform in the batch, and commits them on each channel.
+
+        :rtype: List
+        :return: The response to each command, in the order that they were added, followed by the response to each \
+        MIXER COMMIT - see :py:meth:`~caspartalk.CasparServer.send_amcp_commands`. A command that failed has the \
+        exception that it raised (usually a :py:class:`~caspartalk.CasparExceptions.CasparError`) in its place.
+        """
+        commit = AMCPCommands.get_command("MIXER COMMIT").encode
+        commands = self._commands + [commit(channel) for channel in self._channels]
+        self.discard()
+        if not commands:
+            return []
+        return self.server.send_amcp_commands(commands, pipeline_depth=len(commands), priority=self.priority)
+
+    def discard(self):
+        """
+        Empties the batch without sending anything.
+        """
+        self._commands = []
+        self._channels = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.discard()
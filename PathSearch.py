@@ -0,0 +1,396 @@
+import bisect
+import heapq
+import re
+import CasparExceptions
+import amcp
+
+# Paths are split into words on anything that isn't a letter or a digit - "/", "_", "-", spaces...
+_word_splitter = re.compile(r"[^0-9a-z]+")
+
+# How similar (by shared trigrams) a word has to be to a query word to count as a fuzzy match
+FUZZY_THRESHOLD = 0.35
+
+
+def _words(s):
+    return [w for w in _word_splitter.split(s.lower()) if w]
+
+
+def _trigrams(word):
+    padded = "$" + word + "$"
+    return set(padded[i:i + 3] for i in xrange(len(padded) - 2))
+
+
+def _rank_key(path):
+    # Shallower, shorter paths come first, then alphabetical order. A string compares much faster than a tuple.
+    return "{depth:03d}{length:05d}{path}".format(depth=path.count("/"), length=len(path), path=path.lower())
+
+
+class _SegmentNode(object):
+    # A node in the trie of path segments. *children* is keyed by the lower-case segment, and *keys* holds the same
+    # keys in sorted order so that they can be prefix-matched with bisect. *path* is set if a path ends here.
+    __slots__ = ("name", "children", "keys", "path")
+
+    def __init__(self, name):
+        self.name = name
+        self.children = {}
+        self.keys = []
+        self.path = None
+
+
+class PathIndex(object):
+    """
+    An in-memory search index over a set of paths, such as the names of the templates listed by
+    :py:func:`~caspartalk.AMCP.tls`. It's designed to be queried on every keystroke of a type-ahead search box.
+
+    Two kinds of query are supported:
+
+    * :py:meth:`complete` completes the last segment of a path, like a shell - e.g. ``"news/lo"`` gives
+      ``"NEWS/LOWER_THIRDS/"``. This walks a trie of path segments.
+    * :py:meth:`search` finds paths containing words that start with each word of the query, in any order - e.g.
+      ``"name low"`` finds ``"NEWS/LOWER_THIRDS/NAME_2L"``. If there aren't enough of those, words that are only
+      similar to the query's (e.g. misspelt) are matched too, by shared trigrams.
+
+    Both are case-insensitive. Paths are added and removed one at a time with :py:meth:`add` and :py:meth:`remove`,
+    or brought into line with a new listing with :py:meth:`sync`; nothing is rebuilt from scratch.
+
+    :param paths: The paths to start with.
+    """
+
+    def __init__(self, paths=()):
+        self._root = _SegmentNode("")
+
+        # { path : words in the path }
+        self._path_words = {}
+        # { path : rank_key }
+        self._ranks = {}
+        # { word : [(rank_key, path), ...] } - each list is kept in rank order
+        self._postings = {}
+        # { word : set of paths } - the same paths as the postings, for fast intersections
+        self._word_paths = {}
+        # Every word, in sorted order, for prefix matching
+        self._vocabulary = []
+        # { trigram : set of words } for fuzzy matching
+        self._trigrams = {}
+
+        for path in paths:
+            self.add(path)
+
+    def __len__(self):
+        return len(self._path_words)
+
+    def __contains__(self, path):
+        return path in self._path_words
+
+    def __iter__(self):
+        return iter(self._path_words)
+
+    def add(self, path):
+        """
+        Adds a path to the index. Adding a path that is already indexed does nothing.
+
+        :param str path: The path to add.
+        """
+        if path in self._path_words:
+            return
+
+        node = self._root
+        for segment in path.split("/"):
+            key = segment.lower()
+            child = node.children.get(key)
+            if child is None:
+                child = node.children[key] = _SegmentNode(segment)
+                bisect.insort(node.keys, key)
+            node = child
+        node.path = path
+
+        words = tuple(set(_words(path)))
+        self._path_words[path] = words
+        rank_key = self._ranks[path] = _rank_key(path)
+        entry = (rank_key, path)
+        for word in words:
+            postings = self._postings.get(word)
+            if postings is None:
+                postings = self._postings[word] = []
+                self._word_paths[word] = set()
+                bisect.insort(self._vocabulary, word)
+                for trigram in _trigrams(word):
+                    self._trigrams.setdefault(trigram, set()).add(word)
+            bisect.insort(postings, entry)
+            self._word_paths[word].add(path)
+
+    def remove(self, path):
+        """
+        Removes a path from the index. Removing a path that isn't indexed does nothing.
+
+        :param str path: The path to remove.
+        """
+        words = self._path_words.pop(path, None)
+        if words is None:
+            return
+
+        # Walk down the trie, then prune any nodes that no longer lead anywhere on the way back up
+        trail = []
+        node = self._root
+        for segment in path.split("/"):
+            key = segment.lower()
+            trail.append((node, key))
+            node = node.children[key]
+        node.path = None
+        for parent, key in reversed(trail):
+            child = parent.children[key]
+            if child.path is not None or child.children:
+                break
+            del parent.children[key]
+            del parent.keys[bisect.bisect_left(parent.keys, key)]
+
+        entry = (self._ranks.pop(path), path)
+        for word in words:
+            postings = self._postings[word]
+            del postings[bisect.bisect_left(postings, entry)]
+            self._word_paths[word].discard(path)
+            if not postings:
+                del self._postings[word]
+                del self._word_paths[word]
+                del self._vocabulary[bisect.bisect_left(self._vocabulary, word)]
+                for trigram in _trigrams(word):
+                    similar = self._trigrams[trigram]
+                    similar.discard(word)
+                    if not similar:
+                        del self._trigrams[trigram]
+
+    def sync(self, paths):
+        """
+        Brings the index into line with a new set of paths, adding and removing only what has changed.
+
+        :param paths: Every path that should be in the index.
+        :rtype: tuple
+        :return: The paths that were ``(added, removed)``.
+        """
+        paths = set(paths)
+        added = [p for p in paths if p not in self._path_words]
+        removed = [p for p in self._path_words if p not in paths]
+        for path in removed:
+            self.remove(path)
+        for path in added:
+            self.add(path)
+        return added, removed
+
+    def complete(self, prefix, limit=20):
+        """
+        Completes the last segment of *prefix*. Folders are given with a trailing "/".
+
+        :param str prefix: What has been typed so far, e.g. ``"news/lo"``.
+        :param int limit: The maximum number of completions to return.
+        :rtype: List
+        :return: The completions, in alphabetical order.
+        """
+        segments = prefix.split("/")
+        partial = segments.pop().lower()
+
+        node = self._root
+        head = ""
+        for segment in segments:
+            node = node.children.get(segment.lower())
+            if node is None:
+                return []
+            head += node.name + "/"
+
+        keys = node.keys
+        results = []
+        i = bisect.bisect_left(keys, partial)
+        while i < len(keys) and keys[i].startswith(partial) and len(results) < limit:
+            child = node.children[keys[i]]
+            if child.path is not None:
+                results.append(child.path)
+            if child.children and len(results) < limit:
+                results.append(head + child.name + "/")
+            i += 1
+        return results
+
+    def _prefixed_words(self, query_word):
+        vocabulary = self._vocabulary
+        words = []
+        i = bisect.bisect_left(vocabulary, query_word)
+        while i < len(vocabulary) and vocabulary[i].startswith(query_word):
+            words.append(vocabulary[i])
+            i += 1
+        return words
+
+    def _similar_words(self, query_word):
+        # { word : similarity } for words that share enough trigrams with query_word
+        query_trigrams = _trigrams(query_word)
+        shared = {}
+        for trigram in query_trigrams:
+            for word in self._trigrams.get(trigram, ()):
+                shared[word] = shared.get(word, 0) + 1
+
+        similar = {}
+        for word, count in shared.iteritems():
+            # A word of n letters has n trigrams once padded
+            similarity = float(count) / max(len(query_trigrams), len(word))
+            if similarity >= FUZZY_THRESHOLD:
+                similar[word] = similarity
+        return similar
+
+    def _paths_with(self, words):
+        # Every path containing any of *words*
+        if len(words) == 1:
+            return self._word_paths[words[0]]
+        paths = set()
+        for word in words:
+            paths.update(self._word_paths[word])
+        return paths
+
+    def _narrow(self, paths, words):
+        # The paths in *paths* that contain any of *words*. Intersecting with each word's paths in turn is quicker
+        # than building the union of a lot of them first.
+        if len(words) == 1:
+            return paths.intersection(self._word_paths[words[0]])
+        narrowed = set()
+        for word in words:
+            narrowed.update(paths.intersection(self._word_paths[word]))
+        return narrowed
+
+    def _best_ranked(self, paths, driver_words, limit):
+        # Picks the *limit* best-ranked of *paths*, which all contain one of *driver_words*. Either rank the paths
+        # directly, or walk the driver words' rank-ordered postings until enough of them turn up - whichever should
+        # take fewer steps.
+        driver_size = sum(len(self._word_paths[w]) for w in driver_words)
+        if len(paths) * len(paths) <= limit * driver_size:
+            return sorted(paths, key=self._ranks.__getitem__)[:limit]
+
+        if len(driver_words) == 1:
+            ordered = self._postings[driver_words[0]]
+        else:
+            ordered = heapq.merge(*[self._postings[w] for w in driver_words])
+
+        results = []
+        for rank_key, path in ordered:
+            # A path can contain more than one of the driver words
+            if path in paths and path not in results:
+                results.append(path)
+                if len(results) >= limit:
+                    break
+        return results
+
+    def _match_all(self, word_groups):
+        # Finds the paths that contain at least one word from every group. Starts from the group with the fewest
+        # paths, and returns its words (for _best_ranked) along with the paths found.
+        sizes = [sum(len(self._word_paths[w]) for w in words) for words in word_groups]
+        order = sorted(range(len(word_groups)), key=sizes.__getitem__)
+
+        driver_words = word_groups[order[0]]
+        paths = self._paths_with(driver_words)
+        for i in order[1:]:
+            if not paths:
+                break
+            paths = self._narrow(paths, word_groups[i])
+        return driver_words, paths
+
+    def search(self, query, limit=20):
+        """
+        Finds the paths that best match *query*. Paths where every word of the query starts a word of the path come
+        first; then, if there are fewer than *limit* of those, paths that only match some words approximately, most
+        similar first. Within each group, shallower and shorter paths come first.
+
+        :param str query: What has been typed so far, e.g. ``"low name"``.
+        :param int limit: The maximum number of paths to return.
+        :rtype: List
+        :return: The matching paths, best first.
+        """
+        query_words = _words(query)
+        if not query_words:
+            return []
+
+        # Exact (prefix) matches - the paths that have a word starting with each query word
+        prefixed = [self._prefixed_words(w) for w in query_words]
+        results = []
+        if all(prefixed):
+            driver_words, paths = self._match_all(prefixed)
+            results = self._best_ranked(paths, driver_words, limit)
+            if len(results) >= limit:
+                return results
+
+        # Fuzzy matches. Each query word can match a word it prefixes exactly, or one that's similar to it.
+        allowed = []
+        for query_word, words in zip(query_words, prefixed):
+            scores = self._similar_words(query_word)
+            for word in words:
+                scores[word] = 1.0
+            allowed.append(scores)
+
+        if not all(allowed):
+            return results
+
+        driver_words, paths = self._match_all([scores.keys() for scores in allowed])
+        if results:
+            paths = paths.difference(results)
+
+        # Only score the best-ranked candidates, so that a vague query can't take too long
+        scored = []
+        for n, path in enumerate(self._best_ranked(paths, driver_words, limit * 2)):
+            path_words = self._path_words[path]
+            score = 0.0
+            for scores in allowed:
+                score += max([scores.get(pw, 0.0) for pw in path_words])
+            scored.append((-score, n, path))
+
+        scored.sort()
+        results.extend(path for score, n, path in scored[:limit - len(results)])
+        return results
+
+
+class CatalogSearch(object):
+    """
+    Type-ahead search over the templates and media on a CasparCG server, with a :py:class:`PathIndex` for each.
+
+    Call :py:meth:`refresh` to bring the indexes up-to-date with the server (only changes are applied), or keep them
+    up-to-date directly with each index's :py:meth:`~PathIndex.add` and :py:meth:`~PathIndex.remove`.
+
+    :param CasparServer server: The :py:class:`~caspartalk.CasparServer` whose templates and media are searched.
+    :param bool include_media: If True, media is indexed as well as templates.
+    """
+
+    def __init__(self, server, include_media=True):
+        self.server = server
+        self.include_media = include_media
+        self.templates = PathIndex()
+        self.media = PathIndex()
+
+    def refresh(self):
+        """
+        Lists the templates (and media) on the server, and updates the indexes with any changes.
+
+        :rtype: Dict
+        :return: A dict of the form ``{ "templates" : (added, removed), "media" : (added, removed) }``.
+        """
+        changes = {"templates": self.templates.sync(amcp.tls(self.server))}
+        if self.include_media:
+            try:
+                changes["media"] = self.media.sync(amcp.cls_listing(self.server).keys())
+            except CasparExceptions.CasparError:
+                # Not every server will list its media - templates are still worth searching
+                changes["media"] = ([], [])
+        return changes
+
+    def complete(self, prefix, limit=20):
+        """
+        Completes a template path - see :py:meth:`PathIndex.complete`.
+        """
+        return self.templates.complete(prefix, limit)
+
+    def search(self, query, limit=20, kinds=("template", "media")):
+        """
+        Searches the templates and then the media - see :py:meth:`PathIndex.search`.
+
+        :param str query: What has been typed so far.
+        :param int limit: The maximum number of results.
+        :param kinds: The kinds of path to search: "template", "media" or both.
+        :rtype: List
+        :return: A list of ``(kind, path)`` tuples, best first.
+        """
+        results = []
+        for kind, index in (("template", self.templates), ("media", self.media)):
+            if kind in kinds and len(results) < limit:
+                results.extend((kind, path) for path in index.search(query, limit - len(results)))
+        return results
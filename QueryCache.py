@@ -0,0 +1,286 @@
+import collections
+import threading
+import time
+
+# How long, in seconds, the response to each kind of query is kept. Queries that aren't listed here aren't cached.
+DEFAULT_TTLS = {"VERSION": 300.0,
+                "INFO PATHS": 60.0,
+                "INFO SYSTEM": 60.0,
+                "INFO": 1.0,
+                "CG INFO": 1.0,
+                "TLS": 5.0,
+                "CLS": 5.0,
+                "DATA LIST": 5.0}
+
+# INFO subcommands, which are cached under their own verbs rather than as INFO [channel]
+_info_subcommands = frozenset(["PATHS", "SYSTEM", "TEMPLATE", "CONFIG", "SERVER", "QUEUES", "THREADS", "DELAY"])
+
+# Commands that change what is playing on the channel (and layer) that they're sent to
+_channel_commands = frozenset(["LOADBG", "LOAD", "PLAY", "PAUSE", "RESUME", "STOP", "CLEAR", "CALL", "SWAP", "ADD",
+                               "REMOVE", "MIXER", "SET", "CG"])
+
+# Commands after which nothing cached can be trusted
+_reset_commands = frozenset(["KILL", "RESTART", "BYE"])
+
+
+def _channel_of(word):
+    # "1-10" -> 1
+    channel = word.split("-", 1)[0]
+    return int(channel) if channel.isdigit() else None
+
+
+def classify(amcp_command):
+    """
+    Works out what kind of command an AMCP command is, and what it refers to.
+
+    :param str amcp_command: The AMCP command.
+    :rtype: tuple
+    :return: ``(verb, channels, name)`` - the *verb* (e.g. "INFO", "INFO PATHS" or "CG INFO"), a tuple of the \
+    channels that the command is sent to, and the dataset named by DATA commands (or None).
+    """
+    words = amcp_command.split()
+    if not words:
+        return None, (), None
+
+    verb = words[0].upper()
+    second = words[1].upper() if len(words) > 1 else None
+
+    if verb == "INFO":
+        if second in _info_subcommands:
+            return "INFO " + second, (), None
+        channel = _channel_of(words[1]) if second else None
+        return verb, (channel,) if channel is not None else (), None
+
+    if verb == "DATA":
+        return "DATA " + (second or ""), (), words[2] if len(words) > 2 else None
+
+    channels = tuple(channel for channel in (_channel_of(word) for word in words[1:3]) if channel is not None)
+    if verb == "CG" and len(words) > 2 and words[2].upper() == "INFO":
+        return "CG INFO", channels[:1], None
+    if verb != "SWAP":
+        channels = channels[:1]
+    return verb, channels, None
+
+
+def _response_size(response):
+    # Roughly how much memory a response takes up - good enough for keeping the cache within its budget
+    return sum(len(line) for line in response) if response else 0
+
+
+class QueryCache(object):
+    """
+    Caches the responses to AMCP queries (VERSION, INFO, CG INFO, TLS...) for a short time, so that parts of a program
+    asking the same question over and over don't each need a round trip to the server.
+
+    Every :py:class:`~caspartalk.CasparServer` has one as its :py:attr:`query_cache`, which
+    :py:meth:`~caspartalk.CasparServer.send_amcp_command` consults. Set it to None to turn caching off.
+
+    Each kind of query has its own time-to-live (see :py:data:`DEFAULT_TTLS` and :py:meth:`set_ttl`). Commands that
+    change the server invalidate the responses that they affect as they are sent: for example, CG ADD, PLAY or CLEAR
+    on channel 1 drop the cached INFO and CG INFO responses for channel 1, and DATA STORE or DATA REMOVE drop the
+    cached DATA LIST. Everything is dropped when the server is reconnected to, or sent KILL or RESTART.
+
+    When more than *max_entries* responses, or *max_bytes* of responses, are held, the least-recently used are
+    evicted.
+
+    :param dict ttls: ``{ verb : seconds }``, overriding :py:data:`DEFAULT_TTLS`.
+    :param int max_entries: The maximum number of responses to hold.
+    :param int max_bytes: The maximum amount of response data to hold.
+    """
+
+    def __init__(self, ttls=None, max_entries=1024, max_bytes=4 * 1024 * 1024):
+        self.ttls = dict(DEFAULT_TTLS)
+        self.ttls.update(ttls or {})
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        # Least-recently used first. { command : (expiry time, response, size, groups) }
+        self._entries = collections.OrderedDict()
+        self._size = 0
+
+        # The commands whose responses are affected by the same things, so that they can be invalidated together.
+        # { (verb, channel) : set of commands }, where channel is None for responses that aren't about a channel.
+        self._groups = collections.defaultdict(set)
+
+        # Goes up every time a command that changes the server is sent - see put
+        self.generation = 0
+
+        # { verb : [hits, misses, invalidations] }
+        self._stats = collections.defaultdict(lambda: [0, 0, 0])
+        self.evictions = 0
+
+        # Hits are served without taking the server's command_lock, so the cache has a lock of its own
+        self._lock = threading.RLock()
+
+    def set_ttl(self, verb, ttl):
+        """
+        Sets how long the responses to one kind of query are cached for.
+
+        :param str verb: The kind of query, e.g. "INFO", "CG INFO" or "TLS".
+        :param float ttl: The time-to-live in seconds. 0 or None stops the query from being cached.
+        """
+        with self._lock:
+            if ttl:
+                self.ttls[verb] = ttl
+            else:
+                self.ttls.pop(verb, None)
+                self.invalidate(verb)
+
+    @staticmethod
+    def _key(amcp_command):
+        return " ".join(amcp_command.split())
+
+    def get(self, amcp_command):
+        """
+        Looks up the cached response to a query.
+
+        :param str amcp_command: The AMCP command.
+        :rtype: tuple
+        :return: ``(True, response)`` if there is a response that hasn't expired, otherwise ``(False, None)``.
+        """
+        with self._lock:
+            verb = classify(amcp_command)[0]
+            if verb not in self.ttls:
+                return False, None
+
+            key = self._key(amcp_command)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.time():
+                self._stats[verb][0] += 1
+                # Move to the most-recently used end
+                del self._entries[key]
+                self._entries[key] = entry
+                return True, list(entry[1]) if entry[1] is not None else None
+
+            if entry is not None:
+                self._discard(key)
+            self._stats[verb][1] += 1
+            return False, None
+
+    def put(self, amcp_command, response, generation=None):
+        """
+        Caches the response to a query. Responses to commands that aren't cached queries are ignored.
+
+        :param str amcp_command: The AMCP command.
+        :param response: The response, as returned by :py:meth:`~caspartalk.CasparServer.send_amcp_command`.
+        :param int generation: The :py:attr:`generation` when the query was sent. If a command that changes the \
+        server has been sent since, the response may already be out of date, so isn't cached.
+        """
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+
+            verb, channels, name = classify(amcp_command)
+            ttl = self.ttls.get(verb)
+            if not ttl:
+                return
+
+            key = self._key(amcp_command)
+            self._discard(key)
+            size = len(key) + _response_size(response)
+            if size > self.max_bytes:
+                return
+
+            while self._entries and (len(self._entries) >= self.max_entries or self._size + size > self.max_bytes):
+                self._discard(next(iter(self._entries)))
+                self.evictions += 1
+
+            groups = [(verb, channel) for channel in channels] or [(verb, None)]
+            if name is not None:
+                groups.append((verb, name))
+            for group in groups:
+                self._groups[group].add(key)
+
+            self._entries[key] = (time.time() + ttl, list(response) if response is not None else None, size, groups)
+            self._size += size
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+
+        self._size -= entry[2]
+        for group in entry[3]:
+            keys = self._groups.get(group)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._groups[group]
+        return True
+
+    def invalidate(self, verb, channel=None):
+        """
+        Drops cached responses.
+
+        :param str verb: The kind of query to drop, e.g. "INFO".
+        :param channel: If given, only drop the responses about this channel (or, for DATA commands, this dataset).
+        """
+        with self._lock:
+            if channel is None:
+                groups = [group for group in self._groups if group[0] == verb]
+            else:
+                groups = [(verb, channel)]
+
+            for group in groups:
+                self._invalidate_group(group)
+
+    def command_sent(self, amcp_command):
+        """
+        Drops the cached responses that the command could make out of date. This is called by
+        :py:meth:`~caspartalk.CasparServer.send_amcp_command` for every command that it sends.
+
+        :param str amcp_command: The AMCP command.
+        """
+        with self._lock:
+            verb, channels, name = classify(amcp_command)
+            if verb in _reset_commands or verb in _channel_commands or verb in ("DATA STORE", "DATA REMOVE"):
+                self.generation += 1
+            if not self._entries:
+                return
+
+            if verb in _reset_commands:
+                self.clear()
+            elif verb in _channel_commands:
+                for channel in channels:
+                    self._invalidate_group(("INFO", channel))
+                    self._invalidate_group(("CG INFO", channel))
+                # INFO on its own gives the state of every channel
+                self._invalidate_group(("INFO", None))
+            elif verb in ("DATA STORE", "DATA REMOVE"):
+                self.invalidate("DATA LIST")
+                self._invalidate_group(("DATA RETRIEVE", name))
+
+    def _invalidate_group(self, group):
+        for key in list(self._groups.get(group, ())):
+            if self._discard(key):
+                self._stats[group[0]][2] += 1
+
+    def clear(self):
+        """
+        Drops every cached response.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._groups.clear()
+            self._size = 0
+
+    def get_stats(self):
+        """
+        :rtype: Dict
+        :return: A dict of ``{ verb : stats }``, where *stats* is a dict containing the number of *hits* and \
+        *misses*, the *hit_rate* (between 0 and 1), and the number of responses *invalidated* by other commands. \
+        The total number of *entries* held, their size in *bytes* and the number of LRU *evictions* are given under \
+        the verb None.
+        """
+        with self._lock:
+            stats = {}
+            for verb, (hits, misses, invalidations) in self._stats.iteritems():
+                lookups = hits + misses
+                stats[verb] = {"hits": hits,
+                               "misses": misses,
+                               "hit_rate": float(hits) / lookups if lookups else 0.0,
+                               "invalidated": invalidations}
+            stats[None] = {"entries": len(self._entries),
+                           "bytes": self._size,
+                           "evictions": self.evictions}
+            return stats
@@ -8,6 +8,16 @@
 from CasparExceptions import *
 
 
+def split_request_id(caspar_output):
+    # Replies to commands sent as REQ [id] [command] start with RES [id], e.g. "RES 12 201 VERSION OK".
+    # Returns the id (or None, if the reply isn't tagged) and the reply without it.
+    r = caspar_output[0]
+    if not r.startswith("RES "):
+        return None, caspar_output
+    parts = r.split(" ", 2)
+    return parts[1], [parts[2] if len(parts) > 2 else ""] + caspar_output[1:]
+
+
 def interpret_response(caspar_output):
     r = caspar_output[0]  # The first line of a Caspar response is always the return code
     print r
@@ -0,0 +1,452 @@
+import sqlite3
+import amcp
+import CasparObjects
+
+# The Caspar type names, keyed by the Python types that CasparObjects uses for them
+_type_names = dict((t, name) for name, t in CasparObjects.CasparTypes.iteritems())
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS templates (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    size INTEGER,
+    timestamp TEXT,
+    version TEXT,
+    author_name TEXT,
+    author_email TEXT,
+    template_info TEXT,
+    original_width INTEGER,
+    original_height INTEGER,
+    original_frame_rate TEXT
+);
+CREATE TABLE IF NOT EXISTS template_properties (
+    template_id INTEGER NOT NULL,
+    component TEXT NOT NULL,
+    property TEXT NOT NULL,
+    type TEXT NOT NULL,
+    info TEXT
+);
+CREATE TABLE IF NOT EXISTS template_instances (
+    template_id INTEGER NOT NULL,
+    instance TEXT NOT NULL,
+    component TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS template_parameters (
+    template_id INTEGER NOT NULL,
+    parameter TEXT NOT NULL,
+    type TEXT NOT NULL,
+    info TEXT
+);
+CREATE TABLE IF NOT EXISTS template_keyframes (
+    template_id INTEGER NOT NULL,
+    keyframe TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS media (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    type TEXT,
+    size INTEGER,
+    timestamp TEXT
+);
+CREATE TABLE IF NOT EXISTS datasets (
+    name TEXT PRIMARY KEY
+);
+
+CREATE INDEX IF NOT EXISTS templates_author ON templates (author_name);
+CREATE INDEX IF NOT EXISTS template_properties_template ON template_properties (template_id);
+CREATE INDEX IF NOT EXISTS template_instances_template ON template_instances (template_id);
+CREATE INDEX IF NOT EXISTS template_instances_component ON template_instances (component);
+CREATE INDEX IF NOT EXISTS template_parameters_template ON template_parameters (template_id);
+CREATE INDEX IF NOT EXISTS template_parameters_parameter ON template_parameters (parameter);
+CREATE INDEX IF NOT EXISTS template_keyframes_template ON template_keyframes (template_id);
+CREATE INDEX IF NOT EXISTS media_type ON media (type);
+"""
+
+# Full-text indexes on the paths and info strings. The FTS rows share their docid with the templates/media rows.
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS templates_fts USING fts4 (name, info);
+CREATE VIRTUAL TABLE IF NOT EXISTS media_fts USING fts4 (name);
+"""
+
+_TEMPLATE_CHILD_TABLES = ("template_properties", "template_instances", "template_parameters", "template_keyframes")
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class SQLiteCatalog(object):
+    """
+    A local, indexed copy of the templates, media and datasets on a CasparCG server, kept in an SQLite database.
+
+    Unlike :py:attr:`CasparServer.templates`, the catalog can be queried without scanning every template - e.g. for
+    every template with a given parameter, or every template by a given author - and paths and info strings can be
+    searched with :py:meth:`search`.
+
+    The database file can be shared by several processes (e.g. one per operator station on the same machine): it is
+    opened in WAL mode, so readers don't block the writer, and each refresh is applied in a single transaction. Use
+    one catalog file per CasparCG server.
+
+    :py:meth:`refresh` brings the catalog up-to-date with the server incrementally: TLS, CLS and DATA LIST are
+    compared with what's already in the catalog, and INFO TEMPLATE is only sent for templates that have been added or
+    whose size or timestamp has changed.
+
+    Full-text search needs SQLite's FTS4 module. If it isn't available, :py:meth:`search` falls back to a (slower)
+    substring match.
+
+    :param str path: The path to the database file. It's created if it doesn't exist.
+    :param CasparServer server: The :py:class:`~caspartalk.CasparServer` that the catalog describes.
+    :param float timeout: How long to wait, in seconds, for another process to finish writing to the catalog.
+    """
+
+    def __init__(self, path, server=None, timeout=30.0):
+        self.path = path
+        self.server = server
+
+        # Transactions are managed explicitly, so that a whole refresh is applied at once
+        self.db = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self.db.text_factory = str
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(_SCHEMA)
+
+        try:
+            self.db.executescript(_FTS_SCHEMA)
+            self.has_fts = True
+        except sqlite3.OperationalError:
+            self.has_fts = False
+
+    def close(self):
+        """
+        Closes the database.
+        """
+        self.db.close()
+
+    # Writing
+
+    def _begin(self):
+        # IMMEDIATE takes the write lock straight away, so that two processes refreshing at once take turns rather
+        # than one of them failing part-way through
+        self.db.execute("BEGIN IMMEDIATE")
+
+    def _put_template(self, template, size=None, timestamp=None):
+        db = self.db
+        row = db.execute("SELECT id FROM templates WHERE name = ?", (template.file_name,)).fetchone()
+        values = (size, timestamp, template.version, template.author_name, template.author_email,
+                  template.template_info, _to_int(template.original_width), _to_int(template.original_height),
+                  template.original_frame_rate)
+
+        if row is None:
+            template_id = db.execute("INSERT INTO templates (size, timestamp, version, author_name, author_email, "
+                                     "template_info, original_width, original_height, original_frame_rate, name) "
+                                     "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                     values + (template.file_name,)).lastrowid
+        else:
+            template_id = row[0]
+            db.execute("UPDATE templates SET size = ?, timestamp = ?, version = ?, author_name = ?, author_email = ?, "
+                       "template_info = ?, original_width = ?, original_height = ?, original_frame_rate = ? "
+                       "WHERE id = ?", values + (template_id,))
+            self._delete_template_children(template_id)
+
+        db.executemany("INSERT INTO template_properties (template_id, component, property, type, info) "
+                       "VALUES (?, ?, ?, ?, ?)",
+                       [(template_id, comp_name, prop.id, _type_names[prop.type], prop.info)
+                        for comp_name, props in template.components.iteritems()
+                        for prop in props.itervalues()])
+        db.executemany("INSERT INTO template_instances (template_id, instance, component) VALUES (?, ?, ?)",
+                       [(template_id, inst_name, comp_name)
+                        for inst_name, comp_name in template.instances.iteritems()])
+        db.executemany("INSERT INTO template_parameters (template_id, parameter, type, info) VALUES (?, ?, ?, ?)",
+                       [(template_id, param.id, _type_names[param.type], param.info)
+                        for param in template.parameters.itervalues()])
+        db.executemany("INSERT INTO template_keyframes (template_id, keyframe) VALUES (?, ?)",
+                       [(template_id, kf) for kf in template.keyframes])
+
+        if self.has_fts:
+            # The info strings of the parameters and properties are searchable too, along with the template's own
+            info = [template.template_info or "", template.author_name or ""]
+            info.extend(param.info or "" for param in template.parameters.itervalues())
+            info.extend(prop.info or "" for props in template.components.itervalues() for prop in props.itervalues())
+            db.execute("INSERT OR REPLACE INTO templates_fts (docid, name, info) VALUES (?, ?, ?)",
+                       (template_id, template.file_name, " ".join(info)))
+
+    def _delete_template_children(self, template_id):
+        for table in _TEMPLATE_CHILD_TABLES:
+            self.db.execute("DELETE FROM {table} WHERE template_id = ?".format(table=table), (template_id,))
+
+    def _delete_template(self, name):
+        row = self.db.execute("SELECT id FROM templates WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return
+        self._delete_template_children(row[0])
+        self.db.execute("DELETE FROM templates WHERE id = ?", (row[0],))
+        if self.has_fts:
+            self.db.execute("DELETE FROM templates_fts WHERE docid = ?", (row[0],))
+
+    def _put_media(self, entry):
+        db = self.db
+        row = db.execute("SELECT id FROM media WHERE name = ?", (entry.name,)).fetchone()
+        if row is None:
+            media_id = db.execute("INSERT INTO media (name, type, size, timestamp) VALUES (?, ?, ?, ?)",
+                                  (entry.name, entry.file_type, entry.size, entry.timestamp)).lastrowid
+        else:
+            media_id = row[0]
+            db.execute("UPDATE media SET type = ?, size = ?, timestamp = ? WHERE id = ?",
+                       (entry.file_type, entry.size, entry.timestamp, media_id))
+        if self.has_fts:
+            db.execute("INSERT OR REPLACE INTO media_fts (docid, name) VALUES (?, ?)", (media_id, entry.name))
+
+    def _delete_media(self, name):
+        row = self.db.execute("SELECT id FROM media WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return
+        self.db.execute("DELETE FROM media WHERE id = ?", (row[0],))
+        if self.has_fts:
+            self.db.execute("DELETE FROM media_fts WHERE docid = ?", (row[0],))
+
+    def add_template(self, template, size=None, timestamp=None):
+        """
+        Adds a template to the catalog, replacing it if it's already there.
+
+        :param Template template: The :py:class:`~caspartalk.CasparObjects.Template` to add.
+        :param int size: The size of the template file, as listed by TLS.
+        :param str timestamp: When the template file was last modified, as listed by TLS.
+        """
+        self._begin()
+        try:
+            self._put_template(template, size, timestamp)
+        except:
+            self.db.execute("ROLLBACK")
+            raise
+        self.db.execute("COMMIT")
+
+    # Refreshing
+
+    @staticmethod
+    def _diff(old, new):
+        # Compares { name : (size, timestamp) } listings, returning the names added, modified and removed
+        added = [name for name in new if name not in old]
+        modified = [name for name in new if name in old and old[name] != new[name]]
+        removed = [name for name in old if name not in new]
+        return added, modified, removed
+
+    def refresh(self, templates=True, media=True, datasets=True):
+        """
+        Brings the catalog up-to-date with the server, only fetching what has changed.
+
+        :param bool templates: If True, refresh the templates (with TLS, then INFO TEMPLATE for each changed template).
+        :param bool media: If True, refresh the media (with CLS).
+        :param bool datasets: If True, refresh the dataset names (with DATA LIST).
+        :rtype: Dict
+        :return: A dict of the form ``{ "templates" : (added, modified, removed), ... }``, giving the names that \
+        changed for each kind of object that was refreshed.
+        """
+        changes = {}
+        new_templates = {}
+        template_listing = media_listing = dataset_names = None
+
+        # Talk to the server first, so that the catalog isn't locked while we wait for it
+        if templates:
+            template_listing = amcp.tls_listing(self.server)
+            old = dict((name, (size, timestamp)) for name, size, timestamp in
+                       self.db.execute("SELECT name, size, timestamp FROM templates"))
+            added, modified, removed = self._diff(
+                old, dict((e.name, (e.size, e.timestamp)) for e in template_listing.itervalues()))
+            for name in added + modified:
+                template = amcp.info_template(self.server, name)
+                if template is not None:
+                    new_templates[name] = template
+            changes["templates"] = (added, modified, removed)
+
+        if media:
+            media_listing = amcp.cls_listing(self.server)
+            old = dict((name, (size, timestamp)) for name, size, timestamp in
+                       self.db.execute("SELECT name, size, timestamp FROM media"))
+            changes["media"] = self._diff(
+                old, dict((e.name, (e.size, e.timestamp)) for e in media_listing.itervalues()))
+
+        if datasets:
+            dataset_names = set(n.strip() for n in amcp.data_list(self.server) or [] if n.strip())
+            old = set(name for name, in self.db.execute("SELECT name FROM datasets"))
+            changes["datasets"] = (sorted(dataset_names - old), [], sorted(old - dataset_names))
+
+        self._begin()
+        try:
+            if templates:
+                added, modified, removed = changes["templates"]
+                for name in removed:
+                    self._delete_template(name)
+                for name, template in new_templates.iteritems():
+                    entry = template_listing[name]
+                    self._put_template(template, entry.size, entry.timestamp)
+
+            if media:
+                added, modified, removed = changes["media"]
+                for name in removed:
+                    self._delete_media(name)
+                for name in added + modified:
+                    self._put_media(media_listing[name])
+
+            if datasets:
+                added, modified, removed = changes["datasets"]
+                self.db.executemany("DELETE FROM datasets WHERE name = ?", [(name,) for name in removed])
+                self.db.executemany("INSERT OR IGNORE INTO datasets (name) VALUES (?)", [(name,) for name in added])
+        except:
+            self.db.execute("ROLLBACK")
+            raise
+        self.db.execute("COMMIT")
+
+        return changes
+
+    # Querying
+
+    def get_template_names(self):
+        """
+        :rtype: List
+        :return: The names of every template in the catalog, in alphabetical order.
+        """
+        return [name for name, in self.db.execute("SELECT name FROM templates ORDER BY name")]
+
+    def get_media_names(self, media_type=None):
+        """
+        :param str media_type: If given, only list media of this type (e.g. "MOVIE" or "STILL").
+        :rtype: List
+        :return: The names of the media in the catalog, in alphabetical order.
+        """
+        if media_type is None:
+            rows = self.db.execute("SELECT name FROM media ORDER BY name")
+        else:
+            rows = self.db.execute("SELECT name FROM media WHERE type = ? ORDER BY name", (media_type,))
+        return [name for name, in rows]
+
+    def get_dataset_names(self):
+        """
+        :rtype: List
+        :return: The names of every dataset in the catalog, in alphabetical order.
+        """
+        return [name for name, in self.db.execute("SELECT name FROM datasets ORDER BY name")]
+
+    def find_templates_with_parameter(self, parameter):
+        """
+        :param str parameter: The ID of a template parameter.
+        :rtype: List
+        :return: The names of the templates that have the parameter.
+        """
+        return [name for name, in self.db.execute(
+            "SELECT DISTINCT t.name FROM template_parameters p JOIN templates t ON t.id = p.template_id "
+            "WHERE p.parameter = ? ORDER BY t.name", (parameter,))]
+
+    def find_templates_with_component(self, component):
+        """
+        :param str component: The name of a component type, e.g. "CasparTextField".
+        :rtype: List
+        :return: The names of the templates that have an instance of the component.
+        """
+        return [name for name, in self.db.execute(
+            "SELECT DISTINCT t.name FROM template_instances i JOIN templates t ON t.id = i.template_id "
+            "WHERE i.component = ? ORDER BY t.name", (component,))]
+
+    def find_templates_by_author(self, author_name, folder=None):
+        """
+        :param str author_name: The name of the author, as it appears in the template.
+        :param str folder: If given, only templates in this folder (or below it) are returned - e.g. "LOWER_THIRDS".
+        :rtype: List
+        :return: The names of the templates by the author.
+        """
+        if folder is None:
+            rows = self.db.execute("SELECT name FROM templates WHERE author_name = ? ORDER BY name", (author_name,))
+        else:
+            rows = self.db.execute("SELECT name FROM templates WHERE author_name = ? AND name LIKE ? ESCAPE '\\' "
+                                   "ORDER BY name", (author_name, self._escape_like(folder.rstrip("/")) + "/%"))
+        return [name for name, in rows]
+
+    @staticmethod
+    def _escape_like(s):
+        return s.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+    def search(self, text, limit=50):
+        """
+        Searches the paths of the templates and media, and the info strings of the templates. With FTS, *text* can
+        use SQLite's full-text query syntax - e.g. ``"lower*"`` for words starting with "lower".
+
+        :param str text: What to search for.
+        :param int limit: The maximum number of results of each kind.
+        :rtype: List
+        :return: A list of ``(kind, name)`` tuples, where *kind* is "template" or "media".
+        """
+        if self.has_fts:
+            template_rows = self.db.execute(
+                "SELECT t.name FROM templates_fts f JOIN templates t ON t.id = f.docid "
+                "WHERE templates_fts MATCH ? LIMIT ?", (text, limit))
+            results = [("template", name) for name, in template_rows]
+            media_rows = self.db.execute(
+                "SELECT m.name FROM media_fts f JOIN media m ON m.id = f.docid "
+                "WHERE media_fts MATCH ? LIMIT ?", (text, limit))
+            results.extend(("media", name) for name, in media_rows)
+            return results
+
+        pattern = "%" + self._escape_like(text.strip("*")) + "%"
+        template_rows = self.db.execute(
+            "SELECT name FROM templates WHERE name LIKE ? ESCAPE '\\' OR template_info LIKE ? ESCAPE '\\' LIMIT ?",
+            (pattern, pattern, limit))
+        results = [("template", name) for name, in template_rows]
+        media_rows = self.db.execute("SELECT name FROM media WHERE name LIKE ? ESCAPE '\\' LIMIT ?", (pattern, limit))
+        results.extend(("media", name) for name, in media_rows)
+        return results
+
+    def get_template(self, name):
+        """
+        Rebuilds a :py:class:`~caspartalk.CasparObjects.Template` from the catalog, without going to the server.
+
+        :param str name: The name of the template.
+        :rtype: :py:class:`~caspartalk.CasparObjects.Template`
+        :return: The Template, or None if it isn't in the catalog.
+        """
+        row = self.db.execute("SELECT id, version, author_name, author_email, template_info, original_width, "
+                              "original_height, original_frame_rate FROM templates WHERE name = ?",
+                              (name,)).fetchone()
+        if row is None:
+            return None
+
+        template_id = row[0]
+        template = CasparObjects.Template(self.server, CasparObjects.intern_string(name))
+        (template.version, template.author_name, template.author_email, template.template_info) = \
+            [CasparObjects.intern_string(v) for v in row[1:5]]
+        template.original_width = row[5] or 0
+        template.original_height = row[6] or 0
+        template.original_frame_rate = row[7] or 0
+
+        for comp_name, prop_id, prop_type, prop_info in self.db.execute(
+                "SELECT component, property, type, info FROM template_properties WHERE template_id = ?",
+                (template_id,)):
+            comp_name = CasparObjects.intern_string(comp_name)
+            if comp_name not in template.components:
+                template.components[comp_name] = CasparObjects.TypedDict(CasparObjects.ComponentProperty)
+            prop = CasparObjects.ComponentProperty(prop_id, prop_type, prop_info)
+            template.components[comp_name][prop.id] = prop
+
+        for inst_name, comp_name in self.db.execute(
+                "SELECT instance, component FROM template_instances WHERE template_id = ?", (template_id,)):
+            template.instances[CasparObjects.intern_string(inst_name)] = CasparObjects.intern_string(comp_name)
+
+        for param_id, param_type, param_info in self.db.execute(
+                "SELECT parameter, type, info FROM template_parameters WHERE template_id = ?", (template_id,)):
+            param = CasparObjects.TemplateParameter(param_id, param_type, param_info)
+            template.parameters[param.id] = param
+
+        template.keyframes = [CasparObjects.intern_string(kf) for kf, in self.db.execute(
+            "SELECT keyframe FROM template_keyframes WHERE template_id = ? ORDER BY rowid", (template_id,))]
+
+        return template
+
+    def get_stats(self):
+        """
+        :rtype: Dict
+        :return: A dict containing the number of *templates*, *media* and *datasets* in the catalog.
+        """
+        stats = {}
+        for table in ("templates", "media", "datasets"):
+            stats[table] = self.db.execute("SELECT COUNT(*) FROM {table}".format(table=table)).fetchone()[0]
+        return stats
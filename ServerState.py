@@ -0,0 +1,317 @@
+import collections
+import re
+import XMLBinding
+
+ADDED = "added"
+REMOVED = "removed"
+MODIFIED = "modified"
+
+# A change to what is playing on a CasparCG server, as found by a ServerStateMonitor.
+# *channel* is the channel's index, and *layer* is the layer's index - or None if the change is to the channel itself
+# (its video mode, mixer or consumers), or if the whole channel has been added or removed. *change* is ADDED, REMOVED
+# or MODIFIED, and *old* and *new* are the ChannelState or LayerState before and after (None if it didn't exist).
+StateChange = collections.namedtuple("StateChange", ["channel", "layer", "change", "old", "new"])
+
+
+class _State(object):
+    # State objects are compared slot by slot, so that a refresh can tell which ones have changed
+
+    __slots__ = ()
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        if equal is NotImplemented:
+            return equal
+        return not equal
+
+    __hash__ = None
+
+
+class ProducerState(_State):
+    """
+    A producer that is loaded on a layer, as reported by INFO.
+
+    The *type* is CasparCG's name for the producer, such as "ffmpeg-producer", "color-producer" or "empty-producer".
+    Everything else that the producer reports (*width*, *fps*, *frame-number*, ...) is in *properties*, as text.
+    Producers that wrap other producers (such as a "separated-producer" or a "transition-producer") have them in
+    *producers*, under the name of the element they were in (e.g. "fill" and "key", or "source" and "destination").
+    """
+
+    __slots__ = ("type", "filename", "properties", "producers")
+
+    def __init__(self):
+        self.type = None
+        self.filename = None
+        self.properties = {}
+        self.producers = {}
+
+    def __repr__(self):
+        return str(type(self).__name__ + " " + str(self.type) + " " + str(self.filename or ""))
+
+
+class LayerState(_State):
+    """
+    The state of one layer of a channel.
+
+    *status* is "playing", "paused" or "stopped". *frame_number*, *nb_frames* and *frames_left* are ints, and are None
+    if the server didn't report them. *foreground* and *background* are the :py:class:`ProducerState` s of what is
+    playing and what is loaded to play next.
+    """
+
+    __slots__ = ("index", "status", "auto_delta", "frame_number", "nb_frames", "frames_left", "foreground",
+                 "background")
+
+    def __init__(self):
+        self.index = None
+        self.status = None
+        self.auto_delta = None
+        self.frame_number = None
+        self.nb_frames = None
+        self.frames_left = None
+        self.foreground = None
+        self.background = None
+
+    def __repr__(self):
+        return str(type(self).__name__ + " " + str(self.index) + " " + str(self.status))
+
+
+class ChannelState(_State):
+    """
+    The state of one channel - its *video_mode*, its *layers* (a dict of ``{ index : LayerState }``), its *mixer*
+    settings (a dict of text) and its *consumers* (a list of dicts of text, one per consumer).
+    """
+
+    __slots__ = ("index", "video_mode", "layers", "mixer", "consumers")
+
+    def __init__(self):
+        self.index = None
+        self.video_mode = None
+        self.layers = {}
+        self.mixer = {}
+        self.consumers = []
+
+    def same_settings(self, other):
+        """
+        :param ChannelState other: The channel to compare with.
+        :rtype: Bool
+        :return: True if the two channels have the same video mode, mixer and consumers, whatever is on their layers.
+        """
+        return (self.index, self.video_mode, self.mixer, self.consumers) == \
+               (other.index, other.video_mode, other.mixer, other.consumers)
+
+    def __repr__(self):
+        return str(type(self).__name__ + " " + str(self.index) + " " + str(self.video_mode))
+
+
+class ServerState(object):
+    """
+    The state of every channel on a CasparCG server, as returned by :py:func:`~caspartalk.AMCP.info_server`.
+
+    :py:attr:`channels` is a dict of ``{ index : ChannelState }``.
+    """
+
+    __slots__ = ("channels",)
+
+    def __init__(self):
+        self.channels = {}
+
+    def get_layer(self, channel, layer):
+        """
+        :param int channel: The index of the channel.
+        :param int layer: The index of the layer.
+        :rtype: :py:class:`LayerState`
+        :return: The layer's state, or None if there's nothing on it.
+        """
+        channel_state = self.channels.get(channel)
+        if channel_state is None:
+            return None
+        return channel_state.layers.get(layer)
+
+
+def diff_channels(old, new):
+    """
+    Compares two states of the same channel.
+
+    :param ChannelState old: The earlier state, or None if the channel didn't exist.
+    :param ChannelState new: The later state, or None if the channel no longer exists.
+    :rtype: List
+    :return: A :py:data:`StateChange` for the channel itself if it was added, removed or had its settings changed, \
+    followed by one for each layer that was added, removed or modified, in layer order.
+    """
+    if old is new:
+        return []
+    if old is None:
+        return [StateChange(new.index, None, ADDED, None, new)]
+    if new is None:
+        return [StateChange(old.index, None, REMOVED, old, None)]
+
+    changes = []
+    if not old.same_settings(new):
+        changes.append(StateChange(new.index, None, MODIFIED, old, new))
+
+    for index in sorted(set(old.layers) | set(new.layers)):
+        old_layer = old.layers.get(index)
+        new_layer = new.layers.get(index)
+        if old_layer is new_layer:
+            continue
+        if old_layer is None:
+            changes.append(StateChange(new.index, index, ADDED, None, new_layer))
+        elif new_layer is None:
+            changes.append(StateChange(new.index, index, REMOVED, old_layer, None))
+        elif old_layer != new_layer:
+            changes.append(StateChange(new.index, index, MODIFIED, old_layer, new_layer))
+    return changes
+
+
+def diff_states(old, new):
+    """
+    Compares two :py:class:`ServerState` s.
+
+    :param ServerState old: The earlier state.
+    :param ServerState new: The later state.
+    :rtype: List
+    :return: The :py:data:`StateChange` s, in channel order - see :py:func:`diff_channels`.
+    """
+    changes = []
+    for index in sorted(set(old.channels) | set(new.channels)):
+        changes.extend(diff_channels(old.channels.get(index), new.channels.get(index)))
+    return changes
+
+
+_tag_patterns = {}
+
+
+def _element_spans(text, tag):
+    # Finds the outermost <tag> elements in *text*, returning the (start, end) of each. Elements with the same tag
+    # inside them are skipped over, so that they aren't mistaken for siblings.
+    pattern = _tag_patterns.get(tag)
+    if pattern is None:
+        pattern = _tag_patterns[tag] = re.compile(r"<(/?){tag}(?:\s[^>]*?)?(/?)>".format(tag=re.escape(tag)))
+
+    spans = []
+    depth = 0
+    start = None
+    for match in pattern.finditer(text):
+        closing, empty = match.group(1), match.group(2)
+        if empty:
+            if depth == 0:
+                spans.append((match.start(), match.end()))
+        elif closing:
+            depth -= 1
+            if depth == 0:
+                spans.append((start, match.end()))
+            elif depth < 0:
+                # Unbalanced - leave it to the parser to complain about
+                depth = 0
+        else:
+            if depth == 0:
+                start = match.start()
+            depth += 1
+    return spans
+
+
+def _cut(text, spans):
+    # Removes the spans from text
+    pieces = []
+    last = 0
+    for start, end in spans:
+        pieces.append(text[last:start])
+        last = end
+    pieces.append(text[last:])
+    return "".join(pieces)
+
+
+class ServerStateMonitor(object):
+    """
+    Keeps track of what is playing on every channel of a CasparCG server, with one INFO SERVER per
+    :py:meth:`refresh`.
+
+    Only the parts of the reply that have changed since the last refresh are parsed. The reply is split into its
+    channels, and each channel into its layers, without parsing it; a channel whose XML is unchanged keeps its
+    :py:class:`ChannelState` from last time, and within a changed channel, only the layers whose XML has changed are
+    parsed again. Whatever was rebuilt is then compared with the previous state, and reported as a list of
+    :py:data:`StateChange` s. This keeps polling every channel once a second cheap, even on a busy server.
+
+    Note that the frame counters of a playing layer change on every refresh, so playing layers are reported as
+    modified every time.
+
+    :param CasparServer server: The :py:class:`~caspartalk.CasparServer` to monitor.
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self.state = ServerState()
+
+        # The XML of each channel in the last reply, in the order that they were in, alongside its ChannelState and a
+        # dict of { layer XML : LayerState } for its layers
+        self._channels = []
+
+        self.refreshes = 0
+        self.channels_parsed = 0
+        self.layers_parsed = 0
+
+    def _build_channel(self, channel_xml, old_layers):
+        layer_spans = _element_spans(channel_xml, "layer")
+        channel = XMLBinding.bind(_cut(channel_xml, layer_spans), XMLBinding.get_schema("channel"))
+        self.channels_parsed += 1
+
+        layer_schema = XMLBinding.get_schema("layer")
+        layers = {}
+        for start, end in layer_spans:
+            layer_xml = channel_xml[start:end]
+            layer = old_layers.get(layer_xml)
+            if layer is None:
+                layer = XMLBinding.bind(layer_xml, layer_schema)
+                self.layers_parsed += 1
+            layers[layer_xml] = layer
+            channel.layers[layer.index] = layer
+
+        return channel, layers
+
+    def refresh(self):
+        """
+        Sends INFO SERVER, and updates :py:attr:`state` from the reply.
+
+        :rtype: List
+        :return: The :py:data:`StateChange` s since the last refresh - see :py:func:`diff_states`. On the first \
+        refresh, every channel is reported as added.
+        """
+        response = self.server.send_amcp_command("INFO SERVER")
+        reply = "".join(response or [])
+
+        old_state = self.state
+        state = ServerState()
+        channels = []
+        for position, (start, end) in enumerate(_element_spans(reply, "channel")):
+            channel_xml = reply[start:end]
+            previous = self._channels[position] if position < len(self._channels) else None
+
+            if previous is not None and previous[0] == channel_xml:
+                channel, layers = previous[1], previous[2]
+            else:
+                channel, layers = self._build_channel(channel_xml, previous[2] if previous is not None else {})
+                if channel.index is None:
+                    channel.index = position + 1
+
+            channels.append((channel_xml, channel, layers))
+            state.channels[channel.index] = channel
+
+        self._channels = channels
+        self.state = state
+        self.refreshes += 1
+        return diff_states(old_state, state)
+
+    def get_stats(self):
+        """
+        :rtype: Dict
+        :return: A dict containing the number of *refreshes*, and the number of channels and layers that had to be \
+        parsed (*channels_parsed* and *layers_parsed*).
+        """
+        return {"refreshes": self.refreshes,
+                "channels_parsed": self.channels_parsed,
+                "layers_parsed": self.layers_parsed}
@@ -0,0 +1,266 @@
+import collections
+import time
+import amcp
+import CasparObjects
+
+# Shots are recalled by a number from 1 to 9999, Lyric-style
+MIN_SHOT_ID = 1
+MAX_SHOT_ID = 9999
+
+
+class Shot(object):
+    """
+    A graphic that has been prepared ahead of time: a template, the data to fill it with and where it should go.
+
+    :param int shot_id: The number (1-9999) that the shot is recalled with.
+    :param template: The name of the template, or the :py:class:`~caspartalk.CasparObjects.Template` itself.
+    :param data: The data to fill the template with - see :py:func:`~caspartalk.AMCP.cg_add`.
+    :param int channel: The number of the channel to play the shot on.
+    :param int layer: The number of the layer to play the shot on.
+    """
+
+    def __init__(self, shot_id, template, data=None, channel=1, layer=10):
+        if not isinstance(shot_id, int) or not MIN_SHOT_ID <= shot_id <= MAX_SHOT_ID:
+            raise ValueError("Shot IDs must be between {min} and {max}, got {wrong}".format(min=MIN_SHOT_ID,
+                                                                                           max=MAX_SHOT_ID,
+                                                                                           wrong=shot_id))
+        self.id = shot_id
+        self.template = template
+        self.data = data
+        self.channel = channel
+        self.layer = layer
+
+    def get_template_name(self):
+        if isinstance(self.template, CasparObjects.Template):
+            return self.template.file_name
+        return self.template
+
+    def __repr__(self):
+        return str(type(self).__name__ + " " + str(self.id) + " " + self.get_template_name())
+
+
+class _Latencies(object):
+    # Running totals of the latencies of one kind of take. Only the count, mean and maximum are reported, so the
+    # latencies themselves aren't kept.
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = None
+
+    def add(self, latency):
+        self.count += 1
+        self.total += latency
+        if self.max is None or latency > self.max:
+            self.max = latency
+
+    def get_mean(self):
+        if not self.count:
+            return None
+        return self.total / self.count
+
+
+class Shotbox(object):
+    """
+    Stores :py:class:`Shot` s by number and takes them to air.
+
+    To keep template load times off air, shots that are likely to be recalled next are preloaded into hidden CG layers
+    (using CG ADD with *play_on_load* set to 0), so that taking them is just a CG PLAY. After a shot is recalled, the
+    next *prefetch_ahead* shots (by number) are preloaded; shots can also be preloaded explicitly with
+    :py:meth:`prefetch`.
+
+    At most *layer_budget* shots are kept preloaded at once. When the budget is used up, the least-recently used
+    preloaded shot is removed from the server to make room. Each shot is preloaded into its own CG layer on the shot's
+    channel and layer, starting at *first_cg_layer*.
+
+    The time from :py:meth:`recall` being called to CasparCG acknowledging the take is recorded for every recall,
+    separately for preloaded (warm) and not preloaded (cold) shots - see :py:meth:`get_stats`.
+
+    :param CasparServer server: The :py:class:`~caspartalk.CasparServer` to play shots on.
+    :param int layer_budget: The maximum number of shots to keep preloaded.
+    :param int prefetch_ahead: The number of following shots to preload after each recall.
+    :param int first_cg_layer: The first CG layer that shots are loaded into.
+    """
+
+    def __init__(self, server, layer_budget=4, prefetch_ahead=1, first_cg_layer=1):
+        self.server = server
+        self.layer_budget = layer_budget
+        self.prefetch_ahead = prefetch_ahead
+        self.first_cg_layer = first_cg_layer
+
+        # { shot_id : Shot }
+        self.shots = {}
+
+        # Preloaded shots, least-recently used first. { shot_id : (Shot, cg_layer) }
+        self._preloaded = collections.OrderedDict()
+        # Shots that are currently on air. { shot_id : (Shot, cg_layer) }
+        self._on_air = {}
+
+        self.warm_latencies = _Latencies()
+        self.cold_latencies = _Latencies()
+        self.evictions = 0
+
+    def store(self, shot_id, template, data=None, channel=1, layer=10):
+        """
+        Stores a shot under the number *shot_id*, replacing any shot already stored under that number.
+
+        :rtype: :py:class:`Shot`
+        :return: The stored shot.
+        """
+        shot = Shot(shot_id, template, data, channel, layer)
+        self.remove(shot_id)
+        self.shots[shot_id] = shot
+        return shot
+
+    def remove(self, shot_id):
+        """
+        Removes the shot stored under *shot_id*, unloading it from the server if it has been preloaded.
+
+        :param int shot_id: The number of the shot.
+        """
+        self._unload(shot_id)
+        self.shots.pop(shot_id, None)
+
+    def _used_cg_layers(self, channel, layer):
+        used = set()
+        for loaded in (self._preloaded, self._on_air):
+            for shot, cg_layer in loaded.itervalues():
+                if shot.channel == channel and shot.layer == layer:
+                    used.add(cg_layer)
+        return used
+
+    def _free_cg_layer(self, shot):
+        used = self._used_cg_layers(shot.channel, shot.layer)
+        cg_layer = self.first_cg_layer
+        while cg_layer in used:
+            cg_layer += 1
+        return cg_layer
+
+    def _unload(self, shot_id):
+        preloaded = self._preloaded.pop(shot_id, None)
+        if preloaded is not None:
+            shot, cg_layer = preloaded
+            amcp.cg_remove(self.server, shot.channel, shot.layer, cg_layer)
+
+    def _evict(self):
+        shot_id = next(iter(self._preloaded))
+        self._unload(shot_id)
+        self.evictions += 1
+
+    def _preload(self, shot_id):
+        if shot_id in self._preloaded:
+            # Still wanted - mark it as recently used
+            self._preloaded[shot_id] = self._preloaded.pop(shot_id)
+            return True
+
+        if shot_id in self._on_air or self.layer_budget < 1:
+            return False
+
+        while len(self._preloaded) >= self.layer_budget:
+            self._evict()
+
+        shot = self.shots[shot_id]
+        cg_layer = self._free_cg_layer(shot)
+        if not amcp.cg_add(self.server, shot.template, shot.channel, shot.layer, cg_layer, 0, shot.data):
+            return False
+
+        self._preloaded[shot_id] = (shot, cg_layer)
+        return True
+
+    def prefetch(self, shot_ids):
+        """
+        Preloads the given shots, so that they can be taken to air straight away.
+
+        :param shot_ids: The numbers of the shots to preload. Numbers with no shot stored under them are ignored.
+        :rtype: int
+        :return: The number of shots that are now preloaded.
+        """
+        count = 0
+        for shot_id in shot_ids:
+            if shot_id in self.shots and self._preload(shot_id):
+                count += 1
+        return count
+
+    def get_next_shot_ids(self, shot_id):
+        """
+        Predicts which shots will be recalled after *shot_id* - the next *prefetch_ahead* stored shots, in number order.
+
+        :param int shot_id: The number of the shot that has just been recalled.
+        :rtype: List
+        """
+        later = sorted(i for i in self.shots if i > shot_id and i not in self._on_air)
+        return later[:self.prefetch_ahead]
+
+    def is_preloaded(self, shot_id):
+        """
+        :param int shot_id: The number of the shot.
+        :rtype: Bool
+        :return: True if the shot is loaded and waiting in a hidden CG layer.
+        """
+        return shot_id in self._preloaded
+
+    def recall(self, shot_id):
+        """
+        Takes the shot stored under *shot_id* to air, then preloads the shots likely to follow it.
+
+        :param int shot_id: The number of the shot.
+        :rtype: Bool
+        :return: True if successful, otherwise False.
+        """
+        if shot_id not in self.shots:
+            raise KeyError("No shot stored under {id}".format(id=shot_id))
+        shot = self.shots[shot_id]
+
+        start = time.time()
+        if shot_id in self._preloaded:
+            cg_layer = self._preloaded[shot_id][1]
+            ok = amcp.cg_play(self.server, shot.channel, shot.layer, cg_layer)
+            if ok:
+                # Only now is it on air - if the play failed, it's still loaded, and still ours to take or unload
+                del self._preloaded[shot_id]
+            latencies = self.warm_latencies
+        elif shot_id in self._on_air:
+            # Already on air - play it again from the start
+            cg_layer = self._on_air[shot_id][1]
+            ok = amcp.cg_play(self.server, shot.channel, shot.layer, cg_layer)
+            latencies = self.warm_latencies
+        else:
+            cg_layer = self._free_cg_layer(shot)
+            ok = amcp.cg_add(self.server, shot.template, shot.channel, shot.layer, cg_layer, 1, shot.data)
+            latencies = self.cold_latencies
+        latencies.add(time.time() - start)
+
+        if ok:
+            self._on_air[shot_id] = (shot, cg_layer)
+
+        self.prefetch(self.get_next_shot_ids(shot_id))
+        return ok
+
+    def take_off(self, shot_id):
+        """
+        Takes an on-air shot off air, letting the template animate out.
+
+        :param int shot_id: The number of the shot.
+        :rtype: Bool
+        :return: True if successful, otherwise False.
+        """
+        on_air = self._on_air.pop(shot_id, None)
+        if on_air is None:
+            return False
+        shot, cg_layer = on_air
+        return amcp.cg_stop(self.server, shot.channel, shot.layer, cg_layer)
+
+    def get_stats(self):
+        """
+        :rtype: Dict
+        :return: A dict containing the number of *warm_takes* and *cold_takes*, their mean and maximum latencies in \
+        seconds, the number of shots *preloaded* and the number of *evictions*.
+        """
+        return {"warm_takes": self.warm_latencies.count,
+                "cold_takes": self.cold_latencies.count,
+                "warm_mean_latency": self.warm_latencies.get_mean(),
+                "warm_max_latency": self.warm_latencies.max,
+                "cold_mean_latency": self.cold_latencies.get_mean(),
+                "cold_max_latency": self.cold_latencies.max,
+                "preloaded": len(self._preloaded),
+                "evictions": self.evictions}
@@ -0,0 +1,176 @@
+import re
+
+# CasparCG templates expect their data as XML of the following form:
+#
+# <templateData>
+#   <componentData id="f0">
+#     <data id="text" value="Hello world"/>
+#   </componentData>
+# </templateData>
+#
+# When that XML is sent as part of an AMCP command, it has to be wrapped in double-quotes, with any double-quotes
+# and backslashes inside it escaped with a backslash.
+# See http://casparcg.com/wiki/CasparCG_2.1_AMCP_Protocol#Special_sequences
+
+# The property that a value is given to if the component (or parameter) doesn't tell us otherwise
+DEFAULT_PROPERTY = "text"
+
+_xml_special = re.compile(r'[&<>"\r\n\t]')
+_amcp_special = re.compile(r'[\\"\r\n]')
+
+
+def escape_xml_attribute(value):
+    """
+    Escapes a value so that it can be placed inside a double-quoted XML attribute.
+
+    :param value: The value to escape. Anything that isn't a string will be converted to one.
+    :rtype: str
+    :return: The escaped value.
+    """
+    if isinstance(value, bool):
+        value = "true" if value else "false"
+    elif not isinstance(value, basestring):
+        value = str(value)
+
+    # Most values (names, scores, times) don't contain anything that needs escaping, so check before doing any work
+    if not _xml_special.search(value):
+        return value
+
+    return value.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace('"', "&quot;") \
+        .replace("\r", "&#13;").replace("\n", "&#10;").replace("\t", "&#9;")
+
+
+def escape_amcp(value):
+    """
+    Escapes a string so that it can be sent as a single double-quoted AMCP parameter. The surrounding quotes are not
+    added.
+
+    :param str value: The string to escape.
+    :rtype: str
+    :return: The escaped string.
+    """
+    if not _amcp_special.search(value):
+        return value
+
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\r", "\\r").replace("\n", "\\n")
+
+
+class TemplateDataSerializer(object):
+    """
+    Turns a dict of data into the ``<templateData>`` XML that a particular :py:class:`~caspartalk.CasparObjects.Template`
+    expects.
+
+    The serializer is compiled once from the Template's *instances* and *parameters*: the XML surrounding each field is
+    built (and escaped, for both XML and AMCP) up-front, so rendering a set of data only involves escaping the values
+    themselves and joining the pieces together. Use :py:meth:`~caspartalk.CasparObjects.Template.get_data_serializer`
+    rather than creating one of these directly.
+
+    The data passed to :py:meth:`serialize` should be of the form::
+
+        { instance_or_parameter_id : value, ... }
+
+    where *value* is either a single value, which is given to the component's property (usually ``text``), or a dict
+    of the form ``{ property_id : value, ... }``. Fields that the Template doesn't know about are given to the
+    ``text`` property.
+
+    :param Template template: The Template to compile a serializer for.
+    """
+
+    def __init__(self, template):
+        self.template_name = template.file_name
+
+        # { field_id : (xml_head, amcp_head, xml_scalar_head, amcp_scalar_head) }
+        # The scalar heads already include the opening of the default property's <data> element
+        self._fields = {}
+
+        for inst_name, comp_type in template.instances.iteritems():
+            prop = DEFAULT_PROPERTY
+            if comp_type in template.components:
+                comp_props = template.components[comp_type]
+                if len(comp_props) and DEFAULT_PROPERTY not in comp_props:
+                    prop = sorted(comp_props.keys())[0]
+            self._fields[inst_name] = self._compile_field(inst_name, prop)
+
+        for param_id in template.parameters:
+            if param_id not in self._fields:
+                self._fields[param_id] = self._compile_field(param_id, DEFAULT_PROPERTY)
+
+    @staticmethod
+    def _compile_field(field_id, default_property):
+        xml_head = '<componentData id="{id}">'.format(id=escape_xml_attribute(field_id))
+        xml_scalar_head = xml_head + '<data id="{prop}" value="'.format(prop=escape_xml_attribute(default_property))
+        return xml_head, escape_amcp(xml_head), xml_scalar_head, escape_amcp(xml_scalar_head)
+
+    def _render(self, data, amcp):
+        if amcp:
+            parts = ['"<templateData>']
+            data_open = '<data id=\\"'
+            value_open = '\\" value=\\"'
+            data_close = '\\"/>'
+        else:
+            parts = ['<templateData>']
+            data_open = '<data id="'
+            value_open = '" value="'
+            data_close = '"/>'
+        append = parts.append
+
+        for field_id, value in data.iteritems():
+            field = self._fields.get(field_id)
+            if field is None:
+                field = self._compile_field(field_id, DEFAULT_PROPERTY)
+
+            if not isinstance(value, dict):
+                # The common case - a single value for the component's default property
+                value = escape_xml_attribute(value)
+                if amcp:
+                    append(field[3])
+                    append(escape_amcp(value))
+                else:
+                    append(field[2])
+                    append(value)
+                append(data_close)
+                append('</componentData>')
+                continue
+
+            append(field[1] if amcp else field[0])
+
+            for prop_id, prop_value in value.iteritems():
+                prop_value = escape_xml_attribute(prop_value)
+                prop_id = escape_xml_attribute(prop_id)
+                if amcp:
+                    prop_value = escape_amcp(prop_value)
+                    prop_id = escape_amcp(prop_id)
+                append(data_open)
+                append(prop_id)
+                append(value_open)
+                append(prop_value)
+                append(data_close)
+
+            append('</componentData>')
+
+        append('</templateData>"' if amcp else '</templateData>')
+        return "".join(parts)
+
+    def serialize(self, data):
+        """
+        Renders *data* as ``<templateData>`` XML.
+
+        :param dict data: The data to render.
+        :rtype: str
+        :return: The XML.
+        """
+        return self._render(data, False)
+
+    def serialize_amcp(self, data):
+        """
+        Renders *data* as ``<templateData>`` XML, escaped and quoted so that it can be used directly as the data
+        parameter of an AMCP command such as CG ADD or CG UPDATE.
+
+        :param dict data: The data to render.
+        :rtype: str
+        :return: The quoted, escaped XML.
+        """
+        return self._render(data, True)
+
+    def __repr__(self):
+        return str(type(self).__name__ + " " + self.template_name)
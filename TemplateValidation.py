@@ -0,0 +1,261 @@
+import collections
+import types
+import TemplateData
+
+# An error found while validating a batch of template data.
+# *row* is the position of the row in the batch, *field* is the field (and property, if the field is a component
+# instance) and *message* describes what is wrong with it.
+FieldError = collections.namedtuple("FieldError", ["row", "field", "message"])
+
+_true_strings = frozenset(["true", "yes", "1", "on"])
+_false_strings = frozenset(["false", "no", "0", "off", ""])
+
+
+class _Invalid(object):
+    # Returned by a coercer when a value can't be converted. Holds the error message.
+    __slots__ = ("message",)
+
+    def __init__(self, message):
+        self.message = message
+
+
+def _coerce_string(value):
+    if isinstance(value, basestring):
+        return value
+    if isinstance(value, (int, long, float)):
+        # Numbers (and booleans) can always be shown as text
+        if isinstance(value, bool):
+            return "true" if value else "false"
+        return str(value)
+    return _Invalid("expected a string, got {t}".format(t=type(value).__name__))
+
+
+def _coerce_int(value):
+    if isinstance(value, (int, long)):
+        return value
+    if isinstance(value, float):
+        if value.is_integer():
+            return int(value)
+        return _Invalid("expected a whole number, got {v!r}".format(v=value))
+    if isinstance(value, basestring):
+        try:
+            return int(value.strip())
+        except ValueError:
+            return _Invalid("expected a whole number, got {v!r}".format(v=value))
+    return _Invalid("expected an int, got {t}".format(t=type(value).__name__))
+
+
+def _coerce_float(value):
+    if isinstance(value, float):
+        return value
+    if isinstance(value, (int, long)) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(value, basestring):
+        try:
+            return float(value.strip())
+        except ValueError:
+            return _Invalid("expected a number, got {v!r}".format(v=value))
+    return _Invalid("expected a number, got {t}".format(t=type(value).__name__))
+
+
+def _coerce_bool(value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, basestring):
+        lower = value.strip().lower()
+        if lower in _true_strings:
+            return True
+        if lower in _false_strings:
+            return False
+        return _Invalid("expected true or false, got {v!r}".format(v=value))
+    if isinstance(value, (int, long)) and value in (0, 1):
+        return bool(value)
+    return _Invalid("expected a boolean, got {t}".format(t=type(value).__name__))
+
+
+# One coercer per CasparType
+_coercers = {types.StringType: _coerce_string,
+             types.IntType: _coerce_int,
+             types.FloatType: _coerce_float,
+             types.BooleanType: _coerce_bool}
+
+
+def _strict(coercer, expected_type):
+    # Wraps a coercer so that it only accepts values that are already of the right type
+    def check(value):
+        if expected_type is types.StringType and isinstance(value, basestring):
+            return value
+        if isinstance(value, expected_type):
+            return value
+        result = coercer(value)
+        if isinstance(result, _Invalid):
+            return result
+        return _Invalid("expected {t}, got {wrong}".format(t=expected_type.__name__, wrong=type(value).__name__))
+    return check
+
+
+class ValidationResult(object):
+    """
+    The result of validating a batch of rows with a :py:class:`TemplateValidator`.
+
+    *rows* holds the validated (and, where allowed, coerced) data for every row, in the same order as they were given.
+    Rows with errors are None. *errors* holds a :py:data:`FieldError` for every problem found.
+    """
+
+    def __init__(self, rows, errors):
+        self.rows = rows
+        self.errors = errors
+
+    def is_valid(self):
+        """
+        :rtype: Bool
+        :return: True if no errors were found.
+        """
+        return not self.errors
+
+    def get_valid_rows(self):
+        """
+        :rtype: List
+        :return: A list of ``(position, data)`` tuples for the rows that had no errors.
+        """
+        return [(i, row) for i, row in enumerate(self.rows) if row is not None]
+
+    def __repr__(self):
+        return "{name} {valid} valid rows, {errors} errors".format(name=type(self).__name__,
+                                                                  valid=len(self.get_valid_rows()),
+                                                                  errors=len(self.errors))
+
+
+class TemplateValidator(object):
+    """
+    Checks batches of template data against a :py:class:`~caspartalk.CasparObjects.Template`'s *parameters* and the
+    properties of its *instances*' components, collecting every error rather than stopping at the first.
+
+    The validator is compiled once per Template: the check for each field is chosen up-front, so validating a row only
+    involves a dict lookup and a call per field. Use
+    :py:meth:`~caspartalk.CasparObjects.Template.get_validator` rather than creating one of these directly.
+
+    Data is expected in the same form as :py:class:`~caspartalk.TemplateData.TemplateDataSerializer` takes it: a dict
+    of ``{ field : value }``, where the value for an instance can also be a dict of ``{ property : value }``.
+
+    If *coerce* is True, values are converted to the right type where it's safe to do so - e.g. the string ``"12"``
+    for an int field, or ``"false"`` for a boolean one. Otherwise values must already be of the right type.
+
+    :param Template template: The Template to compile a validator for.
+    :param bool coerce: If True, convert values to the right type where possible.
+    :param bool allow_unknown: If True, fields that the Template doesn't have are passed through unchecked; \
+    otherwise they are errors.
+    """
+
+    def __init__(self, template, coerce=True, allow_unknown=False):
+        self.template_name = template.file_name
+        self.coerce = coerce
+        self.allow_unknown = allow_unknown
+
+        def compile_check(expected_type):
+            coercer = _coercers[expected_type]
+            return coercer if coerce else _strict(coercer, expected_type)
+
+        # { field : check } for parameters, and instances given a single value
+        self._fields = {}
+        # { instance : { property : check } }
+        self._instances = {}
+
+        for inst_name, comp_type in template.instances.iteritems():
+            props = {}
+            if comp_type in template.components:
+                for prop_id, prop in template.components[comp_type].iteritems():
+                    props[prop_id] = compile_check(prop.type)
+            self._instances[inst_name] = props
+
+            # A single value goes to the default property, as in the serializer
+            if TemplateData.DEFAULT_PROPERTY in props:
+                self._fields[inst_name] = props[TemplateData.DEFAULT_PROPERTY]
+            elif props:
+                self._fields[inst_name] = props[sorted(props.keys())[0]]
+            else:
+                self._fields[inst_name] = compile_check(types.StringType)
+
+        for param_id, param in template.parameters.iteritems():
+            self._fields[param_id] = compile_check(param.type)
+
+    def validate_row(self, data, row=0, errors=None):
+        """
+        Validates a single row of data.
+
+        :param dict data: The row's data.
+        :param int row: The position of the row, used in any errors.
+        :param list errors: A list to add any errors to.
+        :return: The validated data, or None if there were errors.
+        """
+        if errors is None:
+            errors = []
+        n_errors = len(errors)
+
+        if not isinstance(data, dict):
+            errors.append(FieldError(row, None, "expected a dict, got {t}".format(t=type(data).__name__)))
+            return None
+
+        fields = self._fields
+        instances = self._instances
+        out = {}
+
+        for field, value in data.iteritems():
+            if isinstance(value, dict):
+                props = instances.get(field)
+                if props is None:
+                    if self.allow_unknown:
+                        out[field] = value
+                    else:
+                        errors.append(FieldError(row, field, "not a component instance of this template"))
+                    continue
+
+                out_props = {}
+                for prop_id, prop_value in value.iteritems():
+                    check = props.get(prop_id)
+                    if check is None:
+                        if self.allow_unknown:
+                            out_props[prop_id] = prop_value
+                        else:
+                            errors.append(FieldError(row, field + "." + prop_id, "not a property of this component"))
+                        continue
+                    result = check(prop_value)
+                    if type(result) is _Invalid:
+                        errors.append(FieldError(row, field + "." + prop_id, result.message))
+                    else:
+                        out_props[prop_id] = result
+                out[field] = out_props
+                continue
+
+            check = fields.get(field)
+            if check is None:
+                if self.allow_unknown:
+                    out[field] = value
+                else:
+                    errors.append(FieldError(row, field, "not a field of this template"))
+                continue
+
+            result = check(value)
+            if type(result) is _Invalid:
+                errors.append(FieldError(row, field, result.message))
+            else:
+                out[field] = result
+
+        if len(errors) > n_errors:
+            return None
+        return out
+
+    def validate(self, rows):
+        """
+        Validates a batch of rows in one pass.
+
+        :param rows: An iterable of data dicts.
+        :rtype: :py:class:`ValidationResult`
+        """
+        errors = []
+        validate_row = self.validate_row
+        out = [validate_row(data, i, errors) for i, data in enumerate(rows)]
+        return ValidationResult(out, errors)
+
+    def __repr__(self):
+        return str(type(self).__name__ + " " + self.template_name)
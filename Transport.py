@@ -0,0 +1,167 @@
+import socket
+import threading
+
+
+class SocketOptions(object):
+    """
+    The options set on the socket used to talk to a CasparCG server.
+
+    :param bool nodelay: If True, turn off Nagle's algorithm (TCP_NODELAY), so that small commands are sent straight \
+    away instead of waiting for the previous one to be acknowledged.
+    :param bool keepalive: If True, turn on TCP keepalives, so that a dead connection is noticed even when nothing is \
+    being sent.
+    :param int keepalive_idle: The number of idle seconds before the first keepalive is sent (where supported).
+    :param int keepalive_interval: The number of seconds between keepalives (where supported).
+    :param int keepalive_count: The number of unanswered keepalives before the connection is dropped (where \
+    supported).
+    :param int send_buffer: The size of the socket's send buffer (SO_SNDBUF), or None to leave it alone.
+    :param int receive_buffer: The size of the socket's receive buffer (SO_RCVBUF), or None to leave it alone.
+    """
+
+    def __init__(self, nodelay=True, keepalive=True, keepalive_idle=10, keepalive_interval=5, keepalive_count=3,
+                 send_buffer=None, receive_buffer=None):
+        self.nodelay = nodelay
+        self.keepalive = keepalive
+        self.keepalive_idle = keepalive_idle
+        self.keepalive_interval = keepalive_interval
+        self.keepalive_count = keepalive_count
+        self.send_buffer = send_buffer
+        self.receive_buffer = receive_buffer
+
+    def apply(self, sock):
+        """
+        Sets the options on a socket. Buffer sizes are best set before the socket is connected.
+
+        :param socket.socket sock: The socket.
+        """
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1 if self.nodelay else 0)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1 if self.keepalive else 0)
+
+        if self.keepalive:
+            # These aren't available on every platform
+            for name, value in (("TCP_KEEPIDLE", self.keepalive_idle),
+                                ("TCP_KEEPINTVL", self.keepalive_interval),
+                                ("TCP_KEEPCNT", self.keepalive_count)):
+                if value is not None and hasattr(socket, name):
+                    sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, name), value)
+
+        if self.send_buffer:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.send_buffer)
+        if self.receive_buffer:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.receive_buffer)
+
+
+class Transport(object):
+    """
+    Sends and receives data over the socket connected to a CasparCG server.
+
+    Outgoing data is queued with :py:meth:`queue` and written by :py:meth:`flush`. Whatever has been queued by the time
+    a flush starts goes out in a single write, and while one thread is flushing, others that queue data and flush just
+    leave it for that thread to write on its next pass - so commands sent from several threads at once are coalesced
+    into as few writes (and TCP segments) as possible.
+
+    Incoming data is read in blocks of *buffer_size* and buffered, rather than a byte at a time.
+
+    :param socket.socket sock: The connected socket.
+    :param int buffer_size: The most data to read from the socket at once.
+    """
+
+    def __init__(self, sock, buffer_size=65536):
+        self.socket = sock
+        self.buffer_size = buffer_size
+
+        self._queue = []
+        self._queue_lock = threading.Lock()
+        self._flushing = False
+
+        self._received = ""
+
+        # The number of send and recv calls made, and the number of bytes that went through them
+        self.sends = 0
+        self.recvs = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def queue(self, data):
+        """
+        Queues data to be sent by the next :py:meth:`flush`.
+
+        :param str data: The data to send.
+        """
+        with self._queue_lock:
+            self._queue.append(data)
+
+    def flush(self):
+        """
+        Writes everything that has been queued. If another thread is already flushing, the data is left for it to
+        write, and this returns straight away.
+        """
+        with self._queue_lock:
+            if self._flushing or not self._queue:
+                return
+            self._flushing = True
+
+        try:
+            while True:
+                with self._queue_lock:
+                    if not self._queue:
+                        self._flushing = False
+                        return
+                    data = "".join(self._queue)
+                    del self._queue[:]
+
+                self.socket.sendall(data)
+                self.sends += 1
+                self.bytes_sent += len(data)
+        except Exception:
+            with self._queue_lock:
+                del self._queue[:]
+                self._flushing = False
+            raise
+
+    def send(self, data):
+        """
+        Queues data and flushes it straight away.
+
+        :param str data: The data to send.
+        """
+        self.queue(data)
+        self.flush()
+
+    def read_until(self, delimiter):
+        """
+        Reads from the socket until *delimiter* is found.
+
+        :param str delimiter: The character sequence that marks the end of what is wanted.
+        :rtype: str
+        :return: Everything up to and including the first *delimiter*. Anything after it is kept for the next read.
+        """
+        received = self._received
+        start = 0
+        while True:
+            end = received.find(delimiter, start)
+            if end != -1:
+                end += len(delimiter)
+                self._received = received[end:]
+                return received[:end]
+
+            # The delimiter could straddle the end of what we've got so far
+            start = max(0, len(received) - len(delimiter) + 1)
+            data = self.socket.recv(self.buffer_size)
+            self.recvs += 1
+            if not data:
+                self._received = received
+                raise IOError("The CasparCG server closed the connection")
+            self.bytes_received += len(data)
+            received += data
+
+    def get_stats(self):
+        """
+        :rtype: Dict
+        :return: A dict containing the number of *sends* and *recvs* made, and the numbers of *bytes_sent* and \
+        *bytes_received*.
+        """
+        return {"sends": self.sends,
+                "recvs": self.recvs,
+                "bytes_sent": self.bytes_sent,
+                "bytes_received": self.bytes_received}
@@ -0,0 +1,199 @@
+import time
+import amcp
+
+# If we don't know how big a template is, assume that it needs a full 1080 RGBA frame
+DEFAULT_TEMPLATE_MEMORY = 1920 * 1080 * 4
+
+
+def estimate_template_memory(template):
+    """
+    Estimates how much memory the template host needs to keep a template loaded, based on the size of its frame.
+
+    :param Template template: The :py:class:`~caspartalk.CasparObjects.Template` to estimate.
+    :rtype: int
+    :return: The estimated number of bytes.
+    """
+    try:
+        width = int(template.original_width)
+        height = int(template.original_height)
+    except (TypeError, ValueError):
+        return DEFAULT_TEMPLATE_MEMORY
+
+    if width <= 0 or height <= 0:
+        return DEFAULT_TEMPLATE_MEMORY
+    return width * height * 4
+
+
+class WarmPool(object):
+    """
+    Keeps a set of templates loaded (but not playing) on scratch CG layers, so that the template host doesn't have to
+    load them from scratch the first time they're taken to air.
+
+    The templates are taken from the server's catalog (:py:attr:`CasparServer.templates`). If *template_names* is
+    given, only those templates are warmed, in that order of priority; otherwise every template in the catalog is a
+    candidate. Templates are warmed until either *layer_budget* scratch layers or *memory_budget* bytes (estimated with
+    *memory_estimator*) have been used up.
+
+    The pool warms itself when it is created, and again every time the server reconnects.
+
+    Take templates to air with :py:meth:`take`. The time taken by each take is recorded per template, separately for
+    templates that were warm and templates that were cold - see :py:meth:`get_latencies`.
+
+    :param CasparServer server: The :py:class:`~caspartalk.CasparServer` to warm templates on.
+    :param template_names: The names of the templates to warm, most important first.
+    :param int channel: The channel that the scratch layers are on.
+    :param int layer: The layer that the scratch CG layers are on. This shouldn't be used for anything else.
+    :param int layer_budget: The maximum number of templates to keep warm.
+    :param int memory_budget: The maximum estimated memory, in bytes, to use for warm templates. None for no limit.
+    :param memory_estimator: A function that takes a :py:class:`~caspartalk.CasparObjects.Template` and returns the \
+    number of bytes it is expected to use.
+    """
+
+    def __init__(self, server, template_names=None, channel=1, layer=990, layer_budget=8, memory_budget=None,
+                 memory_estimator=estimate_template_memory):
+        self.server = server
+        self.template_names = template_names
+        self.channel = channel
+        self.layer = layer
+        self.layer_budget = layer_budget
+        self.memory_budget = memory_budget
+        self.memory_estimator = memory_estimator
+
+        # { template_name : (cg_layer, estimated_memory) }
+        self._resident = {}
+
+        # { template_name : [seconds, ...] }
+        self.warm_latencies = {}
+        self.cold_latencies = {}
+
+        self.server.add_connect_callback(self._on_connect)
+        self.warm()
+
+    def _on_connect(self, server):
+        # Anything that was loaded before has gone with the old connection (or the old server)
+        self._resident.clear()
+        self.warm()
+
+    def get_candidates(self):
+        """
+        :rtype: List
+        :return: The :py:class:`~caspartalk.CasparObjects.Template` s that should be warm, most important first.
+        """
+        catalog = dict((t.file_name, t) for t in self.server.templates)
+        if self.template_names is None:
+            return [catalog[name] for name in sorted(catalog)]
+        return [catalog[name] for name in self.template_names if name in catalog]
+
+    def get_memory_used(self):
+        """
+        :rtype: int
+        :return: The estimated number of bytes used by the warm templates.
+        """
+        return sum(memory for cg_layer, memory in self._resident.itervalues())
+
+    def is_warm(self, template_name):
+        """
+        :param str template_name: The name of the template.
+        :rtype: Bool
+        :return: True if the template is loaded on a scratch layer.
+        """
+        return template_name in self._resident
+
+    def warm(self):
+        """
+        Loads as many of the candidate templates as the budgets allow onto scratch layers. Templates that are no
+        longer candidates (e.g. because they've been removed from the catalog) are unloaded first.
+
+        :rtype: int
+        :return: The number of templates that are warm.
+        """
+        candidates = self.get_candidates()
+        wanted = set(t.file_name for t in candidates)
+
+        for name in self._resident.keys():
+            if name not in wanted:
+                self.unload(name)
+
+        used_memory = self.get_memory_used()
+        for template in candidates:
+            if len(self._resident) >= self.layer_budget:
+                break
+            if template.file_name in self._resident:
+                continue
+
+            memory = self.memory_estimator(template)
+            if self.memory_budget is not None and used_memory + memory > self.memory_budget:
+                # This one doesn't fit, but a smaller one further down the list might
+                continue
+
+            cg_layer = self._free_cg_layer()
+            start = time.time()
+            if amcp.cg_add(self.server, template.file_name, self.channel, self.layer, cg_layer, 0):
+                # The first load is a cold one, so it's a useful measure of what warming saves
+                self.cold_latencies.setdefault(template.file_name, []).append(time.time() - start)
+                self._resident[template.file_name] = (cg_layer, memory)
+                used_memory += memory
+
+        return len(self._resident)
+
+    def unload(self, template_name):
+        """
+        Removes a warm template from its scratch layer.
+
+        :param str template_name: The name of the template.
+        """
+        resident = self._resident.pop(template_name, None)
+        if resident is not None:
+            amcp.cg_remove(self.server, self.channel, self.layer, resident[0])
+
+    def _free_cg_layer(self):
+        used = set(cg_layer for cg_layer, memory in self._resident.itervalues())
+        cg_layer = 0
+        while cg_layer in used:
+            cg_layer += 1
+        return cg_layer
+
+    def take(self, template, channel=1, layer=10, cg_layer=0, data=None):
+        """
+        Loads a template and plays it straight away (CG ADD with *play_on_load* set to 1), recording how long it took.
+
+        :param template: The name of the template, or the :py:class:`~caspartalk.CasparObjects.Template` itself.
+        :param int channel: The number of the channel to play the template on.
+        :param int layer: The number of the layer to play the template on.
+        :param int cg_layer: The number of the CG layer to play the template on.
+        :param data: The data to fill the template with - see :py:func:`~caspartalk.AMCP.cg_add`.
+        :rtype: Bool
+        :return: True if successful, otherwise False.
+        """
+        name = getattr(template, "file_name", template)
+        latencies = self.warm_latencies if name in self._resident else self.cold_latencies
+
+        start = time.time()
+        ok = amcp.cg_add(self.server, template, channel, layer, cg_layer, 1, data)
+        if ok:
+            latencies.setdefault(name, []).append(time.time() - start)
+        return ok
+
+    def get_latencies(self):
+        """
+        Gets the mean take latency of each template, cold and warm, in seconds.
+
+        :rtype: Dict
+        :return: A dict of the form ``{ template_name : {"cold": seconds, "warm": seconds}, ... }``. Latencies that \
+        haven't been measured are None.
+        """
+        report = {}
+        for name in set(self.cold_latencies) | set(self.warm_latencies):
+            report[name] = {}
+            for kind, latencies in (("cold", self.cold_latencies), ("warm", self.warm_latencies)):
+                measured = latencies.get(name)
+                report[name][kind] = sum(measured) / len(measured) if measured else None
+        return report
+
+    def close(self):
+        """
+        Unloads every warm template and stops re-warming on reconnect.
+        """
+        self.server.remove_connect_callback(self._on_connect)
+        for name in self._resident.keys():
+            self.unload(name)
@@ -0,0 +1,559 @@
+import sys
+import xml.etree.cElementTree as cET
+import CasparObjects
+import CasparServer
+import ServerState
+
+# Declarative binding of the XML that CasparCG returns from its INFO commands onto Python objects.
+#
+# A schema is a tree of Elements and Fields. An Element says what object (if any) an XML element becomes, and how it
+# is attached to its parent's object; a Field says how the text of a leaf element is converted and stored. Each
+# Element keeps a single dispatch dict of { tag : Element or Field } for its children, so binding an element only
+# takes one dict lookup. Elements that aren't in the schema are skipped, along with everything inside them.
+#
+# Documents are bound as they stream through the parser: the parser calls straight into the dispatch tables, so no
+# element tree is ever built and nothing is held once its element has closed.
+
+
+class Field(object):
+    """
+    A leaf element whose text is converted and stored on the current object.
+
+    :param setter: A function ``setter(obj, value)`` that stores the converted value.
+    :param convert: A function that converts the element's text. If it raises ValueError, nothing is stored, so the \
+    object keeps its default.
+    """
+
+    __slots__ = ("setter", "convert")
+
+    def __init__(self, setter, convert):
+        self.setter = setter
+        self.convert = convert
+
+    def store(self, obj, text):
+        try:
+            value = self.convert(text or "")
+        except ValueError:
+            return
+        self.setter(obj, value)
+
+
+class Element(object):
+    """
+    An element that becomes an object, or groups fields and elements that belong to its parent's object.
+
+    :param factory: A function that takes the element's attributes and returns a new object. If None, the element's \
+    fields and children are bound to its parent's object.
+    :param attach: A function ``attach(parent_obj, obj, attributes)``, called once the element (and everything in it) \
+    has been bound.
+    :param dict fields: ``{ tag : Field }`` for the element's leaf children.
+    :param dict children: ``{ tag : Element }`` for the element's other children.
+    :param dict attributes: ``{ attribute : Field }`` for the element's own attributes.
+    :param fallback: A function that takes the tag of a child that isn't in *fields* or *children*, and returns a \
+    Field or Element for it (or None to skip it). The answer is remembered for next time.
+    """
+
+    __slots__ = ("factory", "attach", "attributes", "dispatch", "fallback")
+
+    def __init__(self, factory=None, attach=None, fields=None, children=None, attributes=None, fallback=None):
+        self.factory = factory
+        self.attach = attach
+        self.attributes = attributes or {}
+        self.fallback = fallback
+
+        self.dispatch = {}
+        self.dispatch.update(fields or {})
+        self.dispatch.update(children or {})
+
+    def lookup(self, tag):
+        try:
+            return self.dispatch[tag]
+        except KeyError:
+            handler = self.fallback(tag) if self.fallback else None
+            self.dispatch[tag] = handler
+            return handler
+
+    def create(self, parent_obj, attrib):
+        obj = self.factory(attrib) if self.factory else parent_obj
+        for name, field in self.attributes.iteritems():
+            if name in attrib:
+                field.store(obj, attrib[name])
+        return obj
+
+
+class _BindingTarget(object):
+    # A parser target that binds elements as expat reports them, so that no element tree is ever built.
+
+    def __init__(self, schema, root, root_tag):
+        self.schema = schema
+        self.root_tag = root_tag
+        self.result = root
+        # (handler, obj, attrib) for each open element. A handler of None means the element is being skipped.
+        self.stack = []
+        # The text of the current leaf element
+        self.text = []
+        # The parser doesn't pass on exceptions raised by its target, so the first one is kept here for bind() to
+        # raise once parsing has finished
+        self.error = None
+
+    def start(self, tag, attrib):
+        stack = self.stack
+        try:
+            if stack:
+                parent_handler, obj, parent_attrib = stack[-1]
+                handler = parent_handler.lookup(tag) if type(parent_handler) is Element else None
+                if type(handler) is Element:
+                    obj = handler.create(obj, attrib)
+                elif type(handler) is Field:
+                    del self.text[:]
+            elif self.root_tag is not None and tag != self.root_tag:
+                # Not the document we were expecting - skip the whole thing
+                self.result = handler = obj = None
+            else:
+                handler = self.schema
+                if self.result is None:
+                    self.result = handler.create(None, attrib)
+                else:
+                    handler.create(self.result, attrib)
+                obj = self.result
+        except Exception:
+            if self.error is None:
+                self.error = sys.exc_info()
+            handler = obj = None
+        stack.append((handler, obj, attrib))
+
+    def data(self, text):
+        self.text.append(text)
+
+    def end(self, tag):
+        stack = self.stack
+        handler, obj, attrib = stack.pop()
+        try:
+            if type(handler) is Field:
+                handler.store(obj, "".join(self.text))
+            elif type(handler) is Element and handler.attach is not None and stack:
+                handler.attach(stack[-1][1], obj, attrib)
+        except Exception:
+            if self.error is None:
+                self.error = sys.exc_info()
+
+    def close(self):
+        return self.result
+
+
+def bind(source, schema, root=None, root_tag=None):
+    """
+    Binds an XML document onto objects, following *schema*.
+
+    The document is bound as it is parsed - the parser calls straight into the schema's dispatch tables, and no
+    element tree is built, so each element is finished with as soon as it closes.
+
+    :param source: The XML - a string, a list of lines (as returned by \
+    :py:meth:`~caspartalk.CasparServer.send_amcp_command`), or a file-like object.
+    :param Element schema: The schema for the document's root element.
+    :param root: The object to bind the root element onto. If None, one is made with the schema's *factory*.
+    :param str root_tag: If given, the document's root element must have this tag.
+    :return: The root object, or None if the root element's tag wasn't *root_tag*.
+    """
+    target = _BindingTarget(schema, root, root_tag)
+    parser = cET.XMLParser(target=target)
+    if isinstance(source, (list, tuple)):
+        # One big feed is quicker than one per line
+        parser.feed("".join(source))
+    elif isinstance(source, basestring):
+        parser.feed(source)
+    else:
+        for chunk in iter(lambda: source.read(16384), ""):
+            parser.feed(chunk)
+    result = parser.close()
+
+    if target.error is not None:
+        raise target.error[0], target.error[1], target.error[2]
+    return result
+
+
+# Setters and converters for building schemas
+
+
+def set_attr(name):
+    """
+    :return: A setter that sets the attribute *name* of the object.
+    """
+    def setter(obj, value):
+        setattr(obj, name, value)
+    return setter
+
+
+def set_item(attr, key):
+    """
+    :return: A setter that sets ``obj.attr[key]``, or ``obj[key]`` if *attr* is None.
+    """
+    if attr is None:
+        def setter(obj, value):
+            obj[key] = value
+    else:
+        def setter(obj, value):
+            getattr(obj, attr)[key] = value
+    return setter
+
+
+def to_text(text):
+    return text.strip()
+
+
+def to_bool(text):
+    # CasparCG's config values are often padded, so look for "true" anywhere
+    return "true" in text.lower()
+
+
+def to_int(text):
+    return int(text.strip())
+
+
+def to_enum(enum, prefix=""):
+    """
+    :param enum: An Enum, e.g. ``CasparServer.video_mode``.
+    :param str prefix: A prefix that the Enum's keys have but the XML values don't, e.g. "vm\_".
+    :return: A converter that turns a value such as "1080i5000" into the matching member of *enum*.
+    """
+    members = dict((str(m)[len(prefix):].lower(), m) for m in enum)
+
+    def convert(text):
+        try:
+            return members[text.strip().lower()]
+        except KeyError:
+            raise ValueError("'{text}' is not one of {members}".format(text=text.strip(), members=sorted(members)))
+    return convert
+
+
+def to_int_or_auto(text):
+    text = text.strip()
+    if text == "auto":
+        return text
+    return int(text)
+
+
+def _appender(attr):
+    def attach(parent, obj, attrib):
+        getattr(parent, attr).append(obj)
+    return attach
+
+
+def _fields(setter_factory, spec):
+    # Builds { tag : Field } from { tag : (name, converter) }
+    return dict((tag, Field(setter_factory(name), convert)) for tag, (name, convert) in spec.iteritems())
+
+
+# INFO CONFIG
+
+def _consumer(factory, spec):
+    return Element(factory=lambda attrib: factory(), attach=_appender("consumers"),
+                   fields=_fields(set_attr, spec))
+
+
+def _config_schema():
+    cs = CasparServer
+    layout = to_enum(cs.channel_layout)
+
+    consumers = Element(children={
+        "decklink": _consumer(cs.ConsumerDecklink, {
+            "device": ("device", to_int),
+            "key-device": ("key_device", to_int),
+            "embedded-audio": ("embedded_audio", to_bool),
+            "channel-layout": ("channel_layout", layout),
+            "latency": ("latency", to_enum(cs.latency)),
+            "keyer": ("keyer", to_enum(cs.keyer)),
+            "key-only": ("key_only", to_bool),
+            "buffer-depth": ("buffer_depth", to_int),
+            "custom-allocator": ("custom_allocator", to_bool)}),
+        "bluefish": _consumer(cs.ConsumerBluefish, {
+            "device": ("device", to_int),
+            "embedded-audio": ("embedded_audio", to_bool),
+            "channel-layout": ("channel_layout", layout),
+            "key-only": ("key_only", to_bool)}),
+        "system-audio": _consumer(cs.ConsumerSystemAudio, {}),
+        "screen": _consumer(cs.ConsumerScreen, {
+            "device": ("device", to_int),
+            "aspect-ratio": ("aspect_ratio", to_enum(cs.aspect_ratio)),
+            "stretch": ("stretch", to_enum(cs.stretch)),
+            "windowed": ("windowed", to_bool),
+            "key-only": ("key_only", to_bool),
+            "auto-deinterlace": ("auto_deinterlace", to_bool),
+            "vsync": ("vsync", to_bool),
+            "name": ("name", to_text),
+            "borderless": ("borderless", to_bool)}),
+        "newtek-ivga": _consumer(cs.ConsumerNewtekIVGA, {
+            "channel-layout": ("channel_layout", layout),
+            "provide-sync": ("provide_sync", to_bool)}),
+        "file": _consumer(cs.ConsumerFile, {
+            "path": ("path", to_text),
+            "vcodec": ("vcodec", to_enum(cs.vcodec)),
+            "separate-key": ("separate_key", to_bool)}),
+        "stream": _consumer(cs.ConsumerStream, {
+            "path": ("path", to_text),
+            "args": ("args", to_text)})})
+
+    channel = Element(factory=lambda attrib: cs.Channel(ch_consumers=[]), attach=_appender("channels"),
+                      fields=_fields(set_attr, {
+                          "video-mode": ("video_mode", to_enum(cs.video_mode, "vm_")),
+                          "channel-layout": ("channel_layout", layout),
+                          "straight-alpha-output": ("straight_alpha_output", to_bool)}),
+                      children={"consumers": consumers})
+
+    template_host = Element(factory=lambda attrib: cs.TemplateHost(), attach=_appender("template_hosts"),
+                            fields=_fields(set_attr, {
+                                "video-mode": ("video_mode", to_enum(cs.video_mode, "vm_")),
+                                "filename": ("filename", to_text),
+                                "width": ("width", to_int),
+                                "height": ("height", to_int)}))
+
+    tcp = Element(factory=lambda attrib: cs.TCPController(None), attach=_appender("controllers"),
+                  fields=_fields(set_attr, {
+                      "port": ("port", to_int),
+                      "protocol": ("protocol", to_enum(cs.tcp_protocol))}))
+
+    predefined_client = Element(factory=lambda attrib: cs.OSCPredefinedClient(),
+                                attach=_appender("predefined_clients"),
+                                fields=_fields(set_attr, {
+                                    "address": ("address", to_text),
+                                    "port": ("port", to_int)}))
+
+    osc = Element(factory=lambda attrib: cs.OSC(), attach=_appender("osc"),
+                  fields=_fields(set_attr, {"default-port": ("default_port", to_int)}),
+                  children={"predefined-clients": Element(children={"predefined-client": predefined_client})})
+
+    def attach_channel_layout(audio, cl, attrib):
+        audio.channel_layouts[cl.name] = cl
+
+    def add_mapping(mix_config, mapping):
+        mix_config.mappings += (mapping,)
+
+    channel_layout = Element(factory=lambda attrib: cs.AudioChannelLayout(None, None, 0),
+                             attach=attach_channel_layout,
+                             fields=_fields(set_attr, {
+                                 "name": ("name", to_text),
+                                 "type": ("type", to_text),
+                                 "num-channels": ("num_channels", to_int),
+                                 "channels": ("channels", to_text)}))
+
+    mix_config = Element(factory=lambda attrib: cs.AudioMixConfig(None, None, None, ()),
+                         attach=_appender("mix_configs"),
+                         fields=_fields(set_attr, {
+                             "from": ("from_", to_text),
+                             "to": ("to", to_text),
+                             "mix": ("mix", to_text)}),
+                         children={"mappings": Element(fields={"mapping": Field(add_mapping, to_text)})})
+
+    audio = Element(factory=lambda attrib: cs.AudioConfig(False),
+                    attach=lambda conf, audio_config, attrib: setattr(conf, "audio_configs", audio_config),
+                    children={"channel-layouts": Element(children={"channel-layout": channel_layout}),
+                              "mix-configs": Element(children={"mix-config": mix_config})})
+
+    fields = _fields(set_attr, {
+        "log-level": ("log_level", to_enum(cs.log_level)),
+        "channel-grid": ("channel_grid", to_bool),
+        "auto-deinterlace": ("auto_deinterlace", to_bool),
+        "auto-transcode": ("auto_transcode", to_bool),
+        "pipeline-tokens": ("pipeline_tokens", to_int)})
+
+    mixer = Element(fields=_fields(lambda key: set_item("mixer", key), {
+        "blend-modes": ("blend_modes", to_bool),
+        "straight-alpha": ("straight_alpha", to_bool),
+        "chroma-key": ("chroma_key", to_bool),
+        "mipmapping_default_on": ("mipmapping_default_on", to_bool)}))
+
+    flash = Element(fields=_fields(lambda key: set_item("flash", key), {
+        "buffer-depth": ("buffer_depth", to_int_or_auto)}))
+
+    thumbnails = Element(fields=_fields(lambda key: set_item("thumbnails", key), {
+        "generate-thumbnails": ("generate_thumbnails", to_bool),
+        "width": ("width", to_int),
+        "height": ("height", to_int),
+        "video-grid": ("video_grid", to_int),
+        "scan-interval-millis": ("scan_interval_millis", to_int),
+        "generate-delay-millis": ("generate_delay_millis", to_int),
+        "video-mode": ("video_mode", to_enum(cs.video_mode, "vm_")),
+        "mipmap": ("mipmap", to_bool)}))
+
+    return Element(factory=lambda attrib: cs.ServerConfig(), fields=fields, children={
+        "mixer": mixer,
+        "flash": flash,
+        "thumbnails": thumbnails,
+        "template-hosts": Element(children={"template-host": template_host}),
+        "channels": Element(children={"channel": channel}),
+        "controllers": Element(children={"tcp": tcp}),
+        "osc": osc,
+        "audio": audio})
+
+
+# INFO PATHS
+
+def _paths_schema():
+    def fallback(tag):
+        # <media-path>, <log-path>... are all stored under the first part of their name
+        if tag.endswith("-path"):
+            return Field(set_item(None, tag.split("-")[0]), to_text)
+        return None
+
+    return Element(factory=lambda attrib: {}, fallback=fallback)
+
+
+# INFO SYSTEM
+
+def _dict_element(spec, attach_key=None, children=None):
+    # An element that becomes a dict of { key : text }, stored in its parent dict under *attach_key*
+    attach = None
+    if attach_key:
+        def attach(parent, obj, attrib):
+            parent[attach_key] = obj
+    return Element(factory=lambda attrib: {}, attach=attach, children=children,
+                   fields=dict((tag, Field(set_item(None, key), to_text)) for tag, key in spec.iteritems()))
+
+
+def _system_schema():
+    ffmpeg = _dict_element({"avcodec": "avcodec", "avformat": "avformat", "avfilter": "avfilter",
+                            "avutil": "avutil", "swscale": "swscale"}, "ffmpeg")
+    caspar = _dict_element({"flash": "flash", "template-host": "template_host", "free-image": "free_image"},
+                           "caspar", {"ffmpeg": ffmpeg})
+    windows = _dict_element({"name": "name", "service-pack": "service_pack"}, "windows")
+    return _dict_element({"name": "name", "cpu": "cpu"}, children={"windows": windows, "caspar": caspar})
+
+
+# INFO TEMPLATE
+
+def _template_schema():
+    co = CasparObjects
+    intern_string = co.intern_string
+
+    def attach_component(template, properties, attrib):
+        template.components[intern_string(attrib["name"])] = properties
+
+    def attach_property(properties, prop, attrib):
+        properties[prop.id] = prop
+
+    def attach_instance(template, obj, attrib):
+        # Only keep instances of components that the template actually has
+        if attrib.get("type") in template.components:
+            template.instances[intern_string(attrib["name"])] = intern_string(attrib["type"])
+
+    def attach_keyframe(template, obj, attrib):
+        template.keyframes.append(intern_string(attrib["name"]))
+
+    def attach_parameter(template, param, attrib):
+        template.parameters[param.id] = param
+
+    component = Element(factory=lambda attrib: co.TypedDict(co.ComponentProperty), attach=attach_component,
+                        children={"property": Element(
+                            factory=lambda a: co.ComponentProperty(a["name"], a["type"], a.get("info")),
+                            attach=attach_property)})
+
+    parameter = Element(factory=lambda a: co.TemplateParameter(a["id"], a["type"], a.get("info")),
+                        attach=attach_parameter)
+
+    attributes = _fields(set_attr, {
+        "version": ("version", intern_string),
+        "authorName": ("author_name", intern_string),
+        "authorEmail": ("author_email", intern_string),
+        "templateInfo": ("template_info", intern_string),
+        "originalWidth": ("original_width", to_text),
+        "originalHeight": ("original_height", to_text),
+        "originalFrameRate": ("original_frame_rate", to_text)})
+
+    return Element(attributes=attributes, children={
+        "components": Element(children={"component": component}),
+        "keyframes": Element(children={"keyframe": Element(attach=attach_keyframe)}),
+        "instances": Element(children={"instance": Element(attach=attach_instance)}),
+        "parameters": Element(children={"parameter": parameter})})
+
+
+# INFO SERVER
+
+# Producers that wrap other producers put them inside one of these
+_nested_producer_tags = ("fill", "key", "source", "destination")
+
+
+def _producer(attach):
+    ss = ServerState
+
+    def fallback(tag):
+        if tag in _nested_producer_tags:
+            def attach_nested(producer, nested, attrib):
+                producer.producers[tag] = nested
+            return Element(children={"producer": _producer(attach_nested)})
+        return Field(set_item("properties", tag), to_text)
+
+    return Element(factory=lambda attrib: ss.ProducerState(), attach=attach, fallback=fallback,
+                   fields=_fields(set_attr, {"type": ("type", to_text),
+                                             "filename": ("filename", to_text)}))
+
+
+def _layer_schema():
+    ss = ServerState
+
+    def attach_layer(channel, layer, attrib):
+        channel.layers[layer.index] = layer
+
+    fields = _fields(set_attr, {
+        "index": ("index", to_int),
+        "status": ("status", to_text),
+        "auto_delta": ("auto_delta", to_text),
+        "frame-number": ("frame_number", to_int),
+        "nb_frames": ("nb_frames", to_int),
+        "nb-frames": ("nb_frames", to_int),
+        "frames-left": ("frames_left", to_int)})
+
+    return Element(factory=lambda attrib: ss.LayerState(), attach=attach_layer, fields=fields, children={
+        "foreground": Element(children={"producer": _producer(
+            lambda layer, producer, attrib: setattr(layer, "foreground", producer))}),
+        "background": Element(children={"producer": _producer(
+            lambda layer, producer, attrib: setattr(layer, "background", producer))})})
+
+
+def _channel_schema():
+    ss = ServerState
+
+    def attach_channel(server_state, channel, attrib):
+        # Older servers don't give the index, so go by the order of the channels
+        if channel.index is None:
+            channel.index = len(server_state.channels) + 1
+        server_state.channels[channel.index] = channel
+
+    consumer = Element(factory=lambda attrib: {}, attach=lambda channel, c, attrib: channel.consumers.append(c),
+                       fallback=lambda tag: Field(set_item(None, tag), to_text))
+
+    return Element(factory=lambda attrib: ss.ChannelState(), attach=attach_channel,
+                   fields=_fields(set_attr, {"index": ("index", to_int),
+                                             "video-mode": ("video_mode", to_text)}),
+                   children={
+                       "stage": Element(children={"layers": Element(children={"layer": get_schema("layer")})}),
+                       "mixer": Element(fallback=lambda tag: Field(set_item("mixer", tag), to_text)),
+                       "output": Element(children={"consumers": Element(children={"consumer": consumer})})})
+
+
+def _server_schema():
+    return Element(factory=lambda attrib: ServerState.ServerState(), children={"channel": get_schema("channel")})
+
+
+_schema_builders = {"config": _config_schema,
+                    "paths": _paths_schema,
+                    "system": _system_schema,
+                    "template": _template_schema,
+                    "server": _server_schema,
+                    "channel": _channel_schema,
+                    "layer": _layer_schema}
+_schemas = {}
+
+
+def get_schema(name):
+    """
+    Gets one of the built-in schemas, building it the first time it's asked for. (They can't be built when this module
+    is imported, as CasparServer may not have finished importing yet.)
+
+    :param str name: "config", "paths", "system", "template", or "server" (INFO SERVER), "channel" or "layer" (one \
+    channel or layer from it).
+    :rtype: :py:class:`Element`
+    """
+    schema = _schemas.get(name)
+    if schema is None:
+        schema = _schemas[name] = _schema_builders[name]()
+    return schema
@@ -1,10 +1,14 @@
+import collections
 import json
-import xml.etree.cElementTree as cET
-import StringIO
-import string
+import AMCPCommands
 import CasparExceptions
 import CasparObjects
 import CasparServer
+import XMLBinding
+
+
+# One file in a TLS or CLS listing. *file_type* is e.g. "MOVIE" or "STILL" for media, and "TEMPLATE" for templates.
+ListingEntry = collections.namedtuple("ListingEntry", ["name", "file_type", "size", "timestamp"])
 
 
 # Query commands - return info about various things
@@ -37,6 +41,53 @@ def tls(server):
     return templates
 
 
+def _parse_listing(response, default_type):
+    # TLS and CLS return one file per line, in the following fashion:
+    # "RELATIVE-PATH/NAME" [TYPE] SIZE-IN-BYTES TIMESTAMP [...]
+    entries = {}
+    for line in response or []:
+        if not line.startswith('"'):
+            continue
+        name, _, rest = line[1:].partition('"')
+        fields = rest.split()
+
+        file_type = default_type
+        if fields and not fields[0].isdigit():
+            file_type = fields.pop(0)
+        size = int(fields[0]) if fields and fields[0].isdigit() else None
+        timestamp = fields[1] if len(fields) > 1 else None
+
+        entries[name] = ListingEntry(name, file_type, size, timestamp)
+    return entries
+
+
+def tls_listing(server):
+    """
+    Lists all template files in the templates folder, along with their sizes and when they were last modified. This
+    can be used to tell which templates have changed since they were last listed.
+
+    :param CasparServer server: the :py:class:`~caspartalk.CasparServer` that the *amcp_command* will be sent to.
+    :rtype: Dict
+    :return: A dict of the form ``{ name : ListingEntry, ... }``.
+    """
+
+    # Listings are used to spot changes, so are always fetched fresh
+    return _parse_listing(server.send_amcp_command("TLS", use_cache=False), "TEMPLATE")
+
+
+def cls_listing(server):
+    """
+    Lists all media files in the media folder, along with their types, sizes and when they were last modified.
+
+    :param CasparServer server: the :py:class:`~caspartalk.CasparServer` that the *amcp_command* will be sent to.
+    :rtype: Dict
+    :return: A dict of the form ``{ name : ListingEntry, ... }``.
+    """
+
+    # Listings are used to spot changes, so are always fetched fresh
+    return _parse_listing(server.send_amcp_command("CLS", use_cache=False), None)
+
+
 def version(server, component=None):
     """
     Returns the version of the specified component. If *component* is None, then a list of all of the components
@@ -98,8 +149,6 @@ def info(server, channel=None, layer=None):
 
 def info_template(server, template_fn):
     """
-    .. warning:: This method has not been implemented in UberCarrot yet!
-
     Gets information about the specified template.
 
     :param CasparServer server: The :py:class:`~caspartalk.CasparServer` that the *amcp_command* will be sent to.
@@ -121,698 +170,39 @@ def info_template(server, template_fn):
     except CasparExceptions.IllegalParameterError:
         print "Cannot find template data for", template_fn
         return None
-    # for r in response:
-    #    print r
 
     template = CasparObjects.Template(server, template_fn)
 
-    el_template = cET.fromstringlist(response)
-
-    print "Template:", template_fn
-
-    if el_template.tag != "template":
+    # The components, keyframes, instances and parameters are all bound onto the Template - see XMLBinding
+    if XMLBinding.bind(response, XMLBinding.get_schema("template"), template, root_tag="template") is None:
         print "No Template found!"
         return None
 
-    if el_template.attrib:
-        print el_template.attrib.keys()
-
-        # Find the basic information about the Template
-        if "version" in el_template.attrib.keys():
-            template.version = el_template.attrib["version"]
-        if "authorName" in el_template.attrib.keys():
-            template.author_name = el_template.attrib["authorName"]
-        if "authorEmail" in el_template.attrib.keys():
-            template.author_email = el_template.attrib["authorEmail"]
-        if "templateInfo" in el_template.attrib.keys():
-            template.template_info = el_template.attrib["templateInfo"]
-        if "originalWidth" in el_template.attrib.keys():
-            template.original_width = el_template.attrib["originalWidth"]
-        if "originalHeight" in el_template.attrib.keys():
-            template.original_height = el_template.attrib["originalHeight"]
-        if "originalFrameRate" in el_template.attrib.keys():
-            template.original_frame_rate = el_template.attrib[
-                "originalFrameRate"]
-
-    # Find all the components and their properties, then add these to the
-    # Template
-    el_components = el_template.find("components").findall("component")
-    if el_components is not None and len(list(el_components)):
-        for comp in list(el_components):
-            print "\tFound component", comp.attrib["name"]
-            el_comp_properties = comp.findall("property")
-            prop_id = prop_type = prop_info = None
-            for prop in el_comp_properties:
-                prop_id = prop.attrib["name"]
-                print "\t\tID:", prop_id
-                prop_type = prop.attrib["type"]
-                print "\t\tType:", prop_type
-                prop_info = prop.attrib["info"]
-                print "\t\tInfo:", prop_info
-            comp_prop = CasparObjects.ComponentProperty(
-                prop_id, prop_type, prop_info)
-            template.components[comp.attrib["name"]] = CasparObjects.TypedDict(
-                CasparObjects.ComponentProperty)
-            template.components[comp.attrib["name"]][prop_id] = comp_prop
-    else:
-        print "\tNo components found"
-
-    # Find all the keyframes and add them to the Template
-    el_keyframes = el_template.find("keyframes")
-    if el_keyframes is not None and len(list(el_keyframes)):
-        for kf in list(el_keyframes):
-            print "\tFound keyframe:", kf.attrib["name"]
-            template.keyframes.append(kf.attrib["name"])
-    else:
-        print "\tNo keyframes found"
-
-    # Find all the instances and add them to the Template
-    el_instances = el_template.find("instances")
-    if el_instances is not None and len(list(el_instances)):
-        for inst in list(el_instances):
-            print "\tFound instance", inst.attrib["name"]
-            print "\t\tType:", inst.attrib["type"]
-            if template.components[inst.attrib["type"]]:
-                print "\t\tGood reference"
-                template.instances[inst.attrib["name"]] = inst.attrib["type"]
-            else:
-                print "Bad reference to", inst.attrib["type"]
-    else:
-        print "\tNo instances found"
-
-    # Find all the parameters and add them to the Template
-
-    el_parameters = el_template.find("parameters")
-    if el_parameters is not None:
-        for param in list(el_parameters):
-            param_id = param_type = param_info = None
-            param_id = param.attrib["id"]
-            print "\tFound parameter:", param_id
-            param_type = param.attrib["type"]
-            print "\t\tType:", param_type
-            param_info = param.attrib["info"]
-            print "\t\tInfo:", param_info
-            temp_param = CasparObjects.TemplateParameter(
-                param_id, param_type, param_info)
-            template.parameters[param_id] = temp_param
-    else:
-        print "\tNo parameters found"
-
     return template
 
 
-def info_config(server):
+def info_config(server, use_cache=True):
     """
     Gets the contents of the configuration used.
 
+    If the server has a :py:class:`~caspartalk.ConfigCache.ConfigCache` and *use_cache* is True, the reply is only
+    parsed if it differs from the last one - otherwise the cached ServerConfig is returned.
+
     :param CasparServer server: The :py:class:`~caspartalk.CasparServer` that the *amcp_command* will be sent to.
-    :rtype: :py:class:`caspartalk.casparServer.ServerConfig`
+    :param bool use_cache: If False, always parse the reply, and don't update the cache.
+    :rtype: :py:class:`caspartalk.CasparServer.ServerConfig`
     :return: A ServerConfig containing information about the configuration of the server.
     """
     # INFO CONFIG
 
     amcp_string = "INFO CONFIG"
     response = server.send_amcp_command(amcp_string)
-    response = StringIO.StringIO(string.join(response, ""))
-
-    # ==============================
-
-    server_conf = casparServer.ServerConfig()
-
-    # Let's go through the response!
-    # To check the text values, we'll use the 'x in elem.text' method, rather than the 'elem.text == x' method,
-    # as many of the values are whitespace-padded for readability in the XML config file.
-    # Similarly, the integer values will need casting to int by using int(x), as many of them are type-checked
-    # when assigning the values to a property of a class.
-
-    for event, elem in cET.iterparse(response):
-        if elem.tag == "log-level":
-            # <log-level>       trace [trace|debug|info|warning|error]</log-level>
-            for i in casparServer.log_level:
-                if str(i) in elem.tag:
-                    server_conf.log_level = i
-
-            elem.clear()
-
-        elif elem.tag == "channel-grid":
-            # <channel-grid>    false [true|false]</channel-grid>
-            if "true" in elem.tag:
-                server_conf.channel_grid = True
-            else:
-                server_conf.channel_grid = False
-            elem.clear()
-
-        elif elem.tag == "mixer":
-            # <mixer>
-            #    <blend-modes>          false [true|false]</blend-modes>
-            #    <straight-alpha>       false [true|false]</straight-alpha>
-            #    <chroma-key>           false [true|false]</chroma-key>
-            #    <mipmapping_default_on>false [true|false]</mipmapping_default_on>
-            # </mixer>
-            mixer_blend_mode = elem.findtext("blend-modes")
-            mixer_straight_alpha = elem.findtext("straight-alpha")
-            mixer_chroma_key = elem.findtext("chroma-key")
-            mixer_mipmapping_on = elem.findtext("mipmapping_default_on")
-
-            if mixer_blend_mode and "true" in mixer_blend_mode:
-                server_conf.mixer["blend_modes"] = True
-            if mixer_straight_alpha and "true" in mixer_straight_alpha:
-                server_conf.mixer["straight_alpha"] = True
-            if mixer_chroma_key and "true" in mixer_chroma_key:
-                server_conf.mixer["chroma_key"] = True
-            if mixer_mipmapping_on and "true" in mixer_mipmapping_on:
-                server_conf.mixer["mipmapping_default_on"] = True
-            elem.clear()
-
-        elif elem.tag == "auto-deinterlace":
-            # <auto-deinterlace>true  [true|false]</auto-deinterlace>
-            if "true" in elem.text:
-                server_conf.auto_deinterlace = True
-            else:
-                server_conf.auto_deinterlace = False
-            elem.clear()
-
-        elif elem.tag == "auto-transcode":
-            # <auto-transcode>  true  [true|false]</auto-transcode>
-            if "true" in elem.text:
-                server_conf.auto_transcode = True
-            else:
-                server_conf.auto_transcode = False
-            elem.clear()
-
-        elif elem.tag == "pipeline-tokens":
-            # <pipeline-tokens> 2     [1..]       </pipeline-tokens>
-            try:
-                server_conf.pipeline_tokens = int(elem.text)
-            except ValueError, e:
-                print e.message
-                server_conf.pipeline_tokens = 2
-            finally:
-                elem.clear()
-
-        elif elem.tag == "template-hosts":
-            # <template-hosts>
-            #    <template-host>
-            #        <video-mode/>
-            #        <filename/>
-            #        <width/>
-            #        <height/>
-            #    </template-host>
-            # </template-hosts>
-            th_video_mode = elem.findtext("video-mode")
-            th_filename = elem.findtext("filename")
-            th_width = elem.findtext("width")
-            th_height = elem.findtext("height")
-
-            for i in casparServer.video_mode:
-                if str(i) in elem.tag:
-                    th_video_mode = i
-            if th_width:
-                try:
-                    th_width = int(th_width)
-                except ValueError, e:
-                    print e.message
-                    th_width = 0
-            if th_height:
-                try:
-                    th_height = int(th_height)
-                except ValueError, e:
-                    print e.message
-                    th_height = 0
-            th = casparServer.TemplateHost(
-                th_video_mode, th_filename, th_width, th_height)
-            server_conf.template_hosts.append(th)
-            elem.clear()
-
-        elif elem.tag == "flash":
-            # <flash>
-            #     <buffer-depth>auto [auto|1..]</buffer-depth>
-            # </flash>
-            flash_buffer_depth = elem.findtext("buffer-depth")
-            if flash_buffer_depth and "auto" in flash_buffer_depth:
-                server_conf.flash["buffer_depth"] = "auto"
-            elif flash_buffer_depth:  # We've got a buffer depth, but it's not 'auto'
-                try:
-                    server_conf.flash["buffer_depth"] = int(flash_buffer_depth)
-                except ValueError, e:
-                    print e.message
-                    server_conf.flash["buffer_depth"] = "auto"
-            elem.clear()
-
-        elif elem.tag == "thumbnails":
-            # <thumbnails>
-            #     <generate-thumbnails>true [true|false]</generate-thumbnails>
-            #     <width>256</width>
-            #     <height>144</height>
-            #     <video-grid>2</video-grid>
-            #     <scan-interval-millis>5000</scan-interval-millis>
-            #     <generate-delay-millis>2000</generate-delay-millis>
-            #     <video-mode>720p2500</video-mode>
-            #     <mipmap>false</mipmap>
-            # </thumbnails>
-            thumb_generate_thumbnails = elem.findtext("thumbnails")
-            thumb_width = elem.findtext("width")
-            thumb_height = elem.findtext("height")
-            thumb_video_grid = elem.findtext("video-grid")
-            thumb_scan_int = elem.findtext("scan-interval-millis")
-            thumb_generate_delay = elem.findtext("generate-delay-millis")
-            thumb_video_mode = elem.findtext("video-mode")
-            thumb_mipmap = elem.findtext("mipmap")
-
-            if thumb_generate_thumbnails and "true" in thumb_generate_thumbnails:
-                server_conf.thumbnails["generate_thumbnails"] = True
-            else:
-                server_conf.thumbnails["generate_thumbnails"] = False
-            if thumb_width:
-                try:
-                    server_conf.thumbnails["width"] = int(thumb_width)
-                except ValueError, e:
-                    print e.message
-                    server_conf.thumbnails["width"] = 256
-            if thumb_height:
-                try:
-                    server_conf.thumbnails["height"] = int(thumb_height)
-                except ValueError, e:
-                    print e.message
-                    server_conf.thumbnails["height"] = 144
-            if thumb_video_grid:
-                try:
-                    server_conf.thumbnails[
-                        "video_grid"] = int(thumb_video_grid)
-                except ValueError, e:
-                    print e.message
-                    server_conf.thumbnails["video_grid"] = 2
-            if thumb_scan_int:
-                try:
-                    server_conf.thumbnails[
-                        "scan_interval_millis"] = int(thumb_scan_int)
-                except ValueError, e:
-                    print e.message
-                    server_conf.thumbnails["scan_interval_millis"] = 5000
-            if thumb_generate_delay:
-                try:
-                    server_conf.thumbnails["generate_delay_millis"] = int(
-                        thumb_generate_delay)
-                except ValueError, e:
-                    print e.message
-                    server_conf.thumbnails["generate_delay_millis"] = 2000
-            if thumb_video_mode:
-                for i in casparServer.video_mode:
-                    if str(i) in elem.tag:
-                        server_conf.thumbnails["video_mode"] = i
-            if thumb_mipmap and "true" in thumb_mipmap:
-                server_conf.thumbnails["mipmap"] = True
-            else:
-                server_conf.thumbnails["mipmap"] = False
-
-            elem.clear()
-
-        elif elem.tag == "channel":
-            # <channels>
-            #   <channel>
-
-            ch = casparServer.Channel()
-
-            #       <video-mode> PAL [PAL|NTSC| ... ] </video-mode>
-            #       <channel-layout>stereo [mono|stereo|dts|dolbye|dolbydigital|smpte|passthru]</channel-layout>
-            #       <straight-alpha-output>false [true|false]</straight-alpha-output>
-            #           <consumers>
-            chan_video_mode = elem.findtext("video_mode")
-            chan_layout = elem.findtext("channel-layout")
-            chan_straight_alpha = elem.findtext("straight-alpha-output")
-
-            if chan_video_mode:
-                for i in casparServer.video_mode:
-                    if str(i) in chan_video_mode:
-                        ch.video_mode = i
-            if chan_layout:
-                for i in casparServer.channel_layout:
-                    if str(i) in chan_layout:
-                        ch.channel_layout = i
-            if chan_straight_alpha and "true" in chan_straight_alpha:
-                ch.straight_alpha_output = True
-            else:
-                ch.straight_alpha_output = False
-
-            consumers_elem = elem.find("consumers")
-            if consumers_elem:
-                # <decklink>
-                #   <device>[1..]</device>
-                #   <key-device>device + 1 [1..]</key-device>
-                #   <embedded-audio>false [true|false]</embedded-audio>
-                #   <channel-layout>stereo [mono|stereo|dts|dolbye|dolbydigital|smpte|passthru]</channel-layout>
-                #   <latency>normal [normal|low|default]</latency>
-                #   <keyer>external [external|external_separate_device|internal|default]</keyer>
-                #   <key-only>false [true|false]</key-only>
-                #   <buffer-depth>3 [1..]</buffer-depth>
-                #   <custom-allocator>true [true|false]</custom-allocator>
-                # </decklink>
-                consumers_decklink = consumers_elem.findall("decklink")
-                for decklink_elem in consumers_decklink:
-                    dl = casparServer.ConsumerDecklink()
-
-                    deck_device = decklink_elem.findtext("device")
-                    deck_key_device = decklink_elem.findtext("key-device")
-                    deck_embedded_audio = decklink_elem.findtext(
-                        "embedded-audio")
-                    deck_channel_layout = decklink_elem.findtext(
-                        "channel-layout")
-                    deck_latency = decklink_elem.findtext("latency")
-                    deck_keyer = decklink_elem.findtext("keyer")
-                    deck_key_only = decklink_elem.findtext("key-only")
-                    deck_buffer_depth = decklink_elem.findtext("buffer-depth")
-                    deck_custom_allocator = decklink_elem.findtext(
-                        "custom-allocator")
-
-                    if deck_device:
-                        try:
-                            dl.device = int(deck_device)
-                        except ValueError, e:
-                            print e.message
-                            dl.device = 1
-                    if deck_key_device:
-                        try:
-                            dl.key_device = int(deck_key_device)
-                        except ValueError, e:
-                            print e.message
-                            dl.key_device = 2
-                    if deck_embedded_audio and "true" in deck_embedded_audio:
-                        dl.embedded_audio = True
-                    else:
-                        dl.embedded_audio = False
-                    if deck_channel_layout:
-                        for i in casparServer.channel_layout:
-                            if str(i) in deck_channel_layout:
-                                dl.channel_layout = i
-                    if deck_latency:
-                        for i in casparServer.latency:
-                            if str(i) in deck_latency:
-                                dl.latency = i
-                    if deck_keyer:
-                        for i in casparServer.keyer:
-                            if str(i) in deck_keyer:
-                                dl.keyer = i
-                    if deck_key_only and "true" in deck_key_only:
-                        dl.key_only = True
-                    else:
-                        dl.key_only = False
-                    if deck_buffer_depth:
-                        try:
-                            dl.buffer_depth = int(deck_buffer_depth)
-                        except ValueError, e:
-                            print e.message
-                            dl.buffer_depth = 3
-                    if deck_custom_allocator and "false" in deck_custom_allocator:
-                        dl.custom_allocator = False
-                    else:
-                        dl.custom_allocator = True
-
-                    ch.consumers.append(dl)
-                    decklink_elem.clear()
-
-                # <bluefish>
-                #   <device>[1..]</device>
-                #   <embedded-audio>false [true|false]</embedded-audio>
-                #   <channel-layout>stereo [mono|stereo|dts|dolbye|dolbydigital|smpte|passthru]</channel-layout>
-                #   <key-only>false [true|false]</key-only>
-                # </bluefish>
-                consumers_bluefish = consumers_elem.findall("bluefish")
-                for bluefish_elem in consumers_bluefish:
-                    bf = casparServer.ConsumerBluefish()
-
-                    blue_device = bluefish_elem.findtext("device")
-                    blue_embedded_audio = bluefish_elem.findtext(
-                        "embedded-audio")
-                    blue_channel_layout = bluefish_elem.findtext(
-                        "channel-layout")
-                    blue_key_only = bluefish_elem.findtext("key-only")
-
-                    if blue_device:
-                        try:
-                            bf.device = int(blue_device)
-                        except ValueError, e:
-                            print e.message
-                            bf.device = 1
-                    if blue_embedded_audio and "true" in blue_embedded_audio:
-                        bf.embedded_audio = True
-                    else:
-                        bf.embedded_audio = False
-                    if blue_channel_layout:
-                        for i in casparServer.channel_layout:
-                            if str(i) in blue_channel_layout:
-                                bf.channel_layout = i
-                    if blue_key_only and "true" in blue_key_only:
-                        bf.key_only = True
-                    else:
-                        bf.key_only = False
-
-                    ch.consumers.append(bf)
-                    bluefish_elem.clear()
-
-                # <system-audio></system-audio>
-                consumers_sysaudio = consumers_elem.findall("system-audio")
-                if consumers_sysaudio:
-                    sa = casparServer.ConsumerSystemAudio()
-                    ch.consumers.append(sa)
-
-                # <screen>
-                #   <device>[0..]</device>
-                #   <aspect-ratio>default [default|4:3|16:9]</aspect-ratio>
-                #   <stretch>fill [none|fill|uniform|uniform_to_fill]</stretch>
-                #   <windowed>false [true|false]</windowed>
-                #   <key-only>false [true|false]</key-only>
-                #   <auto-deinterlace>true [true|false]</auto-deinterlace>
-                #   <vsync>false [true|false]</vsync>
-                #   <name>[Screen Consumer]</name>
-                #   <borderless>false [true|false]</borderless>
-                # </screen>
-                consumers_screen_elem = consumers_elem.findall("screen")
-                for screen_elem in consumers_screen_elem:
-                    sc = casparServer.ConsumerScreen()
-
-                    scr_device = screen_elem.findtext("device")
-                    scr_aspect_ratio = screen_elem.findtext("aspect-ratio")
-                    scr_stretch = screen_elem.findtext("stretch")
-                    scr_windowed = screen_elem.findtext("windowed")
-                    scr_key_only = screen_elem.findtext("key-only")
-                    scr_auto_deinterlace = screen_elem.findtext(
-                        "auto-deinterlace")
-                    scr_vsync = screen_elem.findtext("vsync")
-                    scr_name = screen_elem.findtext("name")
-                    scr_borderless = screen_elem.findtext("borderless")
-
-                    if scr_device:
-                        try:
-                            sc.device = int(scr_device)
-                        except ValueError, e:
-                            print e.message
-                            sc.device = 0
-                    if scr_aspect_ratio:
-                        for i in casparServer.aspect_ratio:
-                            if str(i) in scr_aspect_ratio:
-                                sc.aspect_ratio = i
-                    if scr_stretch:
-                        for i in casparServer.stretch:
-                            if str(i) in scr_stretch:
-                                sc.stretch = i
-                    if scr_windowed and "true" in scr_windowed:
-                        sc.windowed = True
-                    else:
-                        sc.windowed = False
-                    if scr_key_only and "true" in scr_key_only:
-                        sc.key_only = True
-                    else:
-                        sc.key_only = False
-                    if scr_auto_deinterlace and "false" in scr_auto_deinterlace:
-                        sc.auto_deinterlace = False
-                    else:
-                        sc.auto_deinterlace = True
-                    if scr_vsync and "true" in scr_vsync:
-                        sc.vsync = True
-                    else:
-                        sc.vsync = False
-                    if scr_name:
-                        sc.name = scr_name
-                    else:
-                        sc.name = "[Screen Consumer]"
-                    if scr_borderless and "true" in scr_borderless:
-                        sc.borderless = True
-                    else:
-                        sc.borderless = False
-
-                    ch.consumers.append(sc)
-                    screen_elem.clear()
-
-                # <newtek-ivga>
-                #   <channel-layout>stereo [mono|stereo|dts|dolbye|dolbydigital|smpte|passthru]</channel-layout>
-                #   <provide-sync>true [true|false]</provide-sync>
-                # </newtek-ivga>
-                consumers_ivga_elem = consumers_elem.findall("newtek-ivga")
-                for ivga_elem in consumers_ivga_elem:
-                    ivga = casparServer.ConsumerNewtekIVGA()
-
-                    ivga_channel_layout = ivga_elem.findtext("channel-layout")
-                    ivga_provide_sync = ivga_elem.findtext("provide-sync")
-
-                    if ivga_channel_layout:
-                        for i in casparServer.channel_layout:
-                            if str(i) in ivga_channel_layout:
-                                ivga.channel_layout = i
-
-                    if ivga_provide_sync and "false" in ivga_provide_sync:
-                        ivga.provide_sync = False
-                    else:
-                        ivga.provide_sync = True
-
-                    ch.consumers.append(ivga)
-                    ivga_elem.clear()
-
-                # <file>
-                #   <path></path>
-                #   <vcodec>libx264 [libx264|qtrle]</vcodec>
-                #   <separate-key>false [true|false]</separate-key>
-                # </file>
-
-                consumers_file_elem = consumers_elem.findall("file")
-                for file_elem in consumers_file_elem:
-                    cf = casparServer.ConsumerFile()
-
-                    file_path = file_elem.findtext("file")
-                    file_vcodec = file_elem.findtext("vcodec")
-                    file_separate_key = file_elem.findtext("separate-key")
-
-                    if file_path:
-                        cf.path = file_path
-                    if file_vcodec:
-                        for i in casparServer.vcodec:
-                            if str(i) in file_vcodec:
-                                cf.vcodec = i
-                    if file_separate_key and "true" in file_separate_key:
-                        cf.separate_key = True
-                    else:
-                        cf.separate_key = False
-
-                    ch.consumers.append(cf)
-                    file_elem.clear()
-
-                # <stream>
-                #   <path></path>
-                #   <args></args>
-                # </stream>
-                consumers_stream_elem = consumers_elem.findall("stream")
-                for stream_elem in consumers_stream_elem:
-                    st = casparServer.ConsumerStream()
-
-                    str_path = stream_elem.findtext("path")
-                    str_args = stream_elem.findtext("args")
-
-                    if str_path:
-                        st.path = str_path
-
-                    if str_args:
-                        st.args = str_args
-
-                    ch.consumers.append(st)
-                    stream_elem.clear()
-
-            consumers_elem.clear()
-            elem.clear()  # Clear channel element
-
-        elif elem.tag == "controllers":
-            for tcp_elem in elem:
-                tcp_port = tcp_elem.findtext("port")
-                tcp_protocol = tcp_elem.findtext("protocol")
-
-                if tcp_protocol:
-                    for i in casparServer.tcp_protocol:
-                        if str(i) in tcp_protocol:
-                            tcp_protocol = i
-
-                tcp = casparServer.TCPController(tcp_protocol, tcp_port)
-                server_conf.controllers.append(tcp)
-
-        # <osc>
-        #   <default-port>6250</default-port>
-        #   <predefined-clients>
-        #      <predefined-client>
-        #        <address>127.0.0.1</address>
-        #        <port>5253</port>
-        #       </predefined-client>
-        #   </predefined-clients>
-        # </osc>
-        elif elem.tag == "osc":
-            osc = casparServer.OSC()
-
-            osc_default_port = elem.findtext("default-port")
-            try:
-                osc.default_port = int(osc_default_port)
-            except ValueError, e:
-                print e.message
-                osc.default_port = 6250
-
-            osc_predef_clients_elem = elem.find("predefined-client")
-            for client_elem in osc_predef_clients_elem:
-                osc_addr = client_elem.findtext("address")
-                osc_port = client_elem.findtext("port")
-
-                osc_pc = casparServer.OSCPredefinedClient(osc_addr, osc_port)
-                osc.predefined_clients.append(osc_pc)
-
-                client_elem.clear()
-
-            server_conf.osc.append(osc)
-            elem.clear()  # Clear OSC element
-
-        elif elem.tag == "audio":
-            audio_config = casparServer.AudioConfig(False)
-
-            channel_layouts_elem = elem.find("channel-layouts")
-            if channel_layouts_elem:
-                for channel_layout_elem in channel_layouts_elem:
-                    chlay_name = channel_layout_elem.findtext("name")
-                    chlay_type_ = channel_layout_elem.findtext("type")
-                    chlay_num_channels = channel_layout_elem.findtext(
-                        "num-channels")
-                    chlay_channels = channel_layout_elem.findtext("channels")
-
-                    if chlay_num_channels:
-                        chlay_num_channels = int(chlay_num_channels)
-
-                    if chlay_channels:
-                        # Remove whitespace around channels info - it can mess
-                        # up the config!
-                        chlay_channels = chlay_channels.strip()
-
-                    cl = casparServer.AudioChannelLayout(
-                        chlay_name, chlay_type_, chlay_num_channels, chlay_channels)
-                    audio_config.channel_layouts[chlay_name] = cl
-                channel_layouts_elem.clear()
-
-            mix_configs_elem = elem.find("mix-configs")
-            if mix_configs_elem:
-                for mix_config_elem in mix_configs_elem:
-                    mconf_from_ = mix_config_elem.findtext("from")
-                    mconf_to = mix_config_elem.findtext("to")
-                    mconf_mix = mix_config_elem.findtext("mix")
-                    mconf_mappings = []
-
-                    mappings_elem = mix_config_elem.find("mappings")
-                    if mappings_elem:
-                        for mapping_elem in mappings_elem:
-                            mconf_mapping = mapping_elem.text()
-                            mconf_mappings.append(mconf_mapping)
-                        mappings_elem.clear()
-
-                    mconf_mappings = tuple(mconf_mappings)
-
-                    mc = casparServer.AudioMixConfig(
-                        mconf_from_, mconf_to, mconf_mix, mconf_mappings)
-                    audio_config.mix_configs.append(mc)
-                mix_configs_elem.clear()
-            server_conf.audio_configs = audio_config
-
-            # That's all of the elements in the config!
-    return server_conf
+
+    if use_cache and server.config_cache is not None:
+        return server.config_cache.update(response)
+
+    # Anything that isn't in the config keeps its default value - see ServerConfig and XMLBinding
+    return XMLBinding.bind(response, XMLBinding.get_schema("config"))
 
 
 def info_paths(server):
@@ -841,17 +231,7 @@ def info_paths(server):
     if not response:
         return None
 
-    paths = {}
-    response = StringIO.StringIO(string.join(response, ""))
-
-    for event, elem in cET.iterparse(response):
-        if "-path" in elem.tag:
-            # Huzzah, we've found a path!
-            print "Found", elem.tag, elem.text
-            paths[elem.tag.split("-")[0]] = elem.text
-            elem.clear()
-
-    return paths
+    return XMLBinding.bind(response, XMLBinding.get_schema("paths"))
 
 
 def info_system(server):
@@ -864,111 +244,37 @@ def info_system(server):
     """
     # INFO SYSTEM
 
-    amcp_string = "INFO SERVER"
+    amcp_string = "INFO SYSTEM"
 
-    response = server.send_command_to_caspar(amcp_string)
+    response = server.send_amcp_command(amcp_string)
     if not response:
         return None
-    response = StringIO.StringIO(string.join(response, ""))
-
-    system = {}
-
-    for event, elem in cET.iterparse(response):
-        if elem.tag == "name":
-            sys_name = elem.text
-            if sys_name:
-                system["name"] = sys_name
-            elem.clear()
-        if elem.tag == "windows":
-            windows = {}
-            sys_windows_name = elem.findtext("name")
-            sys_windows_sp = elem.findtext("service-pack")
-
-            if sys_windows_name:
-                windows["name"] = sys_windows_name
-            if sys_windows_sp:
-                windows["service_pack"] = sys_windows_sp
-
-            system["windows"] = windows
-
-            elem.clear()
-        if elem.tag == "cpu":
-            sys_cpu = elem.text
-
-            if sys_cpu:
-                system["cpu"] = sys_cpu
-
-            elem.clear()
-        if elem.tag == "caspar":
-            caspar = {}
-            sys_caspar_flash = elem.findtext("flash")
-            sys_caspar_th = elem.findtext("template-host")
-            sys_caspar_fi = elem.findtext("free-image")
-
-            if sys_caspar_flash:
-                caspar["flash"] = sys_caspar_flash
-            if sys_caspar_th:
-                caspar["template_host"] = sys_caspar_th
-            if sys_caspar_fi:
-                caspar["free_image"] = sys_caspar_fi
-
-            system["caspar"] = caspar
-
-            elem.clear()
-        if elem.tag == "ffmpeg":
-            ffmpeg = {}
-            sys_ff_avcodec = elem.findtext("avcodec")
-            sys_ff_avformat = elem.findtext("avformat")
-            sys_ff_avfilter = elem.findtext("avfilter")
-            sys_ff_avutil = elem.findtext("avutil")
-            sys_ff_swscale = elem.findtext("swscale")
-
-            if sys_ff_avcodec:
-                ffmpeg["avcodec"] = sys_ff_avcodec
-            if sys_ff_avformat:
-                ffmpeg["avformat"] = sys_ff_avformat
-            if sys_ff_avfilter:
-                ffmpeg["avfilter"] = sys_ff_avfilter
-            if sys_ff_avutil:
-                ffmpeg["avutil"] = sys_ff_avutil
-            if sys_ff_swscale:
-                ffmpeg["swscale"] = sys_ff_swscale
-
-            system["caspar"]["ffmpeg"] = ffmpeg
-
-            elem.clear()
-
-    return system
+
+    return XMLBinding.bind(response, XMLBinding.get_schema("system"))
 
 
 def info_server(server):
     """
-    .. warning:: This method has not been implemented in UberCarrot yet!
+    Gets detailed information about all channels - what is playing on each of their layers, and their video modes,
+    mixers and consumers.
 
-    Gets detailed information about all channels.
+    To poll this regularly, use a :py:class:`~caspartalk.ServerState.ServerStateMonitor`, which only parses the
+    parts of the reply that have changed.
 
     :param CasparServer server: The :py:class:`~caspartalk.CasparServer` that the *amcp_command* will be sent to.
-    :rtype: List
-    :return: Returns a list containing information about all the channels on the server.
+    :rtype: :py:class:`caspartalk.ServerState.ServerState`
+    :return: The state of every channel on the server.
     """
 
     # INFO SERVER
-    # TODO #5: implement INFO SERVER command
-
-    raise NotImplementedError
 
-    # amcp_string = "INFO SERVER"
+    amcp_string = "INFO SERVER"
 
-    # response = self.send_command_to_caspar(server, amcp_string)
-    # if not response: return None
-    # response = StringIO.StringIO(string.join(response, ""))
+    response = server.send_amcp_command(amcp_string)
+    if not response:
+        return None
 
-    # for event, elem in CET.iterparse(response):
-    #     if elem.tag == "paths":
-    #         print "Skipping <paths> - use INFO PATHS instead"
-    #         elem.clear()
-    #     else:
-    #         print CET.dump(elem)
+    return XMLBinding.bind(response, XMLBinding.get_schema("server"), root_tag="channels")
 
 
 def bye(server):
@@ -1033,6 +339,7 @@ def data_store(server, name, data):
     """
     # DATA STORE [name:string] [data:string]
 
+    stored_data = data
     data = json.dumps(data)  # Escape quotes, etc.
     amcp_string = "DATA STORE {name} {data}".format(name=name, data=data)
 
@@ -1041,19 +348,31 @@ def data_store(server, name, data):
     except CasparExceptions.CasparError:
         return False
 
+    if server.dataset_cache is not None:
+        server.dataset_cache.stored(name, stored_data)
+
+    return True
 
-def data_retrieve(server, name):
+
+def data_retrieve(server, name, use_cache=True):
     """
     Returns the data saved under the name *name*.
 
+    If the server has a :py:class:`~caspartalk.DatasetCache.DatasetCache` and *use_cache* is True, the data is served
+    from the cache where possible.
+
     :param CasparServer server: The :py:class:`~caspartalk.CasparServer` that the *amcp_command* will be sent to.
     :param str name: The name of the dataset (saved as *name* in :py:func:`~caspartalk.AMCP.data_store`) \
     to retrieve.
+    :param bool use_cache: If False, always fetch the data from the server.
     :rtype: List
     :return: A list containing the data saved under the name *name*.
     """
     # DATA RETRIEVE [name:string]
 
+    if use_cache and server.dataset_cache is not None:
+        return server.dataset_cache.retrieve(name)
+
     amcp_string = "DATA RETRIEVE {name}".format(name=name)
 
     data = None
@@ -1107,10 +426,34 @@ def data_remove(server, name):
     except CasparExceptions.CasparError:
         return False
 
+    if server.dataset_cache is not None:
+        server.dataset_cache.removed(name)
+
     return True
 
 
 # CG Commands - manipulate Flash templates in Caspar
+
+# These are sent often (e.g. by clocks and tickers), so they're built by encoders precompiled from AMCPCommands.SPEC
+_cg_add = AMCPCommands.get_command("CG ADD").encode
+_cg_play = AMCPCommands.get_command("CG PLAY").encode
+_cg_stop = AMCPCommands.get_command("CG STOP").encode
+_cg_next = AMCPCommands.get_command("CG NEXT").encode
+_cg_remove = AMCPCommands.get_command("CG REMOVE").encode
+_cg_clear = AMCPCommands.get_command("CG CLEAR").encode
+_cg_update = AMCPCommands.get_command("CG UPDATE").encode
+_cg_invoke = AMCPCommands.get_command("CG INVOKE").encode
+_cg_info = AMCPCommands.get_command("CG INFO").encode
+
+
+def _encode_template_data(data, template=None):
+    # If we know which Template the data is for, and the data is a dict of fields, send the <templateData> XML that
+    # the template expects. Otherwise, fall back to JSON, which escapes quotes, etc.
+    if isinstance(data, dict) and isinstance(template, CasparObjects.Template):
+        return template.get_data_serializer().serialize_amcp(data)
+    return AMCPCommands.encode_data(data)
+
+
 def cg_add(server, template, channel=1, layer=10, cg_layer=0, play_on_load=0, data=None):
     """
     Prepares a template for displaying.
@@ -1119,8 +462,9 @@ def cg_add(server, template, channel=1, layer=10, cg_layer=0, play_on_load=0, da
     *Data* is either inline XML or a reference to a saved dataset.
 
     :param CasparServer server: The :py:class:`~caspartalk.CasparServer` that the *amcp_command* will be sent to.
-    :param str template: The name (including directory relative to the CasparCG template directory) of the \
-    template to load into CasparCG Server.
+    :param template: The name (including directory relative to the CasparCG template directory) of the \
+    template to load into CasparCG Server, or the :py:class:`~caspartalk.CasparObjects.Template` itself. If a \
+    Template is given and *data* is a dict, *data* is sent as ``<templateData>`` XML.
     :param int channel: The number of the channel to load the template into.
     :param int layer: The video layer of the channel to load the template into. Rarely required unless in case of \
     layering multiple video and CG elements.
@@ -1133,16 +477,20 @@ def cg_add(server, template, channel=1, layer=10, cg_layer=0, play_on_load=0, da
     # CG [video_channel:int]{-[layer:int]|-9999} ADD [cg_layer:int]
     # [template:string] [play-on-load:0,1] {[data]}
 
-    data = json.dumps(data)  # Escape quotes, etc.
-    amcp_string = "CG {video_channel}-{layer} ADD {cg_layer} {template} {play_on_load} {data}".format(
-        video_channel=channel, layer=layer, cg_layer=cg_layer, template=template, play_on_load=play_on_load,
-        data=data)
+    sent_data = data
+    data = _encode_template_data(data, template)
+    if isinstance(template, CasparObjects.Template):
+        template = template.file_name
+    amcp_string = _cg_add(channel, layer, cg_layer, template, play_on_load, data)
 
     try:
         server.send_amcp_command(amcp_string)
     except CasparExceptions.CasparError:
         return False
 
+    # The freshly-loaded template only knows about the data it was added with
+    server.cg_data_cache.set_data(channel, layer, cg_layer, sent_data)
+
     return True
 
 
@@ -1160,8 +508,7 @@ def cg_play(server, channel=1, layer=10, cg_layer=0):
 
     # CG [video_channel:int]{-[layer:int]|-9999} PLAY [cg_layer:int]
 
-    amcp_string = "CG {video_channel}-{layer} PLAY {cg_layer}".format(video_channel=channel,
-                                                                      layer=layer, cg_layer=cg_layer)
+    amcp_string = _cg_play(channel, layer, cg_layer)
 
     try:
         server.send_amcp_command(amcp_string)
@@ -1186,14 +533,15 @@ def cg_stop(server, channel=1, layer=10, cg_layer=0):
     """
     # CG [video_channel:int]{-[layer:int]|-9999} STOP [cg_layer:int]
 
-    amcp_string = "CG {video_channel}-{layer} STOP [cg_layer]".format(video_channel=channel, layer=layer,
-                                                                      cg_layer=cg_layer)
+    amcp_string = _cg_stop(channel, layer, cg_layer)
 
     try:
         server.send_amcp_command(amcp_string)
     except CasparExceptions.CasparError:
         return False
 
+    server.cg_data_cache.forget(channel, layer, cg_layer)
+
     return True
 
 
@@ -1211,8 +559,7 @@ def cg_next(server, channel=1, layer=10, cg_layer=0):
     """
     # CG [video_channel:int]{-[layer:int]|-9999} NEXT [cg_layer:int]
 
-    amcp_string = "CG {video_channel}-{layer} NEXT {cg_layer}".format(video_channel=channel, layer=layer,
-                                                                      cg_layer=cg_layer)
+    amcp_string = _cg_next(channel, layer, cg_layer)
 
     try:
         server.send_amcp_command(amcp_string)
@@ -1235,14 +582,15 @@ def cg_remove(server, channel=1, layer=10, cg_layer=0):
     """
     # CG [video_channel:int]{-[layer:int]|-9999} REMOVE [cg_layer:int]
 
-    amcp_string = "CG {video_channel}-{layer} REMOVE {cg_layer}".format(video_channel=channel, layer=layer,
-                                                                        cg_layer=cg_layer)
+    amcp_string = _cg_remove(channel, layer, cg_layer)
 
     try:
         server.send_amcp_command(amcp_string)
     except CasparExceptions.CasparError:
         return False
 
+    server.cg_data_cache.forget(channel, layer, cg_layer)
+
     return True
 
 
@@ -1258,43 +606,57 @@ def cg_clear(server, channel=1, layer=10):
     """
     # CG [video_channel:int]{-[layer:int]|-9999} CLEAR
 
-    amcp_string = "CG {video_channel}-{layer} CLEAR".format(
-        video_channel=channel, layer=layer)
+    amcp_string = _cg_clear(channel, layer)
 
     try:
         server.send_amcp_command(amcp_string)
     except CasparExceptions.CasparError:
         return False
 
+    server.cg_data_cache.forget(channel, layer)
+
     return True
 
 
-def cg_update(server, channel=1, layer=10, cg_layer=0, data=None):
+def cg_update(server, channel=1, layer=10, cg_layer=0, data=None, diff=True, template=None):
     """
     Sends new data to the template on specified CG layer.
     Data is either inline XML or a reference to a saved dataset.
 
+    If *diff* is True, *data* is compared against the data last sent to the CG layer (see
+    :py:class:`~caspartalk.CGDataCache.CGDataCache`). Only the fields that have changed are sent, and if nothing has
+    changed then no command is sent at all.
+
     :param CasparServer server: The :py:class:`~caspartalk.CasparServer` that the *amcp_command* will be sent to.
     :param int channel: The number of the channel containing the template to send *data* to.
     :param int layer: The number of the layer containing the template to send *data* to.
     :param int cg_layer: The number of the cg_layer containing the template to send *data* to.
     :param str data: The data to send to the specified template. Either XML or the name of a stored dataset.
+    :param bool diff: If True, only send the parts of *data* that the template doesn't already have.
+    :param Template template: The :py:class:`~caspartalk.CasparObjects.Template` on the CG layer. If given, and \
+    *data* is a dict, *data* is sent as ``<templateData>`` XML.
     :rtype: Bool
     :return: True if successful, otherwise False.
     """
     # CG [video_channel:int]{-[layer:int]|-9999} UPDATE [cg_layer:int]
     # [data:string]
 
-    data = json.dumps(data)  # Escape quotes, etc.
-    amcp_string = "CG {video_channel}-{layer} UPDATE {cg_layer} {data}".format(video_channel=channel,
-                                                                               layer=layer, cg_layer=cg_layer,
-                                                                               data=data)
+    sent_data = data
+    if diff:
+        sent_data = server.cg_data_cache.diff(channel, layer, cg_layer, data)
+        if sent_data is None:
+            server.cg_data_cache.record_update(channel, layer, cg_layer, data, None)
+            return True
+
+    amcp_string = _cg_update(channel, layer, cg_layer, _encode_template_data(sent_data, template))
 
     try:
         server.send_amcp_command(amcp_string)
     except CasparExceptions.CasparError:
         return False
 
+    server.cg_data_cache.record_update(channel, layer, cg_layer, data, sent_data)
+
     return True
 
 
@@ -1317,8 +679,7 @@ def cg_invoke(server, method, channel=1, layer=10, cg_layer=0):
     # CG [video_channel:int]{-[layer:int]|-9999} INVOKE [cg_layer:int]
     # [method:string]
 
-    amcp_string = "CG {video_channel}-{layer} INVOKE {cg_layer} {method}".format(video_channel=channel, layer=layer,
-                                                                                 cg_layer=cg_layer, method=method)
+    amcp_string = _cg_invoke(channel, layer, cg_layer, method)
 
     try:
         server.send_amcp_command(amcp_string)
@@ -1343,10 +704,76 @@ def cg_info(server, channel=1, layer=10, cg_layer=0):
 
     # CG [video_channel:int]{-[layer:int]|-9999} INFO {[cg_layer:int]}
 
-    amcp_string = "CG {video_channel}-{layer} INFO {cg_layer}".format(video_channel=channel, layer=layer,
-                                                                      cg_layer=cg_layer)
+    amcp_string = _cg_info(channel, layer, cg_layer)
 
     try:
         return server.send_amcp_command(amcp_string)
     except CasparExceptions.CasparError:
         return None
+
+
+# Playback, consumer and mixer commands - generated from AMCPCommands.SPEC
+
+# The commands whose functions return the server's response, rather than True or False
+_returns_response = frozenset(["CALL"])
+
+
+def _forget_layer(server, parameters):
+    # Whatever was on the layer (or channel) has been replaced or removed, templates included
+    server.cg_data_cache.forget(parameters["channel"], parameters.get("layer"))
+
+
+def _forget_swapped(server, parameters):
+    server.cg_data_cache.forget(parameters["channel"], parameters["layer"])
+    server.cg_data_cache.forget(parameters["other_channel"], parameters["other_layer"])
+
+
+# Functions to call, with the server and the command's parameters, after a command succeeds
+_after = {"LOAD": _forget_layer,
+          "PLAY": _forget_layer,
+          "STOP": _forget_layer,
+          "CLEAR": _forget_layer,
+          "SWAP": _forget_swapped}
+
+
+def _command_caller(returns_response, after=None):
+    def call(server, amcp_string, parameters):
+        try:
+            response = server.send_amcp_command(amcp_string)
+        except CasparExceptions.CasparError:
+            return None if returns_response else False
+
+        if after is not None:
+            after(server, parameters)
+        return response if returns_response else True
+
+    return call
+
+
+def _command_doc(command, returns_response):
+    lines = [command.description,
+             "",
+             ":param CasparServer server: The :py:class:`~caspartalk.CasparServer` that the *amcp_command* will be "
+             "sent to."]
+    for name in command.fields:
+        lines.append(":param {name}: {doc}".format(name=name, doc=AMCPCommands.PARAMETERS.get(name, "")))
+    if returns_response:
+        lines.append(":rtype: List")
+        lines.append(":return: Any response from the CasparCG server, or None if there wasn't one or the command "
+                     "failed.")
+    else:
+        lines.append(":rtype: Bool")
+        lines.append(":return: True if successful, otherwise False.")
+    return "\n".join(lines)
+
+
+for _command in AMCPCommands.COMMANDS.itervalues():
+    if _command.description is None:
+        continue
+    _returns = _command.name in _returns_response
+    _function = _command.make_function(_command_caller(_returns, _after.get(_command.name)),
+                                       _command_doc(_command, _returns))
+    _function.__module__ = __name__
+    globals()[_command.function_name] = _function
+
+del _command, _returns, _function
@@ -0,0 +1,67 @@
+"""
+Encoding benchmark for :py:mod:`AMCPCommands`.
+
+Times how long it takes to build CG commands the way :py:mod:`amcp` used to (``str.format`` over the whole command,
+``json.dumps`` on the data and ``\\r\\n`` added by :py:meth:`CasparServer.send_amcp_command`) against the encoders
+precompiled from :py:data:`AMCPCommands.SPEC`. The last pair of rows time :py:func:`amcp.cg_update` as a whole, with
+a stand-in server that only does what send_amcp_command does to the string before it is written.
+
+Usage::
+
+    python benchmarks/bench_amcp_encoding.py
+
+"""
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import AMCPCommands
+
+XML = '<templateData><componentData id="clock"><data id="text" value="12:34:56"/></componentData></templateData>'
+SCORE = {"home": 2, "away": 1, "clock": "67:12"}
+
+
+def legacy_play(channel, layer, cg_layer):
+    amcp_string = "CG {video_channel}-{layer} PLAY {cg_layer}".format(video_channel=channel,
+                                                                      layer=layer, cg_layer=cg_layer)
+    if not amcp_string.endswith("\r\n"):
+        amcp_string += "\r\n"
+    return amcp_string
+
+
+def legacy_update(channel, layer, cg_layer, data):
+    amcp_string = "CG {video_channel}-{layer} UPDATE {cg_layer} {data}".format(video_channel=channel,
+                                                                               layer=layer, cg_layer=cg_layer,
+                                                                               data=json.dumps(data))
+    if not amcp_string.endswith("\r\n"):
+        amcp_string += "\r\n"
+    return amcp_string
+
+
+def run(name, function, number=200000):
+    per_call = min(timeit.repeat(function, number=number, repeat=5)) / number
+    print "{name:34} {us:6.2f} us/command".format(name=name, us=per_call * 1e6)
+
+
+def main():
+    play = AMCPCommands.get_command("CG PLAY").encode
+    update = AMCPCommands.get_command("CG UPDATE").encode
+    encode_data = AMCPCommands.encode_data
+
+    assert legacy_play(1, 20, 0) == play(1, 20, 0)
+    assert legacy_update(1, 20, 0, XML) == update(1, 20, 0, encode_data(XML))
+    assert legacy_update(1, 20, 0, SCORE) == update(1, 20, 0, encode_data(SCORE))
+
+    run("CG PLAY        legacy", lambda: legacy_play(1, 20, 0))
+    run("CG PLAY        precompiled", lambda: play(1, 20, 0))
+    run("CG UPDATE xml  legacy", lambda: legacy_update(1, 20, 0, XML))
+    run("CG UPDATE xml  precompiled", lambda: update(1, 20, 0, encode_data(XML)))
+    run("CG UPDATE dict legacy", lambda: legacy_update(1, 20, 0, SCORE))
+    run("CG UPDATE dict precompiled", lambda: update(1, 20, 0, encode_data(SCORE)))
+
+
+if __name__ == "__main__":
+    main()
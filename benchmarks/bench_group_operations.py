@@ -0,0 +1,124 @@
+"""
+Acknowledgement spread benchmark for :py:mod:`GroupOperations`.
+
+Runs a minimal AMCP server on localhost that waits *latency* seconds before answering whatever it has received (as a
+stand-in for the network and the server's own processing), then clears channels 1 to 8 three ways:
+
+* loop - calling :py:func:`amcp.clear` for each channel in turn, as was needed before
+* pipelined - :py:func:`GroupOperations.clear`, with every command written at once
+* concurrent - :py:func:`GroupOperations.clear`, with a thread per channel, to a server that supports request IDs
+
+and prints how far apart the first and last channels were cleared (the spread), and how long each took overall.
+
+Usage::
+
+    python benchmarks/bench_group_operations.py
+
+"""
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import amcp
+import CasparServer
+import GroupOperations
+
+LATENCY = 0.005
+CHANNELS = range(1, 9)
+
+
+def serve(version, latency):
+    # A minimal AMCP server, which answers everything it receives after *latency* seconds
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(5)
+
+    def reply(command):
+        if command.startswith("VERSION"):
+            return "201 VERSION OK\r\n{version}\r\n".format(version=version)
+        if command.startswith("TLS"):
+            return "200 TLS OK\r\n\"lower_third\" 1024 20170101000000\r\n\r\n"
+        if command.startswith("INFO TEMPLATE"):
+            return "201 INFO OK\r\n<template version=\"2.0.0\"><parameters/></template>\r\n"
+        return "202 {verb} OK\r\n".format(verb=command.split()[0])
+
+    def handle(connection):
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        received = ""
+        while True:
+            data = connection.recv(65536)
+            if not data:
+                return
+            time.sleep(latency)
+            received += data
+            lines = received.split("\r\n")
+            received = lines.pop()
+            replies = []
+            for line in lines:
+                if line.startswith("REQ "):
+                    _, request_id, command = line.split(" ", 2)
+                    replies.append("RES {request_id} {reply}".format(request_id=request_id, reply=reply(command)))
+                else:
+                    replies.append(reply(line))
+            connection.sendall("".join(replies))
+
+    def accept():
+        while True:
+            connection = listener.accept()[0]
+            thread = threading.Thread(target=handle, args=(connection,))
+            thread.daemon = True
+            thread.start()
+
+    thread = threading.Thread(target=accept)
+    thread.daemon = True
+    thread.start()
+    return listener.getsockname()[1]
+
+
+def loop(server):
+    started = time.time()
+    acks = []
+    for channel in CHANNELS:
+        amcp.clear(server, channel)
+        acks.append(time.time())
+    return max(acks) - min(acks), time.time() - started
+
+
+def group(mode):
+    def run(server):
+        result = GroupOperations.clear(server, CHANNELS, mode=mode)
+        return result.spread, result.elapsed
+    return run
+
+
+def main(repeat=20):
+    results = []
+    stdout = sys.stdout
+    # CasparServer and ResponseInterpreter print every command and reply, which would swamp the timings
+    sys.stdout = open(os.devnull, "w")
+    try:
+        for name, version, run in (("loop", "2.0.7 Stable", loop),
+                                   ("pipelined", "2.0.7 Stable", group(GroupOperations.PIPELINED)),
+                                   ("concurrent", "2.2.0 Stable", group(GroupOperations.CONCURRENT))):
+            server = CasparServer.CasparServer("127.0.0.1", serve(version, LATENCY))
+            timings = [run(server) for _ in xrange(repeat)]
+            server.disconnect()
+            spread = sorted(t[0] for t in timings)[repeat // 2]
+            elapsed = sorted(t[1] for t in timings)[repeat // 2]
+            results.append("{name:11} {channels} channels: spread {spread:6.1f} ms   total {elapsed:6.1f} ms".format(
+                name=name, channels=len(CHANNELS), spread=spread * 1e3, elapsed=elapsed * 1e3))
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    print "Server latency {latency:.1f} ms (median of {repeat} runs)".format(latency=LATENCY * 1e3, repeat=repeat)
+    for line in results:
+        print line
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Parse-throughput benchmark for the INFO response binder.
+
+Times :py:func:`XMLBinding.bind` on synthetic INFO TEMPLATE, INFO PATHS, INFO SYSTEM and INFO CONFIG responses. The
+first three are also timed with copies of the hand-written parsers that amcp used before (with their print
+statements taken out, so that only the parsing is measured). The old INFO CONFIG parser referred to names that don't
+exist, so it couldn't be run at all; its binder timing is given on its own.
+
+Usage::
+
+    python benchmarks/bench_info_parsing.py
+
+"""
+import os
+import StringIO
+import string
+import sys
+import timeit
+import xml.etree.cElementTree as cET
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import CasparObjects
+import XMLBinding
+
+
+def make_template_xml(fields=40):
+    lines = ['<template version="1.8.0" authorName="Graphics" authorEmail="gfx@example.com" '
+             'templateInfo="Lower third" originalWidth="1920" originalHeight="1080" originalFrameRate="25">',
+             '<components>',
+             '<component name="CasparTextField">',
+             '<property name="text" type="string" info="String data"/>',
+             '<property name="color" type="string" info="Color data"/>',
+             '</component>',
+             '</components>',
+             '<keyframes><keyframe name="intro"/><keyframe name="outro"/></keyframes>',
+             '<instances>']
+    lines.extend('<instance name="f{0}" type="CasparTextField"/>'.format(i) for i in xrange(fields))
+    lines.append('</instances>')
+    lines.append('<parameters>')
+    lines.extend('<parameter id="p{0}" type="string" info="Parameter {0}"/>'.format(i) for i in xrange(fields))
+    lines.append('</parameters>')
+    lines.append('</template>')
+    return lines
+
+
+PATHS_XML = ['<paths>', '<media-path>media\\</media-path>', '<log-path>log\\</log-path>',
+             '<data-path>data\\</data-path>', '<template-path>templates\\</template-path>',
+             '<thumbnails-path>thumbnails\\</thumbnails-path>', '<initial-path>C:\\caspar\\</initial-path>',
+             '</paths>']
+
+SYSTEM_XML = ['<system>', '<name>Windows 7</name>',
+              '<windows><name>Windows 7</name><service-pack>Service Pack 1</service-pack></windows>',
+              '<cpu>Intel Xeon E5-2630</cpu>',
+              '<caspar><flash>11.8.800.94</flash><template-host>2.0.7.0</template-host><free-image>3.15.4</free-image>',
+              '<ffmpeg><avcodec>54.92.100</avcodec><avformat>54.63.104</avformat><avfilter>3.42.103</avfilter>'
+              '<avutil>52.18.100</avutil><swscale>2.2.100</swscale></ffmpeg></caspar>',
+              '</system>']
+
+
+def make_config_xml(channels=8):
+    lines = ['<configuration>', '<log-level>info</log-level>', '<channel-grid>false</channel-grid>',
+             '<mixer><blend-modes>true</blend-modes><straight-alpha>false</straight-alpha></mixer>',
+             '<thumbnails><generate-thumbnails>true</generate-thumbnails><width>256</width></thumbnails>',
+             '<channels>']
+    for i in xrange(channels):
+        lines.extend(['<channel>', '<video-mode>1080i5000</video-mode>', '<channel-layout>stereo</channel-layout>',
+                      '<consumers>',
+                      '<decklink><device>{0}</device><key-device>{1}</key-device><embedded-audio>true</embedded-audio>'
+                      '<latency>low</latency><keyer>external</keyer><buffer-depth>3</buffer-depth></decklink>'.format(
+                          i + 1, i + 2),
+                      '<screen><device>{0}</device><windowed>true</windowed></screen>'.format(i),
+                      '<system-audio/>',
+                      '</consumers>', '</channel>'])
+    lines.extend(['</channels>',
+                  '<controllers><tcp><port>5250</port><protocol>AMCP</protocol></tcp></controllers>',
+                  '<osc><default-port>6250</default-port><predefined-clients><predefined-client>'
+                  '<address>127.0.0.1</address><port>5253</port></predefined-client></predefined-clients></osc>',
+                  '</configuration>'])
+    return lines
+
+
+# The hand-written parsers, as they were in amcp
+
+def legacy_template(response):
+    template = CasparObjects.Template(None, "bench")
+    el_template = cET.fromstringlist(response)
+    for attr, name in (("version", "version"), ("authorName", "author_name"), ("authorEmail", "author_email"),
+                       ("templateInfo", "template_info"), ("originalWidth", "original_width"),
+                       ("originalHeight", "original_height"), ("originalFrameRate", "original_frame_rate")):
+        if attr in el_template.attrib.keys():
+            setattr(template, name, el_template.attrib[attr])
+
+    for comp in list(el_template.find("components").findall("component")):
+        comp_properties = CasparObjects.TypedDict(CasparObjects.ComponentProperty)
+        for prop in comp.findall("property"):
+            comp_prop = CasparObjects.ComponentProperty(prop.attrib["name"], prop.attrib["type"], prop.attrib["info"])
+            comp_properties[comp_prop.id] = comp_prop
+        template.components[comp.attrib["name"]] = comp_properties
+
+    for kf in list(el_template.find("keyframes")):
+        template.keyframes.append(kf.attrib["name"])
+
+    for inst in list(el_template.find("instances")):
+        if inst.attrib["type"] in template.components:
+            template.instances[inst.attrib["name"]] = inst.attrib["type"]
+
+    for param in list(el_template.find("parameters")):
+        temp_param = CasparObjects.TemplateParameter(param.attrib["id"], param.attrib["type"], param.attrib["info"])
+        template.parameters[temp_param.id] = temp_param
+    return template
+
+
+def legacy_paths(response):
+    paths = {}
+    for event, elem in cET.iterparse(StringIO.StringIO(string.join(response, ""))):
+        if "-path" in elem.tag:
+            paths[elem.tag.split("-")[0]] = elem.text
+            elem.clear()
+    return paths
+
+
+def legacy_system(response):
+    system = {}
+    for event, elem in cET.iterparse(StringIO.StringIO(string.join(response, ""))):
+        if elem.tag == "name":
+            system["name"] = elem.text
+            elem.clear()
+        if elem.tag == "windows":
+            system["windows"] = {"name": elem.findtext("name"), "service_pack": elem.findtext("service-pack")}
+            elem.clear()
+        if elem.tag == "cpu":
+            system["cpu"] = elem.text
+            elem.clear()
+        if elem.tag == "ffmpeg":
+            system["ffmpeg"] = dict((tag, elem.findtext(tag)) for tag in
+                                    ("avcodec", "avformat", "avfilter", "avutil", "swscale"))
+            elem.clear()
+        if elem.tag == "caspar":
+            system["caspar"] = {"flash": elem.findtext("flash"), "template_host": elem.findtext("template-host"),
+                                "free_image": elem.findtext("free-image")}
+            elem.clear()
+    return system
+
+
+def measure(f, response, number):
+    seconds = min(timeit.repeat(lambda: f(response), number=number, repeat=3)) / number
+    size = len("".join(response))
+    return seconds * 1e6, size / seconds / 1048576.0
+
+
+def main():
+    template_xml = make_template_xml()
+    cases = [
+        ("INFO TEMPLATE", template_xml, 2000,
+         lambda r: XMLBinding.bind(r, XMLBinding.get_schema("template"), CasparObjects.Template(None, "bench")),
+         legacy_template),
+        ("INFO PATHS", PATHS_XML, 20000, lambda r: XMLBinding.bind(r, XMLBinding.get_schema("paths")), legacy_paths),
+        ("INFO SYSTEM", SYSTEM_XML, 20000, lambda r: XMLBinding.bind(r, XMLBinding.get_schema("system")),
+         legacy_system),
+        ("INFO CONFIG", make_config_xml(), 2000, lambda r: XMLBinding.bind(r, XMLBinding.get_schema("config")),
+         None),
+    ]
+
+    for name, response, number, binder, legacy in cases:
+        us, mbs = measure(binder, response, number)
+        line = "{name:14} binder {us:8.1f} us/parse {mbs:6.1f} MB/s".format(name=name, us=us, mbs=mbs)
+        if legacy is not None:
+            legacy_us, legacy_mbs = measure(legacy, response, number)
+            line += "   hand-written {us:8.1f} us/parse {mbs:6.1f} MB/s".format(us=legacy_us, mbs=legacy_mbs)
+        print line
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Latency benchmark for the type-ahead search index.
+
+Builds a :py:class:`PathSearch.PathIndex` of synthetic template paths, then times :py:meth:`~PathSearch.PathIndex.complete`
+and :py:meth:`~PathSearch.PathIndex.search` for a few typical queries, and the cost of adding and removing a path.
+
+Usage::
+
+    python benchmarks/bench_path_search.py [number_of_paths]
+
+"""
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import PathSearch
+
+SHOWS = ["NEWS", "SPORT", "WEATHER", "ELECTION", "BREAKFAST", "MAGAZINE", "QUIZ", "DOCS"]
+FOLDERS = ["LOWER_THIRDS", "FULL_FRAMES", "STRAPS", "TICKERS", "BUGS", "CLOCKS", "SCORES", "MAPS", "CREDITS"]
+NAMES = ["NAME", "TITLE", "LOCATION", "QUOTE", "RESULT", "TABLE", "COUNTDOWN", "HEADLINE", "PROMO", "SOCIAL"]
+VARIANTS = ["1L", "2L", "3L", "LEFT", "RIGHT", "CENTRE", "HD", "UHD", "SQUARE", "WIDE"]
+
+QUERIES = ["news/lo", "name", "low name 2l", "weathr map", "electon result uhd", "sp sc"]
+
+
+def make_paths(n):
+    random.seed(1)
+    paths = set()
+    while len(paths) < n:
+        paths.add("{show}/{folder}/{name}_{variant}_{n}".format(
+            show=random.choice(SHOWS), folder=random.choice(FOLDERS), name=random.choice(NAMES),
+            variant=random.choice(VARIANTS), n=random.randint(1, 999)))
+    return sorted(paths)
+
+
+def time_call(f, number=200):
+    return min(timeit.repeat(f, number=number, repeat=3)) / number * 1000.0
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    paths = make_paths(n)
+
+    start = timeit.default_timer()
+    index = PathSearch.PathIndex(paths)
+    print "Indexed {0} paths in {1:.2f}s".format(n, timeit.default_timer() - start)
+
+    for query in QUERIES[:1]:
+        print "complete({0!r}): {1:.3f} ms".format(query, time_call(lambda: index.complete(query)))
+    for query in QUERIES:
+        print "search({0!r}): {1:.3f} ms -> {2}".format(query, time_call(lambda: index.search(query)),
+                                                         index.search(query, 3))
+
+    new_path = "NEWS/LOWER_THIRDS/BRAND_NEW_TEMPLATE"
+
+    def add_remove():
+        index.add(new_path)
+        index.remove(new_path)
+    print "add + remove: {0:.3f} ms".format(time_call(add_remove))
+
+
+if __name__ == "__main__":
+    main()
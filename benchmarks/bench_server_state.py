@@ -0,0 +1,87 @@
+"""
+Polling benchmark for :py:class:`ServerState.ServerStateMonitor`.
+
+Simulates a server with 4 channels of 20 layers each, with 2 layers playing (so their frame counters move on every
+poll), and times a full parse of the INFO SERVER reply against an incremental refresh that only parses what has
+changed. A second run has every layer playing, which is the worst case for the monitor.
+
+Usage::
+
+    python benchmarks/bench_server_state.py
+
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import ServerState
+import XMLBinding
+
+
+def make_layer(index, frame):
+    return ("<layer><status>playing</status><auto_delta>null</auto_delta><frame-number>{frame}</frame-number>"
+            "<nb_frames>1500</nb_frames><frames-left>{left}</frames-left><foreground><producer>"
+            "<type>ffmpeg-producer</type><filename>media/clip{index}.mov</filename><width>1920</width>"
+            "<height>1080</height><progressive>false</progressive><fps>25</fps><loop>true</loop>"
+            "<frame-number>{frame}</frame-number><nb-frames>1500</nb-frames></producer></foreground>"
+            "<background><producer><type>empty-producer</type></producer></background>"
+            "<index>{index}</index></layer>").format(index=index, frame=frame, left=1500 - frame)
+
+
+def make_reply(poll, channels=4, layers=20, playing=2):
+    lines = ['<?xml version="1.0" encoding="utf-8"?>', "<channels>"]
+    for channel in xrange(1, channels + 1):
+        lines.append("<channel><video-mode>1080i5000</video-mode><stage><layers>")
+        for layer in xrange(layers):
+            # Only the first few layers of the first channel are moving
+            moving = channel == 1 and layer < playing
+            lines.append(make_layer(layer * 10, poll if moving else 0))
+        lines.append("</layers></stage><mixer/><output><consumers><consumer><type>decklink-consumer</type>"
+                     "<key-only>false</key-only></consumer></consumers></output>"
+                     "<index>{channel}</index></channel>".format(channel=channel))
+    lines.append("</channels>")
+    return lines
+
+
+class ReplayServer(object):
+    # Stands in for a CasparServer, replying to INFO SERVER with the next of a series of replies
+
+    def __init__(self, replies):
+        self.replies = replies
+        self.poll = 0
+
+    def send_amcp_command(self, amcp_string):
+        reply = self.replies[self.poll % len(self.replies)]
+        self.poll += 1
+        return reply
+
+
+def run(polls, playing):
+    replies = [make_reply(poll, playing=playing) for poll in xrange(polls)]
+    schema = XMLBinding.get_schema("server")
+
+    full = min(timeit.repeat(lambda: [XMLBinding.bind(r, schema) for r in replies], number=1, repeat=3)) / polls
+
+    def incremental():
+        monitor = ServerState.ServerStateMonitor(ReplayServer(replies))
+        monitor.refresh()
+        for _ in xrange(polls - 1):
+            monitor.refresh()
+        return monitor
+    monitor = incremental()
+    partial = min(timeit.repeat(incremental, number=1, repeat=3)) / polls
+
+    print "{playing:2} layers playing: full parse {full:7.1f} us/poll   incremental {partial:7.1f} us/poll   " \
+          "({layers} of {total} layers parsed)".format(playing=playing, full=full * 1e6, partial=partial * 1e6,
+                                                       layers=monitor.layers_parsed, total=polls * 80)
+
+
+def main():
+    run(500, 2)
+    run(500, 20)
+
+
+if __name__ == "__main__":
+    main()
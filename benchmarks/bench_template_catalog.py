@@ -0,0 +1,143 @@
+"""
+Memory benchmark for the template catalog.
+
+Builds a catalog of synthetic templates (as if parsed from INFO TEMPLATE) twice - once with
+:py:mod:`CasparObjects`, and once with a copy of the original dict-based classes - and reports the deep size of each.
+
+Usage::
+
+    python benchmarks/bench_template_catalog.py [number_of_templates]
+
+"""
+import collections
+import gc
+import os
+import sys
+import types
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import CasparObjects
+
+FIELDS_PER_TEMPLATE = 12
+
+
+def fresh(s):
+    # Strings parsed from XML are new objects every time, not the constants in this file
+    return "".join(list(s))
+
+
+def deep_sizeof(root):
+    # Adds up the size of everything reachable from *root*, counting shared objects once
+    seen = set()
+    stack = [root]
+    total = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, (type, types.ModuleType, types.FunctionType, types.ClassType)):
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        stack.extend(gc.get_referents(obj))
+    return total
+
+
+class LegacyTypedDict(collections.MutableMapping):
+    # The original TypedDict, which wrapped a second dict
+    def __init__(self, value_type):
+        self.store = dict()
+        self._value_type = value_type
+
+    def __getitem__(self, key):
+        return self.store[key]
+
+    def __setitem__(self, key, value):
+        self.store[key] = value
+
+    def __delitem__(self, key):
+        del self.store[key]
+
+    def __iter__(self):
+        return iter(self.store)
+
+    def __len__(self):
+        return len(self.store)
+
+
+class LegacyProperty(object):
+    # The original TemplateParameter/ComponentProperty, with an instance __dict__
+    def __init__(self, prop_id, prop_type, prop_info):
+        self.id = prop_id
+        self.type = CasparObjects.CasparTypes[prop_type]
+        self.info = prop_info
+        self._value = None
+
+
+class LegacyTemplate(object):
+    # The original Template, with an instance __dict__
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.owner_server = None
+        self.version = None
+        self.author_name = None
+        self.author_email = None
+        self.template_info = None
+        self.original_height = 0
+        self.original_width = 0
+        self.original_frame_rate = 0
+        self.components = LegacyTypedDict(LegacyTypedDict)
+        self.keyframes = []
+        self.instances = {}
+        self.parameters = LegacyTypedDict(LegacyProperty)
+
+
+def build_legacy(n):
+    catalog = []
+    for i in xrange(n):
+        t = LegacyTemplate("NEWS/LOWER_THIRDS/TEMPLATE_{0}".format(i))
+        t.author_name = fresh("Graphics Department")
+        t.template_info = fresh("Two line lower third")
+        props = LegacyTypedDict(LegacyProperty)
+        props[fresh("text")] = LegacyProperty(fresh("text"), "string", fresh("The text in the text field."))
+        t.components[fresh("CasparTextField")] = props
+        for f in xrange(FIELDS_PER_TEMPLATE):
+            t.instances[fresh("f{0}".format(f))] = fresh("CasparTextField")
+            t.parameters[fresh("p{0}".format(f))] = LegacyProperty(fresh("p{0}".format(f)), "string",
+                                                                  fresh("Parameter"))
+        catalog.append(t)
+    return catalog
+
+
+def build_compact(n):
+    intern_string = CasparObjects.intern_string
+    catalog = []
+    for i in xrange(n):
+        t = CasparObjects.Template(None, "NEWS/LOWER_THIRDS/TEMPLATE_{0}".format(i))
+        t.author_name = intern_string(fresh("Graphics Department"))
+        t.template_info = intern_string(fresh("Two line lower third"))
+        props = CasparObjects.TypedDict(CasparObjects.ComponentProperty)
+        prop = CasparObjects.ComponentProperty(fresh("text"), "string", fresh("The text in the text field."))
+        props[prop.id] = prop
+        t.components[intern_string(fresh("CasparTextField"))] = props
+        for f in xrange(FIELDS_PER_TEMPLATE):
+            t.instances[intern_string(fresh("f{0}".format(f)))] = intern_string(fresh("CasparTextField"))
+            param = CasparObjects.TemplateParameter(fresh("p{0}".format(f)), "string", fresh("Parameter"))
+            t.parameters[param.id] = param
+        catalog.append(t)
+    return catalog
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+
+    legacy = deep_sizeof(build_legacy(n))
+    compact = deep_sizeof(build_compact(n))
+
+    print "Templates:        {0}".format(n)
+    print "Legacy catalog:   {0:.1f} MB ({1} bytes/template)".format(legacy / 1048576.0, legacy / n)
+    print "Compact catalog:  {0:.1f} MB ({1} bytes/template)".format(compact / 1048576.0, compact / n)
+    print "Saving:           {0:.0%}".format(1 - float(compact) / legacy)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+Latency and syscall benchmark for :py:mod:`Transport`.
+
+Runs a minimal AMCP server on localhost and sends it commands through a :py:class:`CasparServer`, first the way
+commands used to be sent (default socket options, one ``sendall`` per command, replies read a byte at a time), then
+through a :py:class:`Transport.Transport` (TCP_NODELAY, coalesced writes, buffered reads). Two workloads are run:
+
+* sequential - one thread sending commands one at a time, to a server without request IDs
+* concurrent - several threads sending at once, to a server that supports request IDs, so that commands queued while
+  another thread is writing can be coalesced into its next write
+
+For each, the round trip per command (median and 99th percentile) and the number of send and recv calls made are
+printed.
+
+Usage::
+
+    python benchmarks/bench_transport.py
+
+"""
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import CasparServer
+import Transport
+
+
+def serve(version):
+    # A minimal AMCP server, which answers every command straight away
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(5)
+
+    def reply(command):
+        if command.startswith("VERSION"):
+            return "201 VERSION OK\r\n{version}\r\n".format(version=version)
+        if command.startswith("TLS"):
+            return "200 TLS OK\r\n\"lower_third\" 1024 20170101000000\r\n\r\n"
+        if command.startswith("INFO TEMPLATE"):
+            return "201 INFO OK\r\n<template version=\"2.0.0\"><parameters/></template>\r\n"
+        return "202 {verb} OK\r\n".format(verb=command.split()[0])
+
+    def handle(connection):
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        received = ""
+        while True:
+            data = connection.recv(65536)
+            if not data:
+                return
+            received += data
+            lines = received.split("\r\n")
+            received = lines.pop()
+            replies = []
+            for line in lines:
+                if line.startswith("REQ "):
+                    _, request_id, command = line.split(" ", 2)
+                    replies.append("RES {request_id} {reply}".format(request_id=request_id, reply=reply(command)))
+                else:
+                    replies.append(reply(line))
+            connection.sendall("".join(replies))
+
+    def accept():
+        while True:
+            connection = listener.accept()[0]
+            thread = threading.Thread(target=handle, args=(connection,))
+            thread.daemon = True
+            thread.start()
+
+    thread = threading.Thread(target=accept)
+    thread.daemon = True
+    thread.start()
+    return listener.getsockname()[1]
+
+
+class CountingSocket(object):
+    # Wraps a socket, counting the send and recv calls made on it
+
+    def __init__(self, sock):
+        self._socket = sock
+        self.sends = 0
+        self.recvs = 0
+
+    def sendall(self, data):
+        self.sends += 1
+        return self._socket.sendall(data)
+
+    def recv(self, size):
+        self.recvs += 1
+        return self._socket.recv(size)
+
+    def __getattr__(self, name):
+        return getattr(self._socket, name)
+
+
+class BenchServer(CasparServer.CasparServer):
+    options = Transport.SocketOptions()
+
+    def connect(self, server_ip="localhost", port=5250):
+        if not isinstance(self.socket, CountingSocket):
+            self.socket = CountingSocket(self.socket or socket.socket(socket.AF_INET, socket.SOCK_STREAM))
+        self.socket_options = self.options
+        CasparServer.CasparServer.connect(self, server_ip, port)
+
+
+class LegacyServer(BenchServer):
+    # Sends and receives the way that CasparServer did before Transport
+    options = Transport.SocketOptions(nodelay=False, keepalive=False)
+
+    def send_string(self, command_string):
+        self.socket.sendall(command_string)
+
+    def read_until(self, delimiter):
+        s = ""
+        while not s.endswith(delimiter):
+            s += self.socket.recv(1)
+        return [l for l in s.splitlines() if len(l)]
+
+    def _queue_tagged(self, amcp_commands):
+        # Every thread writes its own commands
+        requests = BenchServer._queue_tagged(self, amcp_commands)
+        self.transport.flush()
+        return requests
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def run(name, server_class, version, threads, commands):
+    port = serve(version)
+    server = server_class("127.0.0.1", port)
+    sock = server.socket
+    sends, recvs = sock.sends, sock.recvs
+
+    rtts = []
+
+    def worker(index):
+        for i in xrange(commands):
+            start = time.time()
+            server.send_amcp_command("MIXER {channel}-{layer} OPACITY 0.5".format(channel=index + 1, layer=i),
+                                     use_cache=False)
+            rtts.append(time.time() - start)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in xrange(threads)]
+    start = time.time()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.time() - start
+
+    total = threads * commands
+    server.disconnect()
+    return "{name:12} {total:5} commands in {elapsed:6.3f} s   rtt p50 {p50:7.1f} us  p99 {p99:8.1f} us   " \
+           "{sends:5} sends  {recvs:6} recvs".format(name=name, total=total, elapsed=elapsed,
+                                                     p50=percentile(rtts, 0.5) * 1e6, p99=percentile(rtts, 0.99) * 1e6,
+                                                     sends=sock.sends - sends, recvs=sock.recvs - recvs)
+
+
+def main():
+    # CasparServer and ResponseInterpreter print every command and reply, which would swamp the timings
+    results = []
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        for workload, version, threads, commands in (("sequential", "2.0.7 Stable", 1, 2000),
+                                                     ("concurrent", "2.2.0 Stable", 8, 250)):
+            results.append(workload)
+            results.append(run("  legacy", LegacyServer, version, threads, commands))
+            results.append(run("  transport", BenchServer, version, threads, commands))
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    for line in results:
+        print line
+
+
+if __name__ == "__main__":
+    main()